@@ -0,0 +1,49 @@
+"""
+Design engine benchmark.
+
+Compiles and evaluates a variable definition over --njobs synthetic subjects
+with the commands of fairb design (write, paste, replace, grep, unique,
+is_in) and renders the job names, without touching the filesystem.
+
+    python benchmarks/design_engine.py --njobs 1000000
+"""
+
+import time
+from argparse import ArgumentParser
+
+from fairb.scripts.design import compile_plan, evaluate_plan
+from fairb.utils.templates import render_template
+
+
+def main():
+    parser = ArgumentParser(description="Design engine benchmark.")
+    parser.add_argument('--njobs', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    ids = ' '.join(f'{i:07d}' for i in range(args.njobs))
+    variable_definitions = (
+        f"id == <!write>({ids});"
+        "t1w == <!paste>(inputs/mri-raw/sub-{id}/anat/sub-{id}_T1w.nii.gz);"
+        "subject == <!variable>(t1w)<!grep>(sub-\\d+);"
+        "t2w == <!variable>(t1w)<!replace>(T1w T2w);"
+        "hemis == <!write>(lh rh lh)<!unique>;"
+        "kept == <!variable>(subject)<!is_in>(subject)"
+    )
+
+    start = time.perf_counter()
+    plan = compile_plan(variable_definitions)
+    compile_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    variables = evaluate_plan(plan, None)
+    evaluate_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    job_names = render_template('{subject}_T1w_bet', {'subject':variables['subject']})
+    render_s = time.perf_counter() - start
+
+    print(f'{args.njobs} jobs: compile {compile_s:.2f} s | evaluate {evaluate_s:.2f} s | render job names {render_s:.2f} s ({job_names.iat[-1]})')
+
+
+if __name__ == '__main__':
+    main()
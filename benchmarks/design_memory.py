@@ -0,0 +1,52 @@
+"""
+Job config generation memory benchmark.
+
+Writes the job config of a design with --njobs synthetic subjects broadcast
+against two hemispheres, chunk by chunk as `fairb design` does, and reports
+the time and peak memory allocated while generating it.
+
+    python benchmarks/design_memory.py --njobs 100000 1000000 --chunk_size 100000
+"""
+
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import pandas as pd
+
+from fairb.core import FairB
+from fairb.scripts.design import iter_job_chunks
+from fairb.utils.tables import TableWriter
+
+
+def main():
+    parser = ArgumentParser(description="Job config generation memory benchmark.")
+    parser.add_argument('--njobs', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--chunk_size', type=int, default=100_000)
+    parser.add_argument('--table_format', type=str, default='csv')
+    args = parser.parse_args()
+
+    for njobs in args.njobs:
+        with tempfile.TemporaryDirectory() as fairb_path:
+            fairb = FairB('bench', 'super_id', fairb_path, [], [], None, '/ria/input', '/ria/output', table_format=args.table_format)
+            variables = {
+                'subject':pd.Series([f'sub-{i:07d}' for i in range(njobs // 2)], dtype=object),
+                'hemi':pd.Series(['lh', 'rh'], dtype=object),
+            }
+            fairb.add_design('', 'recon {subject} {hemi}', None, None, False, None, None, None, None, 'all.q', 1, None, '24:00:00', None, job_name='{subject}_{hemi}', variables=['subject', 'hemi'])
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            with TableWriter(fairb.job_config_file) as writer:
+                for job_df in iter_job_chunks(fairb, variables, njobs, 0, '{subject}_{hemi}', chunk_size=args.chunk_size):
+                    writer.write(job_df)
+            elapsed_s = time.perf_counter() - start
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f'{njobs} jobs: {elapsed_s:.2f} s | peak {peak / 2**20:.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Import-time benchmark of the fairb CLI.
+
+Imports the CLI and each script in a fresh interpreter with `-X importtime`
+and reports the cumulative import time, then times `python -m fairb <script>
+--help` for each script, which must not import a heavy dependency either.
+Exits with an error if a heavy dependency is imported at module level or by
+--help, or if an import exceeds --max_ms (design is exempt, it needs pandas
+and numpy anyway).
+
+    python benchmarks/import_time.py --max_ms 150
+"""
+
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+MODULES = ['fairb.__main__', 'fairb.core', 'fairb.scripts.create', 'fairb.scripts.design', 'fairb.scripts.run', 'fairb.scripts.submit', 'fairb.scripts.merge', 'fairb.scripts.status', 'fairb.scripts.worker', 'fairb.scripts.convert', 'fairb.scripts.reap', 'fairb.scripts.probe', 'fairb.scripts.requeue']
+HEAVY_MODULES = ['datalad', 'pandas', 'numpy']
+# design works on dataframes all along
+ALLOWED_HEAVY_MODULES = {'fairb.scripts.design':['pandas', 'numpy']}
+
+
+def import_time(module):
+    """
+    Return the cumulative import time (in ms) of a module and the top-level packages it imports.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(result.stderr)
+
+    packages = set()
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative, name = line.removeprefix('import time:').split('|')
+        packages.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+
+    return cumulative_us / 1000, packages
+
+
+def help_time(script):
+    """
+    Return the wall time (in ms) of `python -m fairb <script> --help` and the
+    top-level packages it imports.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'fairb', script, '--help'], capture_output=True, text=True)
+    ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise Exception(result.stderr)
+
+    packages = {line.removeprefix('import time:').split('|')[2].strip().split('.')[0] for line in result.stderr.splitlines() if line.startswith('import time:') and 'cumulative' not in line}
+    return ms, packages
+
+
+def main():
+    parser = ArgumentParser(description="Import-time benchmark of the fairb CLI.")
+    parser.add_argument('--max_ms', type=float, help="Maximum cumulative import time of each module.", default=200)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        ms, packages = import_time(module)
+        heavy = [package for package in HEAVY_MODULES if package in packages and package not in ALLOWED_HEAVY_MODULES.get(module, [])]
+
+        print(f'{module:<25} {ms:8.1f} ms {" ".join(heavy)}')
+        if heavy or (ms > args.max_ms and module not in ALLOWED_HEAVY_MODULES):
+            failed = True
+
+    # --help only needs the parser of a script
+    for script in [module.removeprefix('fairb.scripts.') for module in MODULES if module.startswith('fairb.scripts.')]:
+        ms, packages = help_time(script)
+        heavy = [package for package in HEAVY_MODULES if package in packages and package not in ALLOWED_HEAVY_MODULES.get(f'fairb.scripts.{script}', [])]
+
+        print(f'{f"fairb {script} --help":<25} {ms:8.1f} ms {" ".join(heavy)}')
+        if heavy:
+            failed = True
+
+    if failed:
+        sys.exit("Import-time regression.")
+
+
+if __name__ == '__main__':
+    main()
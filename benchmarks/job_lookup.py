@@ -0,0 +1,71 @@
+"""
+Per-job config lookup benchmark.
+
+Writes a synthetic job config with --njobs rows and compares the lookup of a
+single job by reading the whole csv (as `fairb run` used to) against
+FairB.read_job through the job index.
+
+    python benchmarks/job_lookup.py --njobs 100000 1000000
+"""
+
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fairb.core import FairB
+
+
+def write_job_config(config_file, njobs):
+    "Write a job config with njobs synthetic jobs."
+    subjects = [f'sub-{i:07d}' for i in range(njobs)]
+    job_df = pd.DataFrame({
+        'job_name':[f'{subject}_T1w_bet' for subject in subjects],
+        'dl_cmd':[f'bet inputs/mri-raw/{subject}/anat/{subject}_T1w.nii.gz outputs/bet/{subject}_T1w_bet.nii.gz' for subject in subjects],
+        'inputs':[f'inputs/mri-raw/{subject}/anat/{subject}_T1w.nii.gz' for subject in subjects],
+        'outputs':[f'outputs/bet/{subject}_T1w_bet.nii.gz' for subject in subjects],
+        'queue':'all.q', 'slots':1, 'vmem':None, 'h_rt':'24:00:00', 'env_vars':None,
+        'container':'fsl-6-0-4', 'commit':None, 'is_explicit':False,
+        'output_datasets':'outputs/bet', 'prereq_get':None, 'message':None,
+        'super_id':'d1d8c034-0bd1-49b5-bb5b-d1864ce35e06', 'clone_target':'/ria/input', 'push_target':'/ria/output',
+        'ephemeral_location':'/tmp', 'req_disk_gb':1, 'batch':'0001',
+    })
+    job_df.to_csv(config_file, index=False)
+    return job_df['job_name'].to_list()
+
+
+def timed(function, *args):
+    "Return the result of a function and its duration in seconds."
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description="Per-job config lookup benchmark.")
+    parser.add_argument('--njobs', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--lookups', type=int, help="Number of random jobs to look up.", default=20)
+    args = parser.parse_args()
+
+    for njobs in args.njobs:
+        with tempfile.TemporaryDirectory() as fairb_path:
+            fairb = FairB('bench', 'super_id', fairb_path, [], [], None, '/ria/input', '/ria/output')
+            job_names = write_job_config(fairb.job_config_file, njobs)
+            lookup_names = np.random.choice(job_names, args.lookups)
+
+            def full_read(job_name):
+                return pd.read_csv(fairb.job_config_file, dtype={'batch':str}).query("job_name == @job_name").iloc[0]
+
+            _, full_read_s = timed(full_read, lookup_names[0])
+            _, index_s = timed(fairb.index_job_config)
+            lookup_s = sum(timed(fairb.read_job, job_name)[1] for job_name in lookup_names) / args.lookups
+
+            size_mb = Path(fairb.job_config_file).stat().st_size / 2**20
+            print(f'{njobs:>9} jobs ({size_mb:.0f} MB): full read {full_read_s*1000:9.1f} ms | build index {index_s*1000:9.1f} ms | indexed lookup {lookup_s*1000:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
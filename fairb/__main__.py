@@ -1,13 +1,15 @@
 import argparse
+import importlib
 import sys
-from fairb.scripts import create, design, run, submit, merge
+
+SCRIPTS = ["create", "design", "run", "submit", "merge", "status", "worker", "convert", "reap", "probe", "requeue"]
 
 def main():
     parser = argparse.ArgumentParser(
         description="CLI para ejecutar scripts en mi_paquete."
     )
     parser.add_argument(
-        "script", choices=["create", "design", "run", "submit", "merge"], help="El script a ejecutar"
+        "script", choices=SCRIPTS, help="El script a ejecutar"
     )
     parser.add_argument(
         "args", nargs=argparse.REMAINDER, help="Argumentos para el script seleccionado"
@@ -15,16 +17,9 @@ def main():
 
     args = parser.parse_args()
 
-    if args.script == "create":
-        create.main(args.args)
-    elif args.script == "design":
-        design.main(args.args)
-    elif args.script == "run":
-        run.main(args.args)
-    elif args.script == "submit":
-        submit.main(args.args)
-    elif args.script == "merge":
-        merge.main(args.args)
+    # only import the selected script, each one imports its own dependencies
+    script = importlib.import_module(f"fairb.scripts.{args.script}")
+    script.main(args.args)
 
 if __name__ == "__main__":
     main()
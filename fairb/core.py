@@ -1,6 +1,9 @@
 import json
 from pathlib import Path
-import pandas as pd
+from fairb.utils.status import STATUS_COLUMNS, OUTDATED_STATUS, current_rows, open_status_store
+from fairb.utils.job_index import StaleJobIndexError, build_job_index, read_job_record
+from fairb.utils.tables import read_table, read_table_columns, write_table
+from fairb.utils.templates import render_template
 
 class InvalidFairBError(Exception):
     """An exception for trying to init a FairB instance from an invalid json."""
@@ -26,33 +29,70 @@ class DuplicatedJobsError(InvalidJobConfigError):
     """An exception for a job config with duplicated job names."""
     pass
 
+class JobNotFoundError(KeyError):
+    """An exception for a job name that isn't in the job config file."""
+    pass
+
 class FairB():
+    # submitted jobs are waiting in the scheduler's queue until 'fairb run' marks them as dispatched
+    _UNAVAILABLE_STATUS = ['submitted', 'ongoing', 'completed']
+    # columns of a normalized job config, every other column but the job hash holds a design variable
+    _JOB_TABLE_COLUMNS = ['job_name', 'design', 'batch']
+    # hash of the rendered fields that define what a job does, used to find changed jobs
+    _JOB_HASH_COLUMN = 'job_hash'
+    _JOB_HASH_FIELDS = ['dl_cmd', 'inputs', 'outputs', 'prereq_get']
+    # job config columns rendered from design templates
+    _JOB_TEMPLATES = ['job_name', 'dl_cmd', 'inputs', 'outputs']
     _JOB_CONFIG_DICT = {'job_name':[],'dl_cmd':[],'container':[],'commit':[],'inputs':[],'outputs':[],'is_explicit':[],'output_datasets':[],'prereq_get':[],'message':[],'super_id':[],'clone_target':[],'push_target':[],'ephemeral_location':[],'req_disk_gb':[],'queue':[],'slots':[],'vmem':[],'h_rt':[],'env_vars':[],'batch':[]}
-    _JOB_STATUS_DICT = {'job_name':[],'job_id':[],'req_disk_gb':[],'host':[],'location':[],'job_dir':[],'status':[],'start':[],'update':[],'total_disk_gb':[],'traceback':[]}
+    _JOB_STATUS_DICT = {column:[] for column in STATUS_COLUMNS}
+    _JOB_STATUS_FILES = {'csv':'job_status.csv', 'sqlite':'job_status.sqlite'}
     
     
-    def __init__(self, project_name, super_id, absolute_path, input_datasets, output_datasets, container, clone_target, push_target, current_batch='0001', designs=[], job_config_file=None, job_status_file=None):
+    def __init__(self, project_name, super_id, absolute_path, input_datasets, output_datasets, container, clone_target, push_target, current_batch='0001', designs=[], job_config_file=None, job_status_file=None, status_backend='csv', mirror_location=None, table_format='csv', annex_cache_gb=None, container_location=None, read_only=False):
         """
         Create FairB instance.
+        If read_only, don't create any missing file or directory of the project.
         """
         
         self.project_name, self.super_id, self.absolute_path, self.input_datasets, self.output_datasets, self.container, self.clone_target, self.push_target, self.current_batch, self.designs = project_name, super_id, absolute_path, input_datasets, output_datasets, container, clone_target, push_target, current_batch, designs
         
         # job config
+        self.table_format = table_format
         if job_config_file is None:
-            self.job_config_file = str(Path(absolute_path) / 'job_config.csv')
+            self.job_config_file = str(Path(absolute_path) / f'job_config.{table_format}')
         else:
             self.job_config_file = job_config_file
+        self.job_index_file = str(Path(absolute_path) / 'job_config.idx')
         self.job_config_df = None
         
+        # free disk space of the ephemeral locations of each node, see fairb probe
+        self.probe_dir = str(Path(absolute_path) / 'probes')
+        
+        # node-local git mirror of the clone target (e.g. /tmp/fairb-mirror-{USER})
+        self.mirror_location = mirror_location
+        
+        # size cap of the node-local annex object cache of each ephemeral location, no cache if None
+        self.annex_cache_gb = annex_cache_gb
+        
+        # node-local directory where the first job of each node stages the container image (e.g. /tmp/fairb-containers-{USER})
+        self.container_location = container_location
+        
         # job status
+        self.status_backend = status_backend
+        self.job_status_df = None
         if job_status_file is None:
-            self.job_status_file = str(Path(absolute_path) / 'job_status.csv')
-            self._create_job_status()
+            self.job_status_file = str(Path(absolute_path) / FairB._JOB_STATUS_FILES[status_backend])
+            self.status_store = open_status_store(status_backend, self.job_status_file)
+            if not read_only:
+                self._create_job_status()
         else:
-            self.job_status_file = job_status_file
+            self.job_status_file = str(job_status_file)
+            self.status_store = open_status_store(status_backend, self.job_status_file)
             
         # lockfiles
+        if read_only:
+            self.status_lockfile, self.push_lockfile = self._lockfile_paths()
+            return None
         self.status_lockfile, self.push_lockfile = self._create_lockfiles() 
         
         # fairb directory
@@ -66,15 +106,18 @@ class FairB():
         
         
     @classmethod
-    def from_json(cls, json_path):
+    def from_json(cls, json_path, read_only=False):
         """
         Create a FairB instance from a valid json file.
+        If read_only, skip creating the project's directories and lockfiles.
         """
         
         with open(json_path, 'r') as json_file:
             json_dict = json.load(json_file)
         try:
-            return FairB(**json_dict, job_status_file=Path(json_path).parent / 'job_status.csv')
+            # an unknown status backend makes the project invalid too
+            status_file = FairB._JOB_STATUS_FILES[json_dict.get('status_backend', 'csv')]
+            return FairB(**json_dict, job_status_file=Path(json_path).parent / status_file, read_only=read_only)
         except:
             raise InvalidFairBError()
     
@@ -83,7 +126,7 @@ class FairB():
         FairB project as a dictionary.
         """
         
-        return {'project_name':self.project_name, 'super_id':self.super_id, 'absolute_path':self.absolute_path, 'input_datasets':self.input_datasets, 'output_datasets':self.output_datasets, 'container':self.container, 'clone_target':self.clone_target, 'push_target':self.push_target, 'current_batch':self.current_batch, 'designs':self.designs}
+        return {'project_name':self.project_name, 'super_id':self.super_id, 'absolute_path':self.absolute_path, 'input_datasets':self.input_datasets, 'output_datasets':self.output_datasets, 'container':self.container, 'clone_target':self.clone_target, 'push_target':self.push_target, 'current_batch':self.current_batch, 'designs':self.designs, 'status_backend':self.status_backend, 'mirror_location':self.mirror_location, 'table_format':self.table_format, 'annex_cache_gb':self.annex_cache_gb, 'container_location':self.container_location}
     
     def __str__(self):
         return str(self._dict())
@@ -101,37 +144,56 @@ class FairB():
             json.dump(self._dict(), json_file)
         return None
     
-    def add_design(self, variable_definition, dl_cmd, inputs, outputs, is_explicit, prereq_get, message, ephemeral_location, req_disk_gb, queue, slots, vmem, h_rt, env_vars):
+    def add_design(self, variable_definition, dl_cmd, inputs, outputs, is_explicit, prereq_get, message, ephemeral_location, req_disk_gb, queue, slots, vmem, h_rt, env_vars, job_name=None, variables=[], reuse=False, retry=None):
         """
         Add designs for fairb jobs.
+        Return the index of the design, which is how the job config refers to it.
+        With reuse, the index of an identical existing design is returned instead.
+        retry is the retry policy of its jobs (see fairb.utils.retry.retry_policy).
         """
-        self.designs.append({'variable_definition':variable_definition, 'dl_cmd':dl_cmd, 'inputs':inputs, 'outputs':outputs, 'is_explicit':is_explicit, 'prereq_get':prereq_get, 'message':message, 'ephemeral_location':ephemeral_location, 'req_disk_gb':req_disk_gb, 'queue':queue, 'slots':slots, 'vmem':vmem, 'h_rt':h_rt, 'env_vars':env_vars})
-        return None
+        design = {'variable_definition':variable_definition, 'dl_cmd':dl_cmd, 'inputs':inputs, 'outputs':outputs, 'is_explicit':is_explicit, 'prereq_get':prereq_get, 'message':message, 'ephemeral_location':ephemeral_location, 'req_disk_gb':req_disk_gb, 'queue':queue, 'slots':slots, 'vmem':vmem, 'h_rt':h_rt, 'env_vars':env_vars, 'job_name':job_name, 'variables':variables}
+        # designs without a retry policy compare equal to the ones written before it existed
+        if retry is not None:
+            design['retry'] = retry
+        if reuse and design in self.designs:
+            return self.designs.index(design)
+        self.designs.append(design)
+        return len(self.designs) - 1
     
     def _create_job_config(self):
         """
         Create job config file.
         """
+        import pandas as pd
         if not Path(self.job_config_file).exists():
-            pd.DataFrame(FairB._JOB_CONFIG_DICT).to_csv(self.job_config_file, index=False)
+            write_table(pd.DataFrame(FairB._JOB_CONFIG_DICT), self.job_config_file)
         return None
     
     def _create_job_status(self):
         """
         Create job status file.
         """
-        if not Path(self.job_status_file).exists():
+        import pandas as pd
+        if not self.status_store.exists():
+            self.status_store.create()
             self.job_status_df = pd.DataFrame(FairB._JOB_STATUS_DICT)
-            self.job_status_df.to_csv(self.job_status_file, index=False)
         return None
     
-    def _create_lockfiles(self):
+    def _lockfile_paths(self):
         """
-        Create lockfiles.
+        Paths of the lockfiles.
         """
         status_lockfile = (Path(self.absolute_path) / 'status_lockfile').absolute()
         push_lockfile = (Path(self.absolute_path) / 'push_lockfile').absolute()
         
+        return str(status_lockfile), str(push_lockfile)
+    
+    def _create_lockfiles(self):
+        """
+        Create lockfiles.
+        """
+        status_lockfile, push_lockfile = [Path(lockfile) for lockfile in self._lockfile_paths()]
+        
         if not status_lockfile.exists():
             status_lockfile.touch()
             
@@ -140,16 +202,38 @@ class FairB():
         
         return str(status_lockfile), str(push_lockfile)
     
-    def _is_job_config_valid(self, config_df):
-        "Is the job config file valid."
-        if not config_df.columns.isin(FairB._JOB_CONFIG_DICT.keys()).all():
+    @staticmethod
+    def _is_normalized(columns):
+        "Does a job config hold design variables instead of rendered jobs."
+        return 'design' in columns and 'dl_cmd' not in columns
+    
+    @staticmethod
+    def _job_config_dtype(columns):
+        "Column types of a job config, variables of a normalized one are always strings."
+        if FairB._is_normalized(columns):
+            return str
+        return {'batch':str}
+    
+    def _is_job_config_valid(self, config_df, columns=None):
+        "Is the job config file valid, columns are the ones of the whole file if only some were read."
+        import pandas as pd
+        if columns is None:
+            columns = config_df.columns
+        columns = pd.Index(columns)
+        if FairB._is_normalized(columns):
+            if not pd.Index(FairB._JOB_TABLE_COLUMNS).isin(columns).all():
+                raise InvalidJobConfigError()
+        elif not columns.isin(FairB._JOB_CONFIG_DICT.keys()).all():
             raise InvalidJobConfigError()
         if len(config_df) != len(config_df.drop_duplicates()):
             raise DuplicatedJobsError()
         return None
         
-    def read_job_config(self):
-        """Read and validate job config file and save to FairB instance."""
+    def read_job_config(self, columns=None):
+        """
+        Read and validate job config file and save to FairB instance.
+        If columns are given, only those columns are read.
+        """
         
         if self.job_config_file is None:
             raise JobConfigNotFoundError()
@@ -157,10 +241,171 @@ class FairB():
             raise JobConfigNotFoundError()
         
         try:
-            self.job_config_df = pd.read_csv(self.job_config_file, dtype={'batch':str})
+            file_columns = read_table_columns(self.job_config_file)
+            self.job_config_df = read_table(self.job_config_file, columns=columns, dtype=FairB._job_config_dtype(file_columns))
+        except:
+            raise InvalidJobConfigError()
+        self._is_job_config_valid(self.job_config_df, file_columns)
+        
+        return None
+    
+    def job_config_columns(self, fields):
+        """
+        Columns of the job config file needed to render the given job config
+        fields: for a normalized job config, its job table columns, plus the
+        design variables if any field is rendered from them, otherwise the
+        fields themselves.
+        """
+        
+        if not Path(self.job_config_file).exists():
+            raise JobConfigNotFoundError()
+        
+        file_columns = read_table_columns(self.job_config_file)
+        if not FairB._is_normalized(file_columns):
+            return [column for column in file_columns if column in ['job_name', 'batch'] + list(fields)]
+        if set(fields) & set(FairB._JOB_TEMPLATES) - {'job_name'}:
+            return [column for column in file_columns if column != FairB._JOB_HASH_COLUMN]
+        return list(FairB._JOB_TABLE_COLUMNS)
+    
+    def index_job_config(self):
+        """
+        Index the row offset of each job within a csv job config file.
+        Columnar job configs are read by job name directly.
+        """
+        
+        if not Path(self.job_config_file).exists():
+            raise JobConfigNotFoundError()
+        if self.table_format == 'csv':
+            build_job_index(self.job_config_file, self.job_index_file)
+        
+        return None
+    
+    def read_job(self, job_name):
+        """
+        Read the job config of a single job without loading the rest of the
+        job config file, through the job index for csv job configs.
+        Return the job config as a series with None for missing values.
+        """
+        import io
+        import pandas as pd
+        
+        if not Path(self.job_config_file).exists():
+            raise JobConfigNotFoundError()
+        
+        if self.table_format == 'csv':
+            try:
+                record = read_job_record(self.job_config_file, self.job_index_file, job_name)
+            except StaleJobIndexError:
+                self.index_job_config()
+                record = read_job_record(self.job_config_file, self.job_index_file, job_name)
+            
+            if record is None:
+                raise JobNotFoundError(job_name)
+        
+        try:
+            if self.table_format == 'csv':
+                file_columns = pd.read_csv(io.BytesIO(record), nrows=0).columns
+                job_df = pd.read_csv(io.BytesIO(record), dtype=FairB._job_config_dtype(file_columns))
+            else:
+                file_columns = read_table_columns(self.job_config_file)
+                job_df = read_table(self.job_config_file, equals={'job_name':job_name})
         except:
             raise InvalidJobConfigError()
-        self._is_job_config_valid(self.job_config_df)
+        
+        if job_df.empty:
+            raise JobNotFoundError(job_name)
+        self._is_job_config_valid(job_df, file_columns)
+        job_df = self.render_job_config(job_df)
+        
+        return job_df.astype(object).where(job_df.notna(), None).iloc[0]
+    
+    def render_job_config(self, job_df):
+        """
+        Render the full job config of the given rows of a normalized job
+        config from their designs. Templates are left as None if the rows
+        don't have the design variables (see job_config_columns). Rows of a
+        non-normalized job config are returned as they are.
+        """
+        import pandas as pd
+        
+        if not FairB._is_normalized(job_df.columns):
+            return job_df
+        
+        if self.output_datasets:
+            output_datasets = ' '.join(self.output_datasets)
+        else:
+            output_datasets = None
+        
+        rendered_dfs = []
+        for design_index, design_df in job_df.groupby(job_df['design'].astype(int), sort=False):
+            design = self.designs[design_index]
+            
+            rendered = {}
+            for template_name in FairB._JOB_TEMPLATES:
+                template = design.get(template_name)
+                if template_name == 'job_name':
+                    rendered[template_name] = design_df['job_name']
+                elif template is None or not pd.Index(design['variables']).isin(design_df.columns).all():
+                    rendered[template_name] = None
+                else:
+                    rendered[template_name] = render_template(template, design_df[design['variables']])
+            
+            rendered_dfs.append(
+                pd.DataFrame(rendered, index=design_df.index)
+                .assign(
+                    container = self.container,
+                    commit = None,
+                    is_explicit = design['is_explicit'],
+                    output_datasets = output_datasets,
+                    prereq_get = design['prereq_get'],
+                    message = design['message'],
+                    super_id = self.super_id,
+                    clone_target = self.clone_target,
+                    push_target = self.push_target,
+                    ephemeral_location = design['ephemeral_location'],
+                    req_disk_gb = design['req_disk_gb'],
+                    queue = design['queue'],
+                    slots = design['slots'],
+                    vmem = design['vmem'],
+                    h_rt = design['h_rt'],
+                    env_vars = design['env_vars'],
+                    batch = design_df['batch']
+                )
+            )
+        
+        if not rendered_dfs:
+            return pd.DataFrame(FairB._JOB_CONFIG_DICT)
+        
+        return pd.concat(rendered_dfs).loc[job_df.index, list(FairB._JOB_CONFIG_DICT.keys())]
+    
+    def job_hashes(self, job_df, ignore=()):
+        """
+        Hash the rendered fields that define what each job of a normalized
+        job config does, with the variables in 'ignore' left blank.
+        Return a series of hex digests.
+        """
+        import hashlib
+        import pandas as pd
+        
+        job_df = job_df.assign(**{variable:'' for variable in ignore if variable in job_df.columns})
+        rendered_df = self.render_job_config(job_df)[FairB._JOB_HASH_FIELDS]
+        rendered_df = rendered_df.astype(object).where(rendered_df.notna(), '')
+        
+        return pd.Series(
+            [hashlib.sha1('\x1f'.join(map(str, fields)).encode()).hexdigest()[:16] for fields in rendered_df.itertuples(index=False, name=None)],
+            index=job_df.index,
+            dtype=object
+            )
+    
+    def outdate_jobs(self, job_names):
+        """
+        Mark jobs whose config changed as outdated, so they are available
+        again while their earlier status rows are kept.
+        """
+        from datetime import datetime
+        
+        update = datetime.today().strftime("%Y/%m/%d %H:%M:%S")
+        self.status_store.insert_many([{'job_name':job_name, 'status':OUTDATED_STATUS, 'update':update} for job_name in job_names])
         
         return None
     
@@ -178,7 +423,7 @@ class FairB():
             raise JobStatusFileNotFoundError()
         
         try:
-            self.job_status_df = pd.read_csv(self.job_status_file)
+            self.job_status_df = self.status_store.read()
         except:
             raise InvalidJobStatusFileError()
         self._is_job_status_valid(self.job_status_df)
@@ -186,34 +431,57 @@ class FairB():
         return None
     
     def get_available_jobs(self):
-        """Get job names that are not completed."""
+        """Get job names that are neither submitted, ongoing nor completed."""
         
-        if self.job_status_df is None:
-            self.job_status_df = self.read_job_status()
+        if self.job_config_df is None:
+            self.read_job_config(columns=['job_name'])
         
-        not_available_jobs = self.job_status_df.query("status.isin(['ongoing', 'completed'])")['job_name'].to_list()
+        not_available_jobs = self.status_store.job_names(FairB._UNAVAILABLE_STATUS)
         available_jobs = self.job_config_df.query("not job_name.isin(@not_available_jobs)")['job_name'].to_list()
         
         return available_jobs
     
+    def is_job_available(self, job_name, submitted=False):
+        """
+        Is the job neither submitted, ongoing nor completed.
+        If submitted, a submitted job is still available, to the run of its submission.
+        """
+        
+        unavailable_status = [status for status in FairB._UNAVAILABLE_STATUS if not (submitted and status == 'submitted')]
+        job_status = current_rows(self.status_store.find(job_name=job_name))['status']
+        
+        return not job_status.isin(unavailable_status).any()
+    
     def get_completed_jobs(self):
         """
         Get job names of current batch that are completed.
         """
         
-        if self.job_status_df is None:
-            self.job_status_df = self.read_job_status()
         if self.job_config_df is None:
-            self.job_config_df = self.read_job_status()
+            self.read_job_config(columns=['job_name', 'batch'])
         
+        completed_status = self.status_store.job_names(['completed'])
         completed_jobs = (self.job_config_df
-         .merge(
-             self.job_status_df[['job_name', 'status']],
-             on='job_name'
-          )
-         .query("status == 'completed' and batch == @self.current_batch")
+         .query("job_name.isin(@completed_status) and batch == @self.current_batch")
          ['job_name']
          .to_list()
          )
         
-        return completed_jobs
\ No newline at end of file
+        return completed_jobs
+    
+    @staticmethod
+    def job_branch(job_name, job_id):
+        "Branch the results of a job run are pushed to, unique to the run so that reruns of the job don't collide."
+        return f'{job_name}-{job_id}'
+    
+    def get_completed_job_branches(self):
+        """
+        Get the branch of the latest completed run of each completed job of
+        the current batch, by job name.
+        """
+        
+        completed_jobs = self.get_completed_jobs()
+        status_df = current_rows(self.status_store.read()).query("status == 'completed' and job_name.isin(@completed_jobs)")
+        job_ids = status_df.drop_duplicates('job_name', keep='last').set_index('job_name')['job_id']
+        
+        return {job_name:FairB.job_branch(job_name, job_ids[job_name]) for job_name in completed_jobs}
@@ -0,0 +1,49 @@
+"""
+Convert the job config of a fairb project between csv, feather and parquet.
+Author: Diego Ramírez González
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from fairb.core import FairB
+from fairb.utils.tables import TABLE_FORMATS, write_table
+
+
+def main(args):
+
+    parser = ArgumentParser(
+        description="Convert the job config of a fairb project to another table format and use it from now on."
+    )
+    parser.add_argument('-c','--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+    parser.add_argument('--to', type=str, choices=TABLE_FORMATS, help="New format of the job config.", required=True)
+    parser.add_argument('--keep', action='store_true', help="Keep the job config file in the old format.")
+    args = parser.parse_args(args)
+
+    fairb_json = Path(args.fairb) / 'fairb.json'
+    fairb_project = FairB.from_json(fairb_json, read_only=True)
+
+    if args.to == fairb_project.table_format:
+        print(f"Job config is already stored as {args.to}.")
+        return None
+
+    old_job_config_file = fairb_project.job_config_file
+    new_job_config_file = str(Path(old_job_config_file).with_suffix(f'.{args.to}'))
+
+    # read the whole table with the types FairB would use
+    fairb_project.read_job_config()
+    write_table(fairb_project.job_config_df, new_job_config_file)
+
+    fairb_project.table_format = args.to
+    fairb_project.job_config_file = new_job_config_file
+    fairb_project.to_json(args.fairb)
+
+    if args.to == 'csv':
+        fairb_project.index_job_config()
+
+    if not args.keep:
+        Path(old_job_config_file).unlink()
+        if Path(fairb_project.job_index_file).exists() and args.to != 'csv':
+            Path(fairb_project.job_index_file).unlink()
+
+    print(f"Converted {old_job_config_file} to {new_job_config_file}.")
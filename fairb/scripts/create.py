@@ -4,8 +4,6 @@ from pathlib import Path
 import json
 import re
 
-import datalad.api as dl
-import pandas as pd
 from fairb.core import FairB
 
 
@@ -40,6 +38,40 @@ def main(args):
         required=False,
         default='fairb'
         )
+    parser.add_argument(
+        '--status_backend', 
+        type=str, 
+        help='Storage backend of the job status.',
+        choices=['csv', 'sqlite'],
+        required=False,
+        default='sqlite'
+        )
+    parser.add_argument(
+        '--table_format', 
+        type=str, 
+        help='Storage format of the job config (feather and parquet require pyarrow).',
+        choices=['csv', 'feather', 'parquet'],
+        required=False,
+        default='csv'
+        )
+    parser.add_argument(
+        '--mirror_location', 
+        type=str, 
+        help='Node-local directory for git mirrors of the input RIA store that job clones borrow objects from (may contain {HOST} and {USER}).',
+        required=False
+        )
+    parser.add_argument(
+        '--annex_cache_gb', 
+        type=float, 
+        help='Share the annexed inputs of the jobs on the same host through a cache of at most this many gb within their ephemeral location. No cache if not given.',
+        required=False
+        )
+    parser.add_argument(
+        '--container_location', 
+        type=str, 
+        help='Node-local directory where the container image is staged once per node and linked into the job clones (may contain {HOST} and {USER}).',
+        required=False
+        )
     
     container_args = parser.add_argument_group()
     
@@ -69,6 +101,9 @@ def main(args):
 
 
     args = parser.parse_args(args)
+    
+    import datalad.api as dl
+    
     super_dataset = args.super_dataset
     input_datasets = args.input_datasets
     output_datasets = args.output_datasets
@@ -180,7 +215,7 @@ def main(args):
     
     # Create fairb project
     fairb_path = Path(super_dataset) / '.fairb'
-    fairb_project = FairB(args.project_name, super_dataset_id, str(fairb_path.resolve()), input_datasets, output_dataset_relpaths, container_name, input_ria_path, output_ria_path)
+    fairb_project = FairB(args.project_name, super_dataset_id, str(fairb_path.resolve()), input_datasets, output_dataset_relpaths, container_name, input_ria_path, output_ria_path, status_backend=args.status_backend, mirror_location=args.mirror_location, table_format=args.table_format, annex_cache_gb=args.annex_cache_gb, container_location=args.container_location)
     fairb_project.to_json()
     
     
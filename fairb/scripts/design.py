@@ -9,13 +9,16 @@ import json
 from argparse import ArgumentParser
 from pathlib import Path
 import re
-import functools
-import operator
+from typing import NamedTuple
 
-import datalad.api as dl
 import pandas as pd
 import numpy as np
 from fairb.core import FairB
+from fairb.utils.file_index import FileIndex
+from fairb.utils.job_index import StaleJobIndexError, extend_job_index
+from fairb.utils.retry import retry_policy
+from fairb.utils.tables import TableWriter, read_table, read_table_columns, write_table
+from fairb.utils.templates import render_template
 
 def list_to_str(x):
     """
@@ -36,82 +39,60 @@ def is_numeric(x):
     except:
         return False
     
-def try_search(regex, val):
-    try:
-        return re.search(regex, val).group()
-    except:
-        return None
-        
-def get_random_seed():
-    """
-    Return a 9 digit random integer.
-    """
-    return np.random.randint(100_000_000, 999_999_999)
-
-def create_command_df(variable_commands_string):
+def get_random_seeds(n):
     """
-    Extract the commands within each variable definition. 
-    Return a dataframe where each row is a command.
+    Return n 9 digit random integers.
     """
-    
-    command_value = {'drop':1, 'glob':1,'variable':1,'paste':1,'write':1,'replace':-1, 'is_in':-1, 'not_in':-1, 'grep':-1,'unique':-1,'multiply':-1, 'repeat':-1,'exists':-1}
-    
-    command_names = re.findall(r"(?<=\<!)\w+(?=\>)", variable_commands_string)
-    commands =  re.sub(r'<!\w+>', '<!command>', variable_commands_string).split('<!command>')[1:]
-    
-    command_df = (pd.DataFrame({'command_name':command_names, 'command':commands})
-    .assign(
-        command = lambda df_: 
-            df_['command'].str.strip().str.replace(r'(^\(|\)$)', '', regex=True),
-        command_value = lambda df_: df_['command_name'].map(command_value)
-    )
-    )
+    return pd.Series(np.random.randint(100_000_000, 999_999_999, size=n))
 
-    assert command_df['command_name'].isin(command_value.keys()).all(), "Used an invalid command within a variable definition."
+VARIABLE_NAME_REGEX = re.compile(r'[a-z,A-Z,0-9,\-,_,]+')
+GLOB_REGEX = re.compile(r'[a-z,A-Z,0-9,\\,\/,\-,_,\.,\*,\[,\],\:,\+,\?,\!,\s]+')
+PASTE_VARIABLE_REGEX = re.compile(r'(?<=\{)[\w,_,-]+(?=\})')
+REPLACE_VARIABLE_REGEX = re.compile(r"(?<={)\w+(?=})")
+TABLE_FILTER_REGEX = re.compile(r'^([\w\-\.]+)(==|!=|>=|<=|>|<)(.*)$')
+TABLE_KEY_REGEX = re.compile(r'^by=([\w\-\.]+):([\w\-]+)$')
 
-    assert command_df['command_value'].is_monotonic_decreasing, "'drop', 'glob', 'variable', 'paste', and 'write' have to be the first action within each variable definition."
 
-    assert command_df['command_value'].iat[0] >= 0, "Can't start variable definition with 'grep', 'unique', 'multiply', 'repeat' or 'exists'."
-
-    assert command_df['command_value'].sum() < 2, "You can't use both 'drop', 'glob' and 'variable' within the same variable definition."
-    
-    if command_df['command_name'].iat[0] == 'drop':
-        assert command_df['command_value'].shape[0] == 1, "You can't use commands after 'drop'."
-    
-    return command_df
+def _variable_name(cmd, command_name):
+    """
+    Return the variable name called within a command.
+    """
+    try:
+        return VARIABLE_NAME_REGEX.search(cmd.strip()).group()
+    except:
+        raise Exception(f"Within '{command_name}', tried to call a variable with an invalid variable name.")
 
 
-def call_glob(cmd, super_dataset_path):
+def call_glob(cmd, super_dataset_path, file_index=None):
     """
-    Return an ordered list of glob results relative to super dataset.
+    Return an ordered series of glob results relative to super dataset.
+    With a file index, the globs are matched in memory instead of on the file system.
     """
     
-    glob_characters = r'[a-z,A-Z,0-9,\\,\/,\-,_,\.,\*,\[,\],\:,\+,\?,\!,\s]'
-    assert super_dataset_path, "No known super dataset for globbing."
+    assert super_dataset_path or file_index, "No known super dataset for globbing."
     
     try:
-        globbing_list = re.search(f"{glob_characters}+", cmd).group().split()
+        globbing_list = GLOB_REGEX.search(cmd).group().split()
     
-        values = sorted(
-            [str(path.relative_to(super_dataset_path)) 
-            for globbing in globbing_list
-            for path in Path(super_dataset_path).glob(globbing)]
-            )
+        if file_index is not None:
+            values = sorted(path for globbing in globbing_list for path in file_index.glob(globbing))
+        else:
+            values = sorted(
+                [str(path.relative_to(super_dataset_path)) 
+                for globbing in globbing_list
+                for path in Path(super_dataset_path).glob(globbing)]
+                )
     except:
         raise Exception('Not a valid globbing pattern.')
     
-    return values
+    return pd.Series(values, dtype=object)
 
 
 def call_variable(cmd, variables):
     """
     Get the values from an existing variable.
     """
-    variable_characters = r'[a-z,A-Z,0-9,\-,_,]'
-    try:
-        variable_name = re.search(f"{variable_characters}+", cmd).group()
-    except:
-        raise Exception("Tried to call a variable with an invalid variable name.")
+    variable_name = _variable_name(cmd, 'variable')
     
     try:
         values = variables[variable_name]
@@ -124,58 +105,59 @@ def call_variable(cmd, variables):
 def call_paste(cmd, variables):
     """
     Paste existing variables within text.
-    Returns a list of values.
+    Returns a series of values.
     """
     
-    paste_variables = list(set(re.findall(r'(?<=\{)[\w,_,-]+(?=\})', cmd)))
+    paste_variables = list(set(PASTE_VARIABLE_REGEX.findall(cmd)))
     
-    assert pd.Series(paste_variables).isin(variables.keys()).all(), "Not all variables in 'paste' exist."
+    # a paste without variables is a single literal value
+    if not paste_variables:
+        return pd.Series([cmd], dtype=object)
     
-    values = []
-    for row in pd.DataFrame(variables)[paste_variables].to_dict(orient='records'):
-        values.append(cmd.format(**row))
+    assert pd.Series(paste_variables).isin(variables.keys()).all(), "Not all variables in 'paste' exist."
+    assert len({len(variables[variable]) for variable in paste_variables}) <= 1, "Variables in 'paste' must have the same length."
     
-    return values
+    return render_template(cmd, {variable:variables[variable] for variable in paste_variables})
 
 def call_write(cmd):
     """
-    Return a list of space-separeted values from a string.
+    Return a series of space-separeted values from a string.
     """
-    return cmd.split()
+    return pd.Series(cmd.split(), dtype=object)
 
 
 def call_replace(cmd, values, variables):
     """
     Replace a string pattern from existing values. 
     Can call existing variables within 'cmd' using double curly brackets.
-    Returns a list of values.
+    Returns a series of values.
     """
     
     
     n_spaces = len([character for character in cmd if character == ' '])
     assert n_spaces == 1, "Didn't find exactly one space within 'replace'. Command should be:('to_be_replaced' 'replacement')."
     
-    string_detect = cmd.split()[0]
+    string_detect = re.compile(cmd.split()[0])
     string_replace = cmd.split()[1]            
     
-    new_values = []
-    for value in values:
-        new_values.append(
-            re.sub(string_detect, string_replace, value).replace('{{' , '{').replace('}}', '}')
-            )
-        
-    values = new_values
+    values = (values
+        .str.replace(string_detect, string_replace, regex=True)
+        .str.replace('{{', '{', regex=False)
+        .str.replace('}}', '}', regex=False)
+        )
         
-    replacement_variables = re.findall(r"(?<={)\w+(?=})", '{subject}')
+    replacement_variables = REPLACE_VARIABLE_REGEX.findall(string_replace.replace('{{' , '{').replace('}}', '}'))
     if replacement_variables:
         if not pd.Series(replacement_variables).isin(variables.keys()).all():
             raise Exception("Not all variables inside <!replace> exist.")
         
-        new_values = []
-        for value, row_dict in zip(values, pd.DataFrame(variables).to_dict(orient='records')):
-            new_values.append(value.format(**row_dict))
-            
-        values = new_values
+        # the replaced text differs on each value, so fill in each variable column by column
+        for variable in set(replacement_variables):
+            values = pd.Series(
+                [None if value is None or pd.isna(value) else value.replace(f'{{{variable}}}', str(variable_value))
+                 for value, variable_value in zip(values, variables[variable])],
+                dtype=object
+                )
         
     return values
 
@@ -191,110 +173,147 @@ def call_grep(cmd, values):
     """
     Return a string pattern from existing values using regular expressions.
     """
-    values = [try_search(cmd, value) for value in values]
-    assert not all(value is None for value in values), "Not a valid regex or no matches."
+    pattern = re.compile(cmd)
+    values = values.str.extract(f'({pattern.pattern})', expand=True)[0]
+    assert values.notna().any(), "Not a valid regex or no matches."
 
-    return values
+    return values.astype(object).where(values.notna(), None)
 
 
-def call_repeat(cmd, values, variables):
-    "Repeat existing values."
-    if isinstance(values, str):
-        values = values.split()
+def _n_elements(cmd, variables, command_name):
+    """
+    Number of elements given as a number or as the length of a variable.
+    """
     if is_numeric(cmd):
-        n_elements = int(cmd)
-    else:
-        assert cmd in variables.keys(), "Tried to repeat by the length of a variable that doesn't exist."
-        n_elements = len(variables[cmd])    
-           
-    values = [[value]*n_elements for value in values]
-    values = functools.reduce(operator.iconcat, values, [])
+        return int(cmd)
+    assert cmd in variables.keys(), f"Tried to {command_name} by the length of a variable that doesn't exist."
+    return len(variables[cmd])
+
+
+def call_repeat(cmd, values, variables):
+    "Repeat each existing value."
+    n_elements = _n_elements(cmd, variables, 'repeat')
     
-    return values
+    return values.repeat(n_elements).reset_index(drop=True)
 
 
 def call_is_in(cmd, values, variables):
     """
     Return values in common between two existing variables.
     """
-    variable = cmd.strip()
+    variable = _variable_name(cmd, 'is_in')
     
-    variable_characters = r'[a-z,A-Z,0-9,\-,_,]'
     try:
-        variable = re.search(f"{variable_characters}+", variable).group()
-    except:
-        raise Exception("Within 'is_in', tried to call a variable with an invalid variable name.")
-    
-    try:
-        variable = pd.Series(variables[variable])
-        values = pd.Series(values)
+        variable = variables[variable]
     except:
         raise Exception("Within 'is_in', tried to call a variable that doesn't exist.")
     
-    return values[values.isin(variable)].to_list()
+    return values[values.isin(variable)].reset_index(drop=True)
 
 
 def call_not_in(cmd, values, variables):
     """
     Return values not in common between two existing variables.
     """
-    variable = cmd.strip()
-    
-    variable_characters = r'[a-z,A-Z,0-9,\-,_,]'
-    try:
-        variable = re.search(f"{variable_characters}+", variable).group()
-    except:
-        raise Exception("Within 'not_in', tried to call a variable with an invalid variable name.")
+    variable = _variable_name(cmd, 'not_in')
     
     try:
-        variable = pd.Series(variables[variable])
-        values = pd.Series(values)
+        variable = variables[variable]
     except:
         raise Exception("Within 'not_in', tried to call a variable that doesn't exist.")
     
-    return values[~values.isin(variable)].to_list()
+    return values[~values.isin(variable)].reset_index(drop=True)
     
 
 def call_multiply(cmd, values, variables):
     "Multiply existing values."
-    if isinstance(values, str):
-        values = values.split()
-    if is_numeric(cmd):
-        n_elements = int(cmd)
-    else:
-        assert cmd in variables.keys(), "Tried to multiply by the length of a variable that doesn't exist."
-        n_elements = len(variables[cmd])    
-           
-    values = values*n_elements 
+    n_elements = _n_elements(cmd, variables, 'multiply')
     
-    return values
+    return pd.concat([values] * n_elements, ignore_index=True)
 
     
 def call_unique(values):
     """
     Remove duplicated values, keep the first one and maintain the same order. 
     """
-    return pd.Series(['pcc', 'acc', 'pcc']).drop_duplicates(keep='first').to_list()
+    return values.drop_duplicates(keep='first').reset_index(drop=True)
     
 
-def call_exists(values, super_dataset_path):
+def call_exists(values, super_dataset_path, file_index=None):
+    """
+    Keep the values that are paths within the super dataset (including
+    broken symlinks of annexed files), the rest become None.
     """
+    assert super_dataset_path or file_index, "No known super dataset for globbing." 
+    
+    # object values, since string series would hold missing values as NaN
+    values = values.astype(object)
+    if file_index is not None:
+        return values.where([value is not None and file_index.exists(value) for value in values], None)
     
+    super_dataset_path = Path(super_dataset_path)
+    exists = [
+        value is not None and ((super_dataset_path / str(value)).is_symlink() or (super_dataset_path / str(value)).exists())
+        for value in values
+        ]
+    
+    return values.where(exists, None)
+    
+
+def _table_arguments(cmd):
     """
-    assert super_dataset_path, "No known super dataset for globbing." 
-    new_values = []
-    for value in values:
-        if (super_dataset_path / str(value)).is_symlink() or (super_dataset_path / str(value)).exists():
-            new_values.append(value)
+    Split the argument of 'table' into the table path, the column to read,
+    the row filters and the key column and variable to align the values by.
+    """
+    arguments = cmd.split()
+    assert len(arguments) >= 2, "'table' needs a table path and a column."
+    
+    table_path, column = arguments[:2]
+    filters, key = [], None
+    for argument in arguments[2:]:
+        if TABLE_KEY_REGEX.match(argument):
+            key = TABLE_KEY_REGEX.match(argument).groups()
+        elif TABLE_FILTER_REGEX.match(argument):
+            filters.append(TABLE_FILTER_REGEX.match(argument).groups())
         else:
-            new_values.append(None)
+            raise Exception(f"Within 'table', not a valid filter or key: '{argument}'.")
+    
+    return table_path, column, filters, key
+
+
+def call_table(cmd, super_dataset_path, variables):
+    """
+    Return the values of a column of a csv, tsv, feather or parquet table,
+    only reading that column and the rows passing the filters. With a key,
+    the values are aligned to a variable by matching it with the key
+    column, and values without a matching row become None.
+    """
+    table_path, column, filters, key = _table_arguments(cmd)
+    if super_dataset_path is not None:
+        table_path = Path(super_dataset_path) / table_path
     
-    values = new_values
+    columns = [column] if key is None else list(dict.fromkeys([key[0], column]))
+    try:
+        table_df = read_table(table_path, columns=columns, dtype=str, filters=filters)
+    except Exception as error:
+        raise Exception(f"Within 'table', couldn't read '{column}' from {table_path}: {error}")
     
-    return values
+    # values are strings, as those of every other command
+    values = table_df[column].astype(str).astype(object).where(table_df[column].notna(), None)
+    
+    if key is None:
+        return values.dropna().reset_index(drop=True)
     
+    key_column, variable_name = key
+    assert variable_name in variables, f"Within 'table', tried to call a variable that doesn't exist: '{variable_name}'."
+    keys = table_df[key_column].astype(str).astype(object).where(table_df[key_column].notna(), None)
+    assert not keys.dropna().duplicated().any(), f"Within 'table', the key column '{key_column}' has duplicated values."
+    
+    values = variables[variable_name].map(pd.Series(values.to_numpy(), index=keys.to_numpy()).dropna())
+    return values.astype(object).where(values.notna(), None).reset_index(drop=True)
+
 
-def select_command(command_name, command, values=None, variables=None, super_dataset_path=None):
+def select_command(command_name, command, values=None, variables=None, super_dataset_path=None, file_index=None):
     """
     Select one of the possible 9 commands and return the values.
     """
@@ -304,7 +323,10 @@ def select_command(command_name, command, values=None, variables=None, super_dat
             return call_drop()
         
         case 'glob':
-            return call_glob(command, super_dataset_path)
+            return call_glob(command, super_dataset_path, file_index)
+
+        case 'table':
+            return call_table(command, super_dataset_path, variables)
 
         case 'write':
             return call_write(command)
@@ -314,46 +336,341 @@ def select_command(command_name, command, values=None, variables=None, super_dat
             return call_variable(command, variables)
         
         case 'paste':
-            assert variables, "Can't use 'paste' if no variable has been defined."
+            assert variables or not PASTE_VARIABLE_REGEX.search(command), "Can't use 'paste' if no variable has been defined."
             return call_paste(command, variables)
         
         # non-first commands    
         case 'replace':
-            assert values, "Can't use 'replace' without existing values."
+            assert values is not None and len(values) > 0, "Can't use 'replace' without existing values."
             return call_replace(command, values, variables)
         
         case 'grep':
-            assert values, "Can't use 'grep' without existing values."
+            assert values is not None and len(values) > 0, "Can't use 'grep' without existing values."
             return call_grep(command, values)
         
         case 'is_in':
-            assert values, "Can't use 'is_in' without existing values."
-            return call_is_in(command, values)
+            assert values is not None and len(values) > 0, "Can't use 'is_in' without existing values."
+            return call_is_in(command, values, variables)
         
         case 'not_in':
-            assert values, "Can't use 'not_in' without existing values."
-            return call_not_in(command, values)
+            assert values is not None and len(values) > 0, "Can't use 'not_in' without existing values."
+            return call_not_in(command, values, variables)
         
         case 'multiply':
-            assert values, "Can't use 'multiply' without existing values."
-            return call_multiply(command, values)
+            assert values is not None and len(values) > 0, "Can't use 'multiply' without existing values."
+            return call_multiply(command, values, variables)
         
         case 'repeat':
-            assert values, "Can't use 'repeat' without existing values."
-            return call_repeat(command, values)
+            assert values is not None and len(values) > 0, "Can't use 'repeat' without existing values."
+            return call_repeat(command, values, variables)
         
         case 'unique':
-            assert values, "Can't use 'unique' without existing values."
+            assert values is not None and len(values) > 0, "Can't use 'unique' without existing values."
             return call_unique(values)
         
         case 'exists':
-            assert values, "Can't use 'exists' without existing values."
-            return call_exists(values)
+            assert values is not None and len(values) > 0, "Can't use 'exists' without existing values."
+            return call_exists(values, super_dataset_path, file_index)
             
         case _:
             raise Exception("Non-existing command selected.")
             
 
+###########################
+# Variable definition plans
+###########################
+
+FIRST_COMMANDS = ['drop', 'glob', 'table', 'variable', 'paste', 'write']
+NON_FIRST_COMMANDS = ['replace', 'is_in', 'not_in', 'grep', 'unique', 'multiply', 'repeat', 'exists']
+COMMAND_NAME_REGEX = re.compile(r"(?<=\<!)\w+(?=\>)")
+COMMAND_REGEX = re.compile(r'<!\w+>')
+COMMAND_PARENTHESES_REGEX = re.compile(r'(^\(|\)$)')
+# version of the cached plans, bumped whenever Plan or its commands change
+PLAN_FORMAT = 1
+
+
+class Command(NamedTuple):
+    "A command of a variable definition and its argument."
+    name: str
+    argument: str
+
+
+class VariablePlan(NamedTuple):
+    """
+    A compiled variable definition. dependencies are the indices of the
+    definitions whose values its commands read.
+    """
+    index: int
+    name: str
+    commands: list
+    dependencies: list
+
+
+class Plan(NamedTuple):
+    """
+    A compiled variable definition string. outputs are the indices of the
+    definitions that hold the final value of each variable, in the order the
+    variables of a design are kept.
+    """
+    definition: str
+    variables: list
+    outputs: list
+
+
+def parse_commands(variable_commands_string):
+    """
+    Extract the commands within a variable definition and validate their order.
+    Return a list of commands.
+    """
+    
+    command_names = COMMAND_NAME_REGEX.findall(variable_commands_string)
+    arguments = COMMAND_REGEX.sub('<!command>', variable_commands_string).split('<!command>')[1:]
+    commands = [Command(name, COMMAND_PARENTHESES_REGEX.sub('', argument.strip())) for name, argument in zip(command_names, arguments)]
+    
+    assert commands, "No command within a variable definition."
+    
+    assert all(command.name in FIRST_COMMANDS + NON_FIRST_COMMANDS for command in commands), "Used an invalid command within a variable definition."
+    
+    assert commands[0].name in FIRST_COMMANDS, "Can't start variable definition with 'grep', 'unique', 'multiply', 'repeat' or 'exists'."
+    
+    assert all(command.name in NON_FIRST_COMMANDS for command in commands[1:]), "'drop', 'glob', 'table', 'variable', 'paste', and 'write' have to be the first action within each variable definition."
+    
+    if commands[0].name == 'drop':
+        assert len(commands) == 1, "You can't use commands after 'drop'."
+    
+    return commands
+
+
+def command_variables(command):
+    """
+    Return the names of the variables a command reads.
+    """
+    match command.name:
+        case 'variable' | 'is_in' | 'not_in':
+            return [_variable_name(command.argument, command.name)]
+        case 'paste':
+            return list(dict.fromkeys(PASTE_VARIABLE_REGEX.findall(command.argument)))
+        case 'replace':
+            replacement = command.argument.split()[-1].replace('{{', '{').replace('}}', '}')
+            return list(dict.fromkeys(REPLACE_VARIABLE_REGEX.findall(replacement)))
+        case 'table':
+            key = _table_arguments(command.argument)[3]
+            return [] if key is None else [key[1]]
+        case 'multiply' | 'repeat':
+            return [] if is_numeric(command.argument) else [command.argument]
+        case _:
+            return []
+
+
+def compile_plan(definition):
+    """
+    Compile a variable definition string into a plan.
+    Every variable a command reads is resolved to the latest definition of
+    that variable before it, so errors are raised before evaluating anything.
+    """
+    variables = []
+    # variable name -> index of its current definition, in the order of the design's variables
+    current = {}
+    
+    for index, variable_definition in enumerate(definition.split(';')):
+        assert '==' in variable_definition, f"Variable definition without '==': {variable_definition.strip()}"
+        variable_name = variable_definition.split('==', 1)[0].strip()
+        commands = parse_commands(variable_definition.split('==', 1)[1].strip())
+        
+        dependencies = []
+        for command in commands:
+            for dependency in command_variables(command):
+                if dependency not in current:
+                    raise Exception(f"Within '{command.name}' of '{variable_name}', tried to call a variable that doesn't exist: '{dependency}'.")
+                dependencies.append(current[dependency])
+        
+        variables.append(VariablePlan(index, variable_name, commands, list(dict.fromkeys(dependencies))))
+        
+        if commands[0].name == 'drop':
+            current.pop(variable_name, None)
+        else:
+            # a redefinition keeps the position of the variable
+            current[variable_name] = index
+    
+    return Plan(definition, variables, list(current.values()))
+
+
+def load_plan(definition, cache_dir=None):
+    """
+    Return the compiled plan of a variable definition string, cached on disk
+    within cache_dir and keyed by the plan format and the definition text.
+    """
+    import hashlib
+    
+    if cache_dir is None:
+        return compile_plan(definition)
+    
+    cache_file = Path(cache_dir) / f'{hashlib.sha256(f"{PLAN_FORMAT}:{definition}".encode()).hexdigest()}.json'
+    if cache_file.exists():
+        with open(cache_file, 'r') as plan_file:
+            plan_dict = json.load(plan_file)
+        if plan_dict.get('format') == PLAN_FORMAT and plan_dict['definition'] == definition:
+            return Plan(
+                plan_dict['definition'],
+                [VariablePlan(index, name, [Command(*command) for command in commands], dependencies) for index, name, commands, dependencies in plan_dict['variables']],
+                plan_dict['outputs']
+                )
+    
+    plan = compile_plan(definition)
+    
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(cache_file, 'w') as plan_file:
+        json.dump({'format':PLAN_FORMAT, **plan._asdict()}, plan_file)
+    
+    return plan
+
+
+def evaluate_variable(variable_plan, dependency_values, super_dataset_path, file_index=None):
+    """
+    Run the commands of a variable definition given the values of its dependencies.
+    """
+    values = None
+    for command in variable_plan.commands:
+        values = select_command(
+            command.name,
+            command.argument,
+            values,
+            dependency_values,
+            super_dataset_path,
+            file_index
+            )
+    return values
+
+
+def evaluate_plan(plan, super_dataset_path, max_workers=4, file_index=None):
+    """
+    Evaluate a plan in dependency order, running independent definitions
+    concurrently and skipping the ones no final variable depends on.
+    Return a dictionary of the final variables and their values.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    
+    # definitions needed for the final variables
+    needed = set()
+    pending = list(plan.outputs)
+    while pending:
+        index = pending.pop()
+        if index not in needed:
+            needed.add(index)
+            pending += plan.variables[index].dependencies
+    
+    results = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(results) < len(needed):
+            for index in sorted(needed):
+                variable_plan = plan.variables[index]
+                if index in results or index in running:
+                    continue
+                if not all(dependency in results for dependency in variable_plan.dependencies):
+                    continue
+                dependency_values = {plan.variables[dependency].name:results[dependency] for dependency in variable_plan.dependencies}
+                running[index] = executor.submit(evaluate_variable, variable_plan, dependency_values, super_dataset_path, file_index)
+            
+            done, _not_done = wait(running.values(), return_when=FIRST_COMPLETED)
+            for index, future in list(running.items()):
+                if future in done:
+                    results[index] = future.result()
+                    del running[index]
+    
+    return {plan.variables[index].name:results[index] for index in plan.outputs}
+
+
+def iter_job_chunks(fairb, variables, n_jobs, design_index, job_name, random_seed=False, chunk_size=100_000, job_hashes=False):
+    """
+    Yield the job config rows of a design in chunks of up to chunk_size jobs.
+    Each chunk picks its values by position from the variables, as if every
+    variable was repeated up to n_jobs values, so only one chunk is ever held
+    in memory. Jobs with a missing value are left out, so a variable without
+    any value gives no jobs.
+    If job_hashes, add the job hash of each job, to compare them with an
+    existing job config.
+    """
+    if any(len(values) == 0 for values in variables.values()):
+        n_jobs = 0
+    # always yield a chunk, so an empty design still writes the table columns
+    for start in range(0, max(n_jobs, 1), chunk_size):
+        positions = np.arange(start, min(start + chunk_size, n_jobs))
+        variable_df = pd.DataFrame(
+            {variable_name:values.to_numpy()[positions % len(values)] for variable_name, values in variables.items()},
+            index=positions
+            )
+        if random_seed:
+            variable_df['random_seed'] = get_random_seeds(len(positions)).to_numpy()
+        variable_df = variable_df.dropna()
+        
+        job_df = (variable_df
+            .assign(
+                job_name = render_template(job_name, variable_df),
+                design = design_index,
+                batch = fairb.current_batch
+            )
+            [FairB._JOB_TABLE_COLUMNS + list(variable_df.columns)]
+        )
+        if job_hashes:
+            # random seeds are drawn again on every design, so they don't make a job change
+            job_df[FairB._JOB_HASH_COLUMN] = fairb.job_hashes(job_df, ignore=['random_seed'])
+        
+        yield job_df
+
+
+def update_job_config(fairb, job_df):
+    """
+    Add the new jobs of a design to an existing job config and replace the
+    changed ones, compared by job name and job hash. Changed jobs are marked
+    as outdated so they run again, the rest of the rows and the job status
+    are kept as they are.
+    """
+    file_columns = read_table_columns(fairb.job_config_file)
+    assert FairB._is_normalized(file_columns), "Can't add jobs to a job config created by an older fairb version, create it again without --incremental."
+    
+    if FairB._JOB_HASH_COLUMN in file_columns:
+        fairb.read_job_config(columns=['job_name', FairB._JOB_HASH_COLUMN])
+        existing_hashes = fairb.job_config_df.set_index('job_name')[FairB._JOB_HASH_COLUMN]
+    else:
+        fairb.read_job_config()
+        existing_hashes = fairb.job_hashes(fairb.job_config_df, ignore=['random_seed'])
+        existing_hashes.index = fairb.job_config_df['job_name']
+    
+    is_existing = job_df['job_name'].isin(existing_hashes.index)
+    is_changed = is_existing & (job_df['job_name'].map(existing_hashes) != job_df[FairB._JOB_HASH_COLUMN])
+    new_df = job_df[~is_existing]
+    changed_df = job_df[is_changed]
+    
+    print(f"{len(new_df)} new jobs, {len(changed_df)} changed jobs and {int(is_existing.sum()) - len(changed_df)} unchanged jobs.")
+    if new_df.empty and changed_df.empty:
+        return None
+    
+    if changed_df.empty and fairb.table_format == 'csv' and set(new_df.columns) <= set(file_columns):
+        # only append the new rows and index them
+        offset = Path(fairb.job_config_file).stat().st_size
+        new_df.reindex(columns=file_columns).to_csv(fairb.job_config_file, mode='a', header=False, index=False)
+        try:
+            extend_job_index(fairb.job_config_file, fairb.job_index_file, offset)
+        except StaleJobIndexError:
+            fairb.index_job_config()
+    else:
+        fairb.read_job_config()
+        config_df = fairb.job_config_df
+        if FairB._JOB_HASH_COLUMN not in config_df.columns:
+            config_df[FairB._JOB_HASH_COLUMN] = existing_hashes.to_numpy()
+        config_df = pd.concat([config_df[~config_df['job_name'].isin(changed_df['job_name'])], changed_df, new_df], ignore_index=True)
+        write_table(config_df, fairb.job_config_file)
+        fairb.index_job_config()
+    
+    if not changed_df.empty and fairb.status_store.exists():
+        fairb.outdate_jobs(changed_df['job_name'].to_list())
+    
+    fairb.to_json()
+    
+    return None
+
+
 def main(args):
     
     # arguments
@@ -416,6 +733,22 @@ def main(args):
         help="placeholder",
         required=False
     )
+    misc.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep the existing jobs, add the new ones and run the changed ones again instead of replacing the job config."
+    )
+    misc.add_argument(
+        "--chunk_size",
+        type=int,
+        default=100_000,
+        help="Number of jobs rendered and written at a time."
+    )
+    misc.add_argument(
+        "--live_files",
+        action="store_true",
+        help="Glob and check paths on the file system instead of the committed files of the datasets."
+    )
     
     job_resources.add_argument(
         "--req_disk_gb",
@@ -472,6 +805,28 @@ def main(args):
         help="placeholder"
     )
     
+    retry = parser.add_argument_group()
+    retry.add_argument(
+        "--max_attempts",
+        type=int,
+        help="Run each job up to this many times when it fails with one of --retry_on (see fairb requeue). No retries if not given."
+    )
+    retry.add_argument(
+        "--retry_on",
+        nargs="+",
+        help="Failures that are retried: no-space, lost, an exception type name (e.g. CommandError) or error for any exception. Defaults to no-space and lost."
+    )
+    retry.add_argument(
+        "--retry_backoff",
+        type=float,
+        help="Seconds to wait before the first retry, multiplied by --retry_backoff_factor on every retry. Defaults to 300."
+    )
+    retry.add_argument(
+        "--retry_backoff_factor",
+        type=float,
+        help="Growth of the wait between retries. Defaults to 2."
+    )
+    
     args = parser.parse_args(args)
     
     # assertions
@@ -488,60 +843,18 @@ def main(args):
     # variable_definition_string = "svs == <!glob>(inputs/mri-raw/sub-*/mrs/*acq-press*svs.nii.gz) ; subject == <!variable>(svs)<!grep>(sub-\w+); t1w == <!paste> (inputs/mri-raw/{subject}/anat/{subject}_T1w.nii.gz) ; t2w == <!variable>(t1w)<!replace>(T1w T2w)<!exists> ; ref == <!variable>(svs)<!replace>(svs(?=.nii.gz) ref)<!exists> "
     # variable_definition_string = "voi == <!write>(acc pcc)<!multiply>5"
 
-    # Create a tuple of variable-commands
-    
-    variable_command = []
-
-    for index, variable_definition in enumerate(args.variables.split(';')):
-        variable_name = variable_definition.split('==')[0].strip()
-        variable_commands_string = variable_definition.split('==')[1].strip()
-        command_df = create_command_df(variable_commands_string)
-        variable_command.append((index, variable_name, command_df))
-
-
-    # Create a dictionary of variable-values
-    variables = {}
-    len_dict = {}
-    max_len=0
-
-    for index, variable_name, command_df in variable_command:
-        values = []
-        for command_row in command_df.itertuples():
-            values = select_command(
-                command_row.command_name,
-                command_row.command,
-                values,
-                variables,
-                super_dataset_path
-                )
-        
-        # Drop variable if it's None and skip next steps
-        if values is None: 
-            try:
-                del variables[variable_name]
-                del len_dict[variable_name]
-            except:
-                pass
-            
-            continue
-            
-        variables[variable_name] = values
-        len_dict[variable_name] = len(values)
-
+    # Compile the variable definitions and evaluate them
+    plan = load_plan(args.variables, fairb_root / 'plans')
+    # glob and exists are answered from the git trees of the super dataset and its installed subdatasets
+    file_index = None if args.live_files else FileIndex(super_dataset_path, fairb_root / 'file_index')
+    variables = evaluate_plan(plan, super_dataset_path, file_index=file_index)
+    len_dict = {variable_name:len(values) for variable_name, values in variables.items()}
 
     # Calculate the max length of each variable for broadcasting. 
-    for variable_name, len_of_values in len_dict.items():
-        if len_of_values > max_len:
-            max_len = len_of_values
-            max_len_variable = variable_name
-
-    # Broadcast variables.
-    if np.all(max_len % np.array(list(len_dict.values())) == 0):
-        for key, value_list in variables.items():
-            if key == max_len_variable:
-                continue
-            variables[key] = value_list * int(max_len / len(value_list))
-    else:
+    max_len = max(len_dict.values(), default=0)
+
+    # Variables are broadcast by repeating them up to the length of the longest one.
+    if not np.all(max_len % np.array(list(len_dict.values())) == 0):
         raise Exception("Can't broadcast variables.")
     
     # example:
@@ -549,64 +862,52 @@ def main(args):
     # inputs = "inputs/mri_raw/{subject}/anat/{subject}_T1w.nii.gz"
     # outputs = "outputs/bet/{subject}_T1w_bet.nii.gz"
     # job_name = "{subject}_T1w_bet"
-    job_dict = {'job_name':[], 'dl_cmd':[], 'inputs':[], 'outputs':[], 
-                # 'input_datasets':[], 
-                'output_datasets':[]}
-
-    if ("<!random>" in args.dl_cmd):
-        random_seeds=[]
-        for i in range(max_len):
-            random_seeds.append(get_random_seed())
-        
+    random_seed = "<!random>" in args.dl_cmd
+    if random_seed:
         args.dl_cmd = re.sub("<!random>", "{random_seed}", args.dl_cmd)
-        variables['random_seed'] = random_seeds
-
-    for row_dict in pd.DataFrame(variables).dropna().to_dict(orient='records'):
-        
-        job_dict['job_name'].append(args.job_name.format(**row_dict))
-        job_dict['dl_cmd'].append(args.dl_cmd.format(**row_dict))
-        
-        job_inputs = args.inputs.format(**row_dict)
-        job_outputs = args.outputs.format(**row_dict)
-        job_dict['inputs'].append(job_inputs)
-        job_dict['outputs'].append(job_outputs)
-        
-        job_output_datasets = list_to_str([output_dataset for output_dataset in fairb.output_datasets if output_dataset in job_outputs])
-        # job_input_datasets = list_to_str([input_dataset for input_dataset in fairb.input_datasets if input_dataset in job_inputs])
-        job_dict['output_datasets'].append(job_output_datasets)
-        # job_dict['input_datasets'].append(job_input_datasets)
-        
-    job_df = pd.DataFrame(job_dict)
-    job_df['queue'] = args.queue
-    job_df['slots'] = args.slots 
-    job_df['vmem'] = args.vmem 
-    job_df['h_rt'] = args.h_rt 
-    job_df['env_vars'] = args.env_vars 
-    
-    job_df['container'] = fairb.container
-    job_df['commit'] = None
-    job_df['is_explicit'] = args.is_explicit
-    
-    if fairb.output_datasets:
-        job_output_datasets_string = ''
-        for output_dataset in fairb.output_datasets:
-            job_output_datasets_string += f'{output_dataset} '
-        job_df['output_datasets'] = job_output_datasets_string.strip()
-    else:
-        job_df['output_datasets'] = None
+    variable_names = list(variables.keys()) + (['random_seed'] if random_seed else [])
+    
+    reserved_variables = [variable_name for variable_name in variable_names if variable_name in FairB._JOB_TABLE_COLUMNS + [FairB._JOB_HASH_COLUMN]]
+    assert not reserved_variables, f"Variable names can't be any of {FairB._JOB_TABLE_COLUMNS + [FairB._JOB_HASH_COLUMN]}."
+    
+    incremental = args.incremental and Path(fairb.job_config_file).exists()
+    
+    # The job config only keeps the variable values of each job, the templates and
+    # resources are kept once in the design and rendered on access (see FairB.render_job_config).
+    if not incremental:
+        fairb.designs = []
+    design_index = fairb.add_design(
+        args.variables,
+        args.dl_cmd,
+        args.inputs,
+        args.outputs,
+        args.is_explicit,
+        args.prereq_get,
+        args.message,
+        args.ephemeral_locations,
+        args.req_disk_gb,
+        args.queue,
+        args.slots,
+        args.vmem,
+        args.h_rt,
+        args.env_vars,
+        job_name=args.job_name,
+        variables=variable_names,
+        reuse=incremental,
+        retry=retry_policy(args.max_attempts, args.retry_on, args.retry_backoff, args.retry_backoff_factor)
+        )
     
-    job_df['prereq_get'] = args.prereq_get
-    job_df['message'] = args.message
-    job_df['super_id'] = fairb.super_id
-    job_df['clone_target'] = fairb.clone_target
-    job_df['push_target'] = fairb.push_target
-    job_df['ephemeral_location'] = args.ephemeral_locations
-    job_df['req_disk_gb'] = args.req_disk_gb
-    job_df['batch'] = fairb.current_batch
- 
+    # without a job config to compare with, the hashes are computed by the first --incremental design
+    job_chunks = iter_job_chunks(fairb, variables, max_len, design_index, args.job_name, random_seed, args.chunk_size, job_hashes=incremental)
     
+    if incremental:
+        return update_job_config(fairb, pd.concat(job_chunks, ignore_index=True))
     
-    job_df.to_csv(fairb_root/'job_config.csv', index=False)
+    with TableWriter(fairb.job_config_file) as writer:
+        for job_df in job_chunks:
+            writer.write(job_df)
+    fairb.to_json()
+    fairb.index_job_config()
     
 # if __name__ == "__main__":
 #     main()
\ No newline at end of file
@@ -2,10 +2,8 @@ import os
 from argparse import ArgumentParser
 from pathlib import Path
 
-import datalad.api as dl
-import pandas as pd
 from fairb.core import FairB
-from fairb.utils.git import do_checkout, get_private_subdataset, git_add_remote, git_push, git_merge, git_annex_fsck, git_commit, git_add, datalad_push_data_nothing, git_commit_amend
+from fairb.utils.git import do_checkout, get_private_subdataset, git_add_remote, git_push, git_merge, git_annex_fsck, git_commit, git_add, datalad_push_data_nothing, git_commit_amend, git_remote_branches
 
 def main(args):
     
@@ -16,12 +14,14 @@ def main(args):
     parser.add_argument('--git_rm_except_one', action='store_true', required=False)
     args = parser.parse_args(args)
     
+    import datalad.api as dl
+    import pandas as pd
+    
     # read fairb project
-    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json')
-    fairb.read_job_config()
+    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json', read_only=True)
+    fairb.read_job_config(columns=['job_name', 'batch'])
     fairb.read_job_status()
-    job_branches = fairb.get_completed_jobs()
-    remote_job_branches = ['remotes/origin/'+job_branch for job_branch in job_branches]
+    completed_branches = fairb.get_completed_job_branches()
     
     # assert git_rm before creating clones
     ## TODO: empirically test git_rm argument
@@ -43,6 +43,11 @@ def main(args):
     sd = pd.DataFrame(ds.subdatasets())
     
     os.chdir(tmp_output_ds)
+    
+    # each run of a job pushes to its own branch, jobs run before that pushed to a branch named after the job
+    remote_branches = git_remote_branches()
+    job_branches = [branch if f'origin/{branch}' in remote_branches else job_name for job_name, branch in completed_branches.items()]
+    remote_job_branches = ['remotes/origin/'+job_branch for job_branch in job_branches]
 
     if fairb.output_datasets:
         for output_dataset in fairb.output_datasets:
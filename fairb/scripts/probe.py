@@ -0,0 +1,80 @@
+"""
+Probe the free disk space of a node's ephemeral locations for fairb submit.
+Author: Diego Ramírez González
+
+Run it on every node that can take jobs, e.g. from a prologue, a cron job or
+a long-lived `fairb probe --follow` job, so `fairb submit --place` can pin
+jobs to hosts with enough disk space. Running it on the submit host alone is
+a local stand-in for testing.
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+
+from fairb.utils.capacity import normalize_patterns, write_probe
+
+
+def ephemeral_patterns(fairb):
+    "Unique ephemeral location patterns of the designs (or job config) of a project."
+    if fairb.designs:
+        values = [design.get('ephemeral_location') for design in fairb.designs]
+    else:
+        fairb.read_job_config(columns=['ephemeral_location'])
+        values = fairb.job_config_df['ephemeral_location'].drop_duplicates().to_list()
+
+    patterns = []
+    for value in values:
+        patterns += [pattern for pattern in normalize_patterns(value) if pattern not in patterns]
+    return patterns
+
+
+def probe(fairb, patterns, host=None, user=None, mount_ttl=300):
+    """
+    Measure the free disk space of the locations of each pattern on this
+    host and write them to the project's probe directory.
+    Return the probed locations.
+    """
+    from fairb.scripts.run import get_free_disk
+    from fairb.utils.mounts import resolve_locations
+
+    if host is None:
+        host = os.uname().nodename
+    if user is None:
+        user = os.getenv('USER')
+
+    locations = []
+    for pattern in patterns:
+        for location in resolve_locations([pattern], host, user, ttl=mount_ttl):
+            # locations of other nodes or users might not be there
+            if Path(location).exists():
+                locations.append({'pattern':pattern, 'location':location, 'free_gb':get_free_disk(location)})
+
+    write_probe(fairb.probe_dir, host, locations)
+    return locations
+
+
+def main(args):
+
+    from fairb.core import FairB
+
+    parser = ArgumentParser(
+        description="Record the free disk space of this node's ephemeral locations, for fairb submit --place."
+    )
+    parser.add_argument('-c', '--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+    parser.add_argument('--locations', nargs='+', help="Ephemeral location patterns to probe. Defaults to the ones of the project's designs.")
+    parser.add_argument('--follow', action='store_true', help="Keep probing every --poll seconds.")
+    parser.add_argument('--poll', type=int, help="Seconds between probes, with --follow.", default=300)
+    args = parser.parse_args(args)
+
+    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json', read_only=True)
+    patterns = normalize_patterns(' '.join(args.locations)) if args.locations else ephemeral_patterns(fairb)
+
+    while True:
+        locations = probe(fairb, patterns)
+        print(f"{datetime.today():%H:%M:%S} " + ', '.join(f"{entry['location']}: {entry['free_gb']} gb" for entry in locations))
+        if not args.follow:
+            break
+        time.sleep(args.poll)
@@ -0,0 +1,96 @@
+"""
+Mark ongoing fairb jobs whose heartbeat stopped as lost.
+Author: Diego Ramírez González
+
+A `fairb run` killed by the scheduler (h_rt, memory, node failure) can't
+update its status, so its row would stay ongoing: the job would never be
+available again and its req_disk_gb would stay reserved. `fairb run` updates
+the heartbeat of its row every --heartbeat_interval seconds, and this reaper
+marks the rows without a heartbeat for --timeout seconds as lost.
+Heartbeats are only sent with the sqlite status backend (see `fairb status
+--migrate sqlite`), so the reaper refuses to run on csv projects.
+"""
+
+import os
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+def stale_jobs(status_store, timeout, now=None):
+    """
+    Return the ongoing rows whose latest heartbeat (or start, for rows
+    without one) is older than timeout seconds.
+    """
+    import pandas as pd
+
+    if now is None:
+        now = datetime.today()
+
+    ongoing_df = status_store.find(status='ongoing')
+    last_seen = pd.to_datetime(ongoing_df['heartbeat'].fillna(ongoing_df['start']), format=TIME_FORMAT, errors='coerce')
+
+    return ongoing_df[(now - last_seen).dt.total_seconds() > timeout]
+
+
+def reap(fairb, timeout):
+    """
+    Mark the stale ongoing jobs as lost, which makes them available again
+    and releases their disk, and remove their job directory if it's on this
+    host. Return the reaped rows.
+    """
+    from filelock import FileLock
+    from fairb.scripts.run import cleanup
+
+    host = os.uname().nodename
+
+    with FileLock(fairb.status_lockfile):
+        stale_df = stale_jobs(fairb.status_store, timeout)
+        update = datetime.today().strftime(TIME_FORMAT)
+        for row in stale_df.itertuples(index=False):
+            # only the row of that run, in case it was updated since it was read
+            fairb.status_store.update(
+                {'job_name':row.job_name, 'job_id':row.job_id, 'host':row.host, 'location':row.location, 'status':'ongoing'},
+                status='lost',
+                update=update,
+                traceback=f'No heartbeat since {row.heartbeat if isinstance(row.heartbeat, str) else row.start}.'
+                )
+
+    for row in stale_df.itertuples(index=False):
+        if row.host == host and isinstance(row.job_dir, str) and Path(row.job_dir).exists():
+            cleanup(row.job_dir)
+            print(f"{row.job_name}: lost, removed {row.job_dir}.")
+        elif isinstance(row.job_dir, str):
+            print(f"{row.job_name}: lost, {row.job_dir} is left on {row.host}.")
+        else:
+            print(f"{row.job_name}: lost.")
+
+    return stale_df
+
+
+def main(args):
+
+    from fairb.core import FairB
+
+    parser = ArgumentParser(
+        description="Mark ongoing fairb jobs without a recent heartbeat as lost, so they can run again."
+    )
+    parser.add_argument('-c', '--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+    parser.add_argument('--timeout', type=int, help="Seconds without a heartbeat after which an ongoing job is lost. Keep it well above the heartbeat interval of fairb run.", default=600)
+    parser.add_argument('--follow', action='store_true', help="Keep reaping every --poll seconds.")
+    parser.add_argument('--poll', type=int, help="Seconds between reaps, with --follow.", default=300)
+    args = parser.parse_args(args)
+
+    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json', read_only=True)
+    # every ongoing job of a csv project would look lost
+    assert fairb.status_backend != 'csv', "Jobs only send heartbeats with the sqlite status backend, migrate with 'fairb status --migrate sqlite'."
+
+    while True:
+        stale_df = reap(fairb, args.timeout)
+        print(f"{datetime.today():%H:%M:%S} {len(stale_df)} lost jobs.")
+        if not args.follow:
+            break
+        time.sleep(args.poll)
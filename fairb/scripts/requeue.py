@@ -0,0 +1,119 @@
+"""
+Submit failed fairb jobs again according to the retry policy of their design.
+Author: Diego Ramírez González
+
+A job whose latest run ended as no-space, lost or error is submitted again
+if its design's retry policy (see `fairb design --max_attempts`) retries that
+failure, it has attempts left and its backoff has passed since it failed.
+No-space jobs are kept away from the hosts where they didn't fit.
+"""
+
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+
+
+def retry_candidates(fairb, default_policy=None, now=None):
+    """
+    Return the available jobs that are due for a retry as a dictionary of
+    job name -> hosts to avoid. Jobs of designs without a retry policy
+    follow default_policy.
+    """
+    from fairb.core import FairB
+    from fairb.utils.retry import FAILED_STATUS, failure_class, should_retry
+    from fairb.utils.status import current_rows
+
+    if fairb.job_config_df is None:
+        fairb.read_job_config()
+    failed_jobs = set(fairb.status_store.job_names(FAILED_STATUS)) & set(fairb.get_available_jobs())
+    if not failed_jobs:
+        return {}
+
+    job_df = fairb.job_config_df.query("job_name.isin(@failed_jobs)")
+    if FairB._is_normalized(job_df.columns):
+        policies = {job_name:fairb.designs[int(design)].get('retry', default_policy) for job_name, design in job_df[['job_name', 'design']].itertuples(index=False)}
+    else:
+        policies = {job_name:default_policy for job_name in job_df['job_name']}
+
+    status_df = current_rows(fairb.status_store.read()).query("job_name.isin(@failed_jobs)")
+
+    candidates = {}
+    for job_name, rows in status_df.groupby('job_name', sort=False):
+        latest = rows.iloc[-1]
+        failure = failure_class(latest['status'], latest['error_type'])
+        attempts = 0 if rows['attempt'].isna().all() else int(rows['attempt'].astype(float).max())
+        failed_at = latest['update'] if isinstance(latest['update'], str) else latest['start']
+
+        if should_retry(policies.get(job_name), failure, attempts, failed_at, now):
+            # prefer other hosts than the ones without space for the job
+            candidates[job_name] = sorted(rows.query("status == 'no-space'")['host'].dropna().unique()) if failure == 'no-space' else []
+
+    return candidates
+
+
+def requeue(fairb, fairb_path, args):
+    """
+    Submit the jobs due for a retry. Return the submission results.
+    """
+    from fairb.scripts.submit import job_submissions, print_summary, reconcile_submissions, record_submissions, render_jobs, sendjobs, set_submitted
+    from fairb.utils.retry import retry_policy
+
+    if args.queue_command:
+        reconcile_submissions(fairb.status_store, args.queue_command, fairb.status_lockfile)
+
+    default_policy = retry_policy(args.max_attempts, args.retry_on, args.retry_backoff, args.retry_backoff_factor)
+    candidates = retry_candidates(fairb, default_policy)
+
+    # jobs avoiding the same hosts are submitted together
+    groups = {}
+    for job_name, exclude_hosts in candidates.items():
+        groups.setdefault(tuple(exclude_hosts), []).append(job_name)
+
+    submissions = []
+    for exclude_hosts, job_names in groups.items():
+        submissions += job_submissions(render_jobs(fairb, job_names), fairb_path, list(exclude_hosts))
+
+    start = time.perf_counter()
+    results = sendjobs(submissions, args.max_concurrent, args.retries, args.backoff)
+    set_submitted(fairb.status_store, results, fairb.status_lockfile)
+    record_submissions(results, fairb_path)
+    if results:
+        print_summary(results, time.perf_counter() - start)
+
+    return results
+
+
+def main(args):
+
+    from fairb.core import FairB
+
+    parser = ArgumentParser(
+        description="Submit the failed fairb jobs again, following the retry policy of their design."
+    )
+    parser.add_argument('-c', '--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+
+    # policy of designs without one
+    parser.add_argument('--max_attempts', type=int, help="Retry policy of the jobs whose design has none: maximum number of runs of a job. Jobs without a policy aren't retried.")
+    parser.add_argument('--retry_on', nargs='+', help="Failures retried by the default policy: no-space, lost, an exception type name or error for any exception.")
+    parser.add_argument('--retry_backoff', type=float, help="Seconds before the first retry of the default policy.")
+    parser.add_argument('--retry_backoff_factor', type=float, help="Growth of the wait between retries of the default policy.")
+
+    # submission
+    parser.add_argument('--max_concurrent', type=int, default=8, help="Maximum number of qsub calls running at once.")
+    parser.add_argument('--retries', type=int, default=3, help="Number of times a failed qsub call is retried.")
+    parser.add_argument('--backoff', type=float, default=1.0, help="Seconds to wait before the first qsub retry, doubled on every retry.")
+    parser.add_argument('--queue_command', type=str, default='qstat', help="Command listing the scheduler's queued and running jobs, one per line starting with the job id. An empty string skips the check.")
+
+    parser.add_argument('--follow', action='store_true', help="Keep requeuing every --poll seconds.")
+    parser.add_argument('--poll', type=int, help="Seconds between requeues, with --follow.", default=300)
+    args = parser.parse_args(args)
+
+    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json', read_only=True)
+
+    while True:
+        results = requeue(fairb, args.fairb, args)
+        print(f"{datetime.today():%H:%M:%S} {sum(result['ntasks'] for result in results if result['queued'])} jobs requeued.")
+        if not args.follow:
+            break
+        time.sleep(args.poll)
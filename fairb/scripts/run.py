@@ -6,43 +6,317 @@ See:
 Wagner, A. S., Waite, L. K., Wierzba, M., Hoffstaedter, F., Waite, A. Q., Poldrack, B., ... & Hanke, M. (2022). FAIRly big: A framework for computationally reproducible processing of large-scale data. Scientific data, 9(1), 80.
 """
 
-def main(args):
+import os
+import shutil
+import subprocess
+from pathlib import Path
+import re
+from datetime import datetime
+
+
+class NoDiskSpaceError(Exception):
+    """An exception for a job that found no ephemeral location with enough disk space."""
+    pass
+
+
+# Functions for disk space management
+def get_locations(location_list, host, user, ttl=300):
+    """
+    Return tmp and non_tmp locations from the list of location patterns.
+    Non_tmp patterns with {HOST} are resolved against the node's mount table,
+    which is cached for ttl seconds.
+    """
+    from fairb.utils.mounts import resolve_locations
+
+    tmp = [location for location in location_list if location in ('/tmp', '/tmp/')]
+    not_tmp_patterns = [location for location in location_list if location not in ('/tmp', '/tmp/')]
+
+    # the script can accept multiple location patterns
+    not_tmp_locations = resolve_locations(not_tmp_patterns, host, user, ttl=ttl)
+
+    return tmp, not_tmp_locations
+
+
+def get_free_disk(location):
+    """
+    Return location's free disk space in gb.
+    """
+
+    _total, _used, free = shutil.disk_usage(location)
+    # transform to gb
+    return free // (2**30)
+
+
+def get_job_disk_usage(job_dir):
+    """
+    Return the disk space used by a job directory in gb, 0 if it doesn't exist yet.
+    Like du, hardlinked files count once, but annexed objects (within
+    .git/annex/objects) with more than one link are left out: they're links
+    to the node's annex cache or staged container image, whose space isn't
+    the job's to release.
+    """
+    import stat
+    from fairb.utils.annex_cache import ANNEX_OBJECTS
+
+    if job_dir is None or not Path(job_dir).exists():
+        return 0.0
+
+    used_bytes = 0
+    seen = set()
+    # files can come and go while walking the directory, its total is still valid
+    for root, dirs, files in os.walk(job_dir):
+        is_annex_objects = ANNEX_OBJECTS in root
+        for name in dirs + files:
+            try:
+                file_stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if file_stat.st_nlink > 1 and not stat.S_ISDIR(file_stat.st_mode):
+                if is_annex_objects or (file_stat.st_dev, file_stat.st_ino) in seen:
+                    continue
+                seen.add((file_stat.st_dev, file_stat.st_ino))
+            used_bytes += file_stat.st_blocks * 512
+    # transform to gb
+    return used_bytes / 2**30
+
+
+def get_available_disk_resource(location, host, status_store, free_disk_gb=None):
+    """
+    Return available disk space available (in gb): the location's free space
+    minus the space ongoing jobs reserved on it and haven't used yet.
+    free_disk_gb can be measured beforehand, outside the status lock.
+    """
+
+    if free_disk_gb is None:
+        free_disk_gb = get_free_disk(location)
+    return free_disk_gb - status_store.reserved_disk_gb(host, location)
+
+
+def run_id():
+    """
+    Return a unique id for a job run: the scheduler's job id (with the task id
+    of array jobs) or, outside the scheduler, the pid, plus a random suffix,
+    since a worker runs several jobs within the same job and process.
+    """
+    import uuid
+
+    job_id = os.getenv('JOB_ID') or str(os.getpid())
+    # SGE sets SGE_TASK_ID to 'undefined' for non-array jobs
+    task_id = os.getenv('SGE_TASK_ID', 'undefined')
+    if task_id != 'undefined':
+        job_id = f'{job_id}.{task_id}'
+    return f'{job_id}-{uuid.uuid4().hex[:8]}'
+
+
+def next_attempt(status_store, job_name):
+    """
+    Return the attempt number of a new run of a job, one more than its
+    latest run since it was last outdated.
+    """
+    from fairb.utils.status import current_rows
+
+    attempts = current_rows(status_store.find(job_name=job_name))['attempt'].astype(float)
+    return 1 if attempts.isna().all() else int(attempts.max()) + 1
+
+
+def set_status(status_store, job_name, job_id, req_disk_gb, host, location, job_dir, status, start, attempt=None, error_type=None):
+    """
+    Add a new job status.
+    """
+
+    status_store.insert(
+        job_name=job_name,
+        job_id=job_id,
+        req_disk_gb=req_disk_gb,
+        host=host,
+        location=location,
+        job_dir=job_dir,
+        status=status,
+        start=start,
+        update=None,
+        traceback=None,
+        heartbeat=start,
+        attempt=attempt,
+        error_type=error_type
+        )
+
+    return None
 
-    from argparse import ArgumentParser
-    import sys
-    import os
-    import shutil
-    import subprocess
-    from pathlib import Path
-    import re
-    from datetime import datetime
 
+def update_status(status_store, job_name, job_id, host, location, status, update, total_disk_gb=None, **error):
+    """
+    Update an existing job status, and the disk space its job used if given.
+    error can hold the error_type and traceback of a failed job.
+    """
+
+    values = {} if total_disk_gb is None else {'total_disk_gb':total_disk_gb}
+    values.update(error)
+    status_store.update(
+        {'job_name':job_name, 'job_id':job_id, 'host':host, 'location':location},
+        status=status,
+        update=update,
+        **values
+        )
+
+    return None
+
+def start_heartbeat(fairb, job_name, job_id, host, location, job_dir, interval):
+    """
+    Update the heartbeat of an ongoing job every interval seconds from a
+    daemon thread, so jobs killed without a chance to update their status
+    can be told apart (see fairb reap), along with the disk space used by its
+    job_dir so far. Return the event that stops it.
+    The csv backend rewrites the whole file on every update, so heartbeats
+    are only sent with the sqlite backend.
+    """
+    import threading
+    from filelock import FileLock
+    from fairb.utils.status import open_status_store
+
+    stop = threading.Event()
+    if fairb.status_backend == 'csv':
+        return stop
+
+    def beat():
+        # connections can't be shared between threads
+        status_store = open_status_store(fairb.status_backend, fairb.job_status_file)
+        status_lock = FileLock(fairb.status_lockfile)
+        while not stop.wait(interval):
+            try:
+                # measure outside the lock, du can take a while on large job dirs
+                total_disk_gb = get_job_disk_usage(job_dir)
+                with status_lock:
+                    status_store.update(
+                        {'job_name':job_name, 'job_id':job_id, 'host':host, 'location':location, 'status':'ongoing'},
+                        heartbeat=datetime.today().strftime("%Y/%m/%d %H:%M:%S"),
+                        total_disk_gb=total_disk_gb
+                        )
+            except Exception as error:
+                print(f"Couldn't update the heartbeat of {job_name}: {error}")
+
+    threading.Thread(target=beat, name=f'heartbeat-{job_name}', daemon=True).start()
+
+    return stop
+
+
+# cleanup and exception handling
+def cleanup(job_dir):
+    # removing files only takes writable directories, and chmod on files would
+    # also make the annex cache and staged container objects linked into the job writable
+    subprocess.run(['find', job_dir, '-type', 'd', '-exec', 'chmod', 'u+w', '{}', '+'])
+    subprocess.run(['rm', '-rf', job_dir])
+
+
+# input staging
+def expand_inputs(ds_path, paths):
+    """
+    Return the paths of a dataset to get, with glob patterns expanded within
+    it. Patterns without matches, e.g. within subdatasets that aren't
+    installed yet, are left for datalad run.
+    """
+    import glob
+
+    expanded = []
+    for path in paths:
+        if glob.has_magic(path):
+            expanded += sorted(os.path.relpath(match, ds_path) for match in glob.glob(str(Path(ds_path) / path), recursive=True))
+        else:
+            expanded.append(path)
+    # keep the first occurrence of each path
+    return list(dict.fromkeys(expanded))
+
+
+def stage_inputs(ds_path, paths, jobs='auto', cache=None, required=()):
+    """
+    Get the content of paths of a dataset with a single datalad get that
+    runs jobs transfers at once, and report the bytes and seconds (since the
+    get started) of each file as it arrives. With a node-local annex cache,
+    cached objects are linked instead of downloaded and the downloaded ones
+    are added to it. Paths that can't be got are skipped, as datalad run
+    does for missing inputs, unless they're within the required paths.
+    Return the staged files as (path, bytes, seconds) tuples.
+    """
+    import time
+    import datalad.api as dl
+    from datalad.support.exceptions import IncompleteResultsError
+    from fairb.utils.annex_cache import annexed_files
+
+    patterns = paths
+    paths = expand_inputs(ds_path, patterns)
+    if not paths:
+        return []
+
+    if cache is not None:
+        # install the subdatasets of the inputs to find their annex keys
+        dl.get([str(Path(ds_path) / path) for path in paths], dataset=ds_path, get_data=False, result_renderer='disabled', on_failure='ignore')
+        paths = expand_inputs(ds_path, patterns)
+        hits, misses, bytes_hit = cache.populate(annexed_files(ds_path, paths))
+        print(f"Annex cache: {hits} hits ({bytes_hit / 2**20:.1f} MB linked), {misses} misses.")
+
+    staged = []
+    failed = []
+    start = time.perf_counter()
+    for result in dl.get([str(Path(ds_path) / path) for path in paths], dataset=ds_path, jobs=jobs, return_type='generator', result_renderer='disabled', on_failure='ignore'):
+        if result.get('status') in ('impossible', 'error'):
+            failed.append(result)
+            print(f"Couldn't get {os.path.relpath(result['path'], ds_path)}: {result.get('message')}")
+        elif result.get('action') == 'get' and result.get('type') == 'file' and result.get('status') == 'ok':
+            seconds = time.perf_counter() - start
+            size = os.path.getsize(result['path'])
+            staged.append((os.path.relpath(result['path'], ds_path), size, seconds))
+            print(f"Got {staged[-1][0]}: {size / 2**20:.1f} MB at {seconds:.1f} s.")
+
+    seconds = time.perf_counter() - start
+    total = sum(size for _path, size, _seconds in staged)
+    print(f"Staged {len(staged)} files, {total / 2**20:.1f} MB in {seconds:.1f} s ({total / 2**20 / seconds if seconds else 0:.1f} MB/s).")
+
+    required = expand_inputs(ds_path, required)
+    required_failed = [result for result in failed if is_within(os.path.relpath(result['path'], ds_path), required)]
+    if required_failed:
+        raise IncompleteResultsError(failed=required_failed, msg=f"Couldn't get {len(required_failed)} required paths.")
+
+    if cache is not None:
+        bytes_stored = cache.store(annexed_files(ds_path, paths))
+        stats = cache.stats()
+        print(f"Annex cache: {bytes_stored / 2**20:.1f} MB added, {stats['hits']} hits and {stats['misses']} misses on this host so far.")
+
+    return staged
+
+
+def is_within(path, datasets):
+    "Whether a relative path is within any of the datasets."
+    return any(Path(path) == Path(dataset) or Path(dataset) in Path(path).parents for dataset in datasets)
+
+
+def run_job(fairb, job_name, claim=False, heartbeat_interval=60, get_jobs='auto', submitted=False):
+    """
+    Run one job of a fairb project within the current process.
+    If claim, the job is only run if it's still available once the status lock is held,
+    if submitted too, its own submitted row doesn't keep it from running.
+    While it runs, its heartbeat is updated every heartbeat_interval seconds.
+    Its prereq_get and inputs are fetched by a single get running get_jobs transfers at once,
+    only a missing prereq_get fails the job.
+    Return whether the job was run.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from fairb.utils.containers import stage_container
+    from fairb.utils.git import do_checkout, get_mirror, get_private_subdataset, git_add_remote, git_push
     from filelock import FileLock
     import datalad.api as dl
     import pandas as pd
-    import numpy as np
-    from fairb.core import FairB
-    from fairb.utils.git import do_checkout, get_private_subdataset, git_add_remote, git_push
-
 
-    parser = ArgumentParser()
-    parser.add_argument('--job_name', type=str, help='Job name within job config file.', required=True)
-    parser.add_argument('--fairb', type=str, help='Path to fairb project..', required=True)
-    
-    args = parser.parse_args(args)
-    
-    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json')
-    fairb.read_job_config()
-    job_config = fairb.job_config_df.replace(np.nan, None).query("job_name == @args.job_name").iloc[0]
+    # look up the job by its index, a loaded job config might only hold some of its columns
+    job_config = fairb.read_job(job_name)
     
-    job_name = args.job_name
-    
-    status_csv = fairb.job_status_file
+    status_store = fairb.status_store
     status_lockfile = fairb.status_lockfile
     super_ds_id = fairb.super_id
     clone_target = fairb.clone_target
     push_target = fairb.push_target
     push_lockfile = fairb.push_lockfile
+    mirror_location = fairb.mirror_location
+    annex_cache_gb = fairb.annex_cache_gb
+    container_location = fairb.container_location
     
     inputs = job_config.inputs
     outputs = job_config.outputs
@@ -70,9 +344,9 @@ def main(args):
     container = job_config.container
     message = job_config.message
     ephemeral_locations = job_config.ephemeral_location
-    req_disk_gb = float(job_config.req_disk_gb)
+    req_disk_gb = None if job_config.req_disk_gb is None else float(job_config.req_disk_gb)
 
-    job_id = os.getpid()  
+    job_id = run_id()
     host = os.uname().nodename
     user= os.getenv('USER')
     
@@ -88,174 +362,18 @@ def main(args):
     status_lock = FileLock(status_lockfile)
     push_lock = FileLock(push_lockfile)
 
-    # Functions for disk space management
-    def get_locations(location_list, host, user):
-        """
-        Return tmp and non_tmp locations from the list of location patterns.
-        """
-        
-        tmp=[]
-        not_tmp_patterns=[]
-        not_tmp_locations=[]
-
-        # tmp and non_tmp list
-        for location in location_list:
-            if location == '/tmp' or location == '/tmp/':
-                tmp.append(location)
-            else:
-                not_tmp_patterns.append(location)
-        
-        # get non_tmp locations according to the non_tmp_patterns (the script can accept multiple location patterns)
-        for not_tmp_pattern in not_tmp_patterns:
-            
-            if 'HOST' not in not_tmp_pattern:
-                not_tmp_locations.append(not_tmp_pattern)
-            
-            else:
-                not_tmp_pattern = not_tmp_pattern.format(HOST=host, USER=user)
-            
-                for index, part in enumerate(Path(not_tmp_pattern).parts):
-                    if host in part:
-                        break
-
-                # node location
-                mount_pattern = str(Path(*list(Path(not_tmp_pattern).parts[:index+1])))
-                # location inside node
-                after_pattern = str(Path(*list(Path(not_tmp_pattern).parts[index+1:])))
-                
-                # make sure those locations are within the node with the /etc/mtab file
-                with open('/etc/mtab', 'r') as mtab:
-                    for line in mtab.readlines():
-                        # which mount pattern is within the node
-                        pattern = re.search(f'{mount_pattern} ', line)
-                        # which directories (after mount pattern) are within that mount
-                        if pattern:
-                            pattern_glob = Path(pattern.group().strip()).glob(after_pattern) 
-                        else:
-                            continue
-                        # after mount pattern could retrieve multiple locations
-                        if pattern_glob: 
-                            not_tmp_locations += [str(pg) for pg in pattern_glob]            
-        
-        return tmp, not_tmp_locations
-
-
-    def get_free_disk(location):
-        """
-        Return location's free disk space in gb.
-        """
-        
-        _total, _used, free = shutil.disk_usage(location)
-        # transform to gb
-        return free // (2**30)
-
-
-    def get_used_disk(location):
-        """
-        Return location's used disk space in gb.
-        """
-        
-        _total, used, _free = shutil.disk_usage(location)
-        # transform to gb
-        return used // (2**30)
-
-
-    def get_available_disk_resource(location, host, status_csv):
-        """
-        Return available disk space available (in gb).
-        """
-        
-        total_req_disk_others_gb = (pd.read_csv(status_csv)
-        .query("location == @location and status == 'ongoing' and host == @host")
-        .assign(
-            used_disk_gb = lambda df_: 
-                df_['location'].apply(lambda x_: get_used_disk(x_)),
-            req_disk_gb = lambda df_: 
-                (df_['req_disk_gb'] - df_['used_disk_gb'])
-        )
-        .assign(
-            req_disk_gb = lambda df_: 
-                df_['req_disk_gb'].mask(df_['req_disk_gb'] < 0, 0)
-        )
-        ['req_disk_gb']
-        .sum()
-        )
-            
-        current_free_gb = get_free_disk(location)
-        
-        return current_free_gb - total_req_disk_others_gb
-
-
-    def set_status(status_csv, job_name, job_id, req_disk_gb, host, location, job_dir, status, start):
-        """
-        Add a new job status.
-        """
-        
-        status_df = pd.read_csv(status_csv)
-        
-        new_status = {
-            'job_name':[job_name],
-            'job_id':[job_id],
-            'req_disk_gb':[req_disk_gb],
-            'host':[host],
-            'location':[location],
-            'job_dir':[job_dir],
-            'status':[status],
-            'start':[start],
-            'update':[None],
-            'traceback':[None]
-            }
-        
-        new_status = pd.DataFrame(new_status)
-        
-        status_df = pd.concat([status_df, new_status])
-        
-        status_df.to_csv(status_csv, index=False)
-        
-        return status_df
-
-
-    def update_status(status_csv, job_name, job_id, host, location, status, update):
-        """
-        Update an existing job status.
-        """
-        
-        status_df = pd.read_csv(status_csv)
-        
-        is_job = (
-        (status_df['job_name'] == job_name) &
-        (status_df['job_id'] == job_id) &
-        (status_df['host'] == host) &
-        (status_df['location'] == location) 
-        )
-        
-        status_df = (status_df
-        .assign(
-            status = lambda df_: df_['status'].mask(is_job, status),
-            update = lambda df_: df_['update'].mask(is_job, update)
-            # traceback = lambda df_: df_['traceback'].mask(is_job, traceback)
-            )
-        )
-        
-        status_df.to_csv(status_csv, index=False)
-        
-        return status_df
-
-    # cleanup and exception handling
-    def cleanup(job_dir):
-        subprocess.run(['chmod', '-R', '+w', job_dir])
-        subprocess.run(['rm', '-rf', job_dir])
-
-        
     #######################
     # Resource management #
     #######################
     if ephemeral_locations is None:
         ephemeral_locations = ['/tmp']
     else:
-        ephemeral_locations = [location.format(host=host, user=user)for location in ephemeral_locations.split()]
+        ephemeral_locations = ephemeral_locations.split()
     
+    # resolve locations and measure their free space before taking the status lock,
+    # only the reservations of other jobs need to be read under it
     tmp, not_tmp_locations = get_locations(ephemeral_locations, host, user)
+    free_disk = {location:get_free_disk(location) for location in (['/tmp'] if tmp else []) + not_tmp_locations}
     
     # manage available disk space
     if req_disk_gb is None:
@@ -265,11 +383,19 @@ def main(args):
         
     with status_lock:
         
+        # another process claimed the job since it was selected
+        if claim and not fairb.is_job_available(job_name, submitted=submitted):
+            return False
+        
+        # the job left the scheduler's queue
+        status_store.update({'job_name':job_name, 'status':'submitted'}, status='dispatched', update=datetime.today().strftime("%Y/%m/%d %H:%M:%S"))
+        
         found_location=False
+        attempt = next_attempt(status_store, job_name)
         
         if tmp:
             tmp = '/tmp'
-            available_disk = get_available_disk_resource(tmp, host, status_csv)
+            available_disk = get_available_disk_resource(tmp, host, status_store, free_disk[tmp])
             if req_disk_gb < available_disk:
                 found_location=True
                 location=tmp
@@ -279,7 +405,7 @@ def main(args):
             not_tmp_df = (
                 pd.DataFrame({'location':not_tmp_locations})
                 .assign(available_disk = lambda df_: 
-                    df_['location'].apply(lambda x_: get_available_disk_resource(x_, host, status_csv))
+                    df_['location'].apply(lambda x_: get_available_disk_resource(x_, host, status_store, free_disk[x_]))
                     )
                 .sort_values('available_disk', ascending=False)
                 )
@@ -290,184 +416,251 @@ def main(args):
                 
         if found_location:
             job_dir = str(Path(location) / f'{job_name}_{user}')
-            set_status(status_csv, job_name, job_id, req_disk_gb, host, location, job_dir, status='ongoing', start=datetime.today().strftime("%Y/%m/%d %H:%M:%S"))
+            set_status(status_store, job_name, job_id, req_disk_gb, host, location, job_dir, status='ongoing', start=datetime.today().strftime("%Y/%m/%d %H:%M:%S"), attempt=attempt)
         else:
-            set_status(status_csv, job_name, job_id, req_disk_gb, host, location=None, job_dir=None, status='no-space', start=datetime.today().strftime("%Y/%m/%d %H:%M:%S"))
-            
-            raise Exception("Couldn't find a place with enough disk space.")
-
-
-    def excepthook(exctype, value, tb):
-        
-        try:
-            cleanup(job_dir)
-        except:
-            pass
-        
-        # error_msg = f'{exctype} {value}'
-        
-        with status_lock:
-            update_status(status_csv, job_name, job_id, host, location, status='error', update=datetime.today().strftime("%Y/%m/%d %H:%M:%S"))
+            set_status(status_store, job_name, job_id, req_disk_gb, host, location=None, job_dir=None, status='no-space', start=datetime.today().strftime("%Y/%m/%d %H:%M:%S"), attempt=attempt, error_type=NoDiskSpaceError.__name__)
             
-        print('Type:', exctype)
-        print('Value:', value)
-        print('Traceback:', tb)
+            raise NoDiskSpaceError("Couldn't find a place with enough disk space.")
 
 
-    sys.excepthook = excepthook
+    # node-local annex object cache shared by the jobs of the host on the same location
+    if annex_cache_gb:
+        from fairb.utils.annex_cache import AnnexCache
+        annex_cache = AnnexCache(Path(location) / f'fairb-annex-cache-{user}', annex_cache_gb)
+    else:
+        annex_cache = None
 
-    ########################
-    #        CLONE         #
-    ########################
+    heartbeat = start_heartbeat(fairb, job_name, job_id, host, location, job_dir, heartbeat_interval)
+    cwd = os.getcwd()
+    try:
+        ########################
+        #        CLONE         #
+        ########################
 
-    print(host)
+        print(host)
 
-    # Clone input ria and create ephemeral dataset, then change directory to it
+        # Clone input ria and create ephemeral dataset, then change directory to it
 
-    # Set superdataset and subdatasets as private repositories, so that their output keys
-    # and their ds uuids are not stored within the output_ria's git-annex branch.
-    # Note: `git annex dead here` only prevents storing the ephemeral clone's file keys, but not its uuid. 
+        # Set superdataset and subdatasets as private repositories, so that their output keys
+        # and their ds uuids are not stored within the output_ria's git-annex branch.
+        # Note: `git annex dead here` only prevents storing the ephemeral clone's file keys, but not its uuid. 
     
-    # remove ria prefix if necessary
-    try:
-        clone_ria_prefix = re.search(r'ria\+\w+:\/{2}', clone_target).group()
-        clone_target = clone_target.replace(clone_ria_prefix, '')
-    except:
-        # assume ria requires a file protocol if no protocol in the job_config
-        clone_ria_prefix = 'ria+file://'
-    try:
-        push_target = re.sub(r'ria\+\w+:\/{2}', '', push_target)
-    except:
-        pass
+        # remove ria prefix if necessary
+        try:
+            clone_ria_prefix = re.search(r'ria\+\w+:\/{2}', clone_target).group()
+            clone_target = clone_target.replace(clone_ria_prefix, '')
+        except:
+            # assume ria requires a file protocol if no protocol in the job_config
+            clone_ria_prefix = 'ria+file://'
+        try:
+            push_target = re.sub(r'ria\+\w+:\/{2}', '', push_target)
+        except:
+            pass
         
     
-    super_clone_target = f'{clone_ria_prefix}{clone_target}#{super_ds_id}'
-
-    print("Cloning superdataset.")
-    dl.clone(source=super_clone_target, path=job_dir, git_clone_opts=['-c annex.private=true'])
-    print("Change working directory to superdataset clone.")
-    os.chdir(job_dir)
+        super_clone_target = f'{clone_ria_prefix}{clone_target}#{super_ds_id}'
 
-    push_path = str(Path(push_target) / Path(super_ds_id[:3]) / Path(super_ds_id[3:]))
+        git_clone_opts = ['-c annex.private=true']
     
-    print("Add git remote.")
-    git_add_remote(push_path, 'cwd')
+        # borrow git objects from a node-local mirror of the clone target
+        if mirror_location is not None:
+            mirror_root = mirror_location.format(HOST=host, USER=user)
+            print("Update node-local mirror.")
+            super_mirror = get_mirror(clone_target, super_ds_id, mirror_root)
+            if super_mirror is not None:
+                git_clone_opts += [f'--reference-if-able={super_mirror}']
+
+        print("Cloning superdataset.")
+        dl.clone(source=super_clone_target, path=job_dir, git_clone_opts=git_clone_opts)
+        print("Change working directory to superdataset clone.")
+        os.chdir(job_dir)
+
+        push_path = str(Path(push_target) / Path(super_ds_id[:3]) / Path(super_ds_id[3:]))
+    
+        print("Add git remote.")
+        git_add_remote(push_path, 'cwd')
 
-    ds = dl.Dataset(job_dir)
-    sd = pd.DataFrame(ds.subdatasets())
+        ds = dl.Dataset(job_dir)
+        sd = pd.DataFrame(ds.subdatasets())
     
-    # input_datasets = sd.query('not gitmodule_name.isin(@output_datasets)')['gitmodule_name']
+        # input_datasets = sd.query('not gitmodule_name.isin(@output_datasets)')['gitmodule_name']
 
-    # for input_dataset in input_datasets:
-    #     dl.get(input_dataset, get_data=False)
+        # for input_dataset in input_datasets:
+        #     dl.get(input_dataset, get_data=False)
 
-    if output_datasets and not (pd.Series(output_datasets).isin(sd['gitmodule_name']).all()):
-        raise Exception("Not all output datasets are found.")
+        if output_datasets and not (pd.Series(output_datasets).isin(sd['gitmodule_name']).all()):
+            raise Exception("Not all output datasets are found.")
     
-    # Get output datasets if any.
-    # Right now, this solution assumes output subdatasets don't have subdatasets themselves.
-    # The next release of datalad should include the `--reckless private` option for both
-    # clone and get. This will also have issues if the subdataset at the clone target is not at the same branch as the superdataset. 
-    # If one doesn't mind storing an uuid for each job, then `git annex dead here` might be a better option for now if the above things are an issue.
-
-    print("Clone output subdatasets if any.")
-    for output_dataset in output_datasets:
-        sd_id = sd.query("gitmodule_name == @output_dataset")['gitmodule_datalad-id'].iat[0]
-        get_private_subdataset(clone_target, output_dataset, sd_id)
-        
-        push_path = str(Path(push_target) / Path(sd_id[:3]) / Path(sd_id[3:]))
-        git_add_remote(push_path, output_dataset)
-        
+        # Stage prereq_get and inputs while the output subdatasets are cloned, they don't
+        # touch each other. Inputs within output subdatasets wait for their clone.
+        stage_paths = list(dict.fromkeys(preget_inputs + (inputs or [])))
+        early_paths = [path for path in stage_paths if not is_within(path, output_datasets)]
+        late_paths = [path for path in stage_paths if is_within(path, output_datasets)]
+        print("Stage inputs.")
+        stager = ThreadPoolExecutor(max_workers=1)
+        staging = stager.submit(stage_inputs, job_dir, early_paths, get_jobs, annex_cache, preget_inputs)
+    
+        # Get output datasets if any.
+        # Right now, this solution assumes output subdatasets don't have subdatasets themselves.
+        # The next release of datalad should include the `--reckless private` option for both
+        # clone and get. This will also have issues if the subdataset at the clone target is not at the same branch as the superdataset. 
+        # If one doesn't mind storing an uuid for each job, then `git annex dead here` might be a better option for now if the above things are an issue.
+
+        print("Clone output subdatasets if any.")
+        try:
+            for output_dataset in output_datasets:
+                sd_id = sd.query("gitmodule_name == @output_dataset")['gitmodule_datalad-id'].iat[0]
+                if mirror_location is not None:
+                    sd_mirror = get_mirror(clone_target, sd_id, mirror_root)
+                else:
+                    sd_mirror = None
+                get_private_subdataset(clone_target, output_dataset, sd_id, reference=sd_mirror)
+            
+                push_path = str(Path(push_target) / Path(sd_id[:3]) / Path(sd_id[3:]))
+                git_add_remote(push_path, output_dataset)
+        finally:
+            # the job_dir isn't modified or removed before every get into it finished
+            stager.shutdown(wait=True)
+        staging.result()
+        stage_inputs(job_dir, late_paths, get_jobs, annex_cache, preget_inputs)
     
-    if not Path('outputs').exists():
-        Path('outputs').mkdir()
+        if not Path('outputs').exists():
+            Path('outputs').mkdir()
         
-    # Checkout to job branch
-    print("Checkout branch.")
-    branch_name = f'{job_name}'
-    for output_dataset in output_datasets:
-        do_checkout(branch_name, output_dataset)
-    do_checkout(branch_name, 'cwd')
-
-    # Preget inputs
-    for preget_input in preget_inputs:
-        dl.get(preget_input)
-
-    ###############################
-    #       DATALAD RUN JOB       #
-    ###############################
-    print("Run command.")
-    if message is None:
-        message = branch_name
+        # Checkout to job branch
+        print("Checkout branch.")
+        branch_name = fairb.job_branch(job_name, job_id)
+        for output_dataset in output_datasets:
+            do_checkout(branch_name, output_dataset)
+        do_checkout(branch_name, 'cwd')
+
+        # containers_run finds the image already present
+        if container is not None and commit is None and container_location is not None:
+            print("Stage container image.")
+            stage_container(job_dir, container, container_location.format(HOST=host, USER=user))
+
+        ###############################
+        #       DATALAD RUN JOB       #
+        ###############################
+        print("Run command.")
+        if message is None:
+            message = job_name
     
 
-    if commit is not None:
-        dl.rerun(
-            revision=commit,
-            explicit=is_explicit
-        )
+        if commit is not None:
+            dl.rerun(
+                revision=commit,
+                explicit=is_explicit
+            )
         
-    elif container is not None:
-        dl.containers_run(
-            dl_cmd,
-            container_name=container,
-            inputs=inputs,
-            outputs=outputs,
-            message=message,
-            explicit=is_explicit
-        )
+        elif container is not None:
+            dl.containers_run(
+                dl_cmd,
+                container_name=container,
+                inputs=inputs,
+                outputs=outputs,
+                message=message,
+                explicit=is_explicit
+            )
         
-    else:
-        dl.run(
-            dl_cmd,
-            inputs=inputs,
-            outputs=outputs,
-            message=message,
-            explicit=is_explicit
-        )
+        else:
+            dl.run(
+                dl_cmd,
+                inputs=inputs,
+                outputs=outputs,
+                message=message,
+                explicit=is_explicit
+            )
 
-    ###############################
-    #        PUSH RESULTS         #
-    ###############################
+        ###############################
+        #        PUSH RESULTS         #
+        ###############################
         
 
-    print("Push back results.")
-    # push annex data
-    dl.push(
-        dataset='.',
-        to='output_ria-storage',
-    )
-
-    for output_dataset in output_datasets:
+        print("Push back results.")
+        # push annex data
         dl.push(
-            dataset=output_dataset,
+            dataset='.',
             to='output_ria-storage',
         )
-        
-    # push git data
-    with push_lock:
-        git_push('cwd')
+
         for output_dataset in output_datasets:
-            git_push(output_dataset)
+            dl.push(
+                dataset=output_dataset,
+                to='output_ria-storage',
+            )
+        
+        # push git data
+        with push_lock:
+            git_push('cwd')
+            for output_dataset in output_datasets:
+                git_push(output_dataset)
         
         
 
-    ###############################
-    #         CLEAN DISK          #
-    ###############################
+        ###############################
+        #         CLEAN DISK          #
+        ###############################
 
-    print("Delete ephemeral clone.")
-    cleanup(job_dir)
+        total_disk_gb = get_job_disk_usage(job_dir)
+        print("Delete ephemeral clone.")
+        cleanup(job_dir)
+    
+    except BaseException as error:
+        import traceback
+        heartbeat.set()
+        # retry policies match on the exception type (see fairb requeue)
+        error_type, error_traceback = type(error).__name__, traceback.format_exc()
+        try:
+            total_disk_gb = get_job_disk_usage(job_dir)
+            cleanup(job_dir)
+        except:
+            total_disk_gb = None
+        
+        with status_lock:
+            update_status(status_store, job_name, job_id, host, location, status='error', update=datetime.today().strftime("%Y/%m/%d %H:%M:%S"), total_disk_gb=total_disk_gb, error_type=error_type, traceback=error_traceback)
+        
+        raise
+    finally:
+        heartbeat.set()
+        os.chdir(cwd)
 
     with status_lock:
         
-        update_status(status_csv, 
+        update_status(status_store, 
                       job_name, 
                       job_id, 
                       host, 
                       location, 
                       status='completed', 
-                      update=datetime.today().strftime("%Y/%m/%d %H:%M:%S")
+                      update=datetime.today().strftime("%Y/%m/%d %H:%M:%S"),
+                      total_disk_gb=total_disk_gb
                       )
 
-    print("Job completed succesfully.")
\ No newline at end of file
+    print("Job completed succesfully.")
+    
+    return True
+
+
+def get_jobs_value(value):
+    "Number of parallel transfers of datalad get, an int or 'auto'."
+    return value if value == 'auto' else int(value)
+
+
+def main(args):
+
+    from argparse import ArgumentParser
+    from fairb.core import FairB
+
+    parser = ArgumentParser()
+    parser.add_argument('--job_name', type=str, help='Job name within job config file.', required=True)
+    parser.add_argument('--fairb', type=str, help='Path to fairb project..', required=True)
+    parser.add_argument('--heartbeat_interval', type=int, help='Seconds between heartbeats of the running job, sqlite status backend only.', default=60)
+    parser.add_argument('--get_jobs', type=get_jobs_value, help="Number of parallel transfers when getting the job's inputs, or 'auto'.", default='auto')
+    
+    args = parser.parse_args(args)
+    
+    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json', read_only=True)
+    # a job submitted to the scheduler might have been run by a worker meanwhile
+    if not run_job(fairb, args.job_name, claim=True, heartbeat_interval=args.heartbeat_interval, get_jobs=args.get_jobs, submitted=True):
+        print(f"Job {args.job_name} is already ongoing or completed, skipping it.")
@@ -0,0 +1,57 @@
+"""
+Inspect, import, export and migrate the job status of a fairb project.
+Author: Diego Ramírez González
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from fairb.core import FairB
+from fairb.utils.status import STATUS_BACKENDS, open_status_store
+
+
+def main(args):
+
+    parser = ArgumentParser(
+        description="Inspect, import, export or migrate the job status of a fairb project."
+    )
+    parser.add_argument('-c','--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--export', type=str, help="Write the job status as a csv, feather or parquet file (by its suffix).")
+    action.add_argument('--import', type=str, dest='import_', help="Append the rows of a csv, feather or parquet job status file to the job status.")
+    action.add_argument('--migrate', type=str, choices=STATUS_BACKENDS, help="Copy the job status to another backend and use it from now on.")
+    args = parser.parse_args(args)
+
+    fairb_json = Path(args.fairb) / 'fairb.json'
+    fairb_project = FairB.from_json(fairb_json, read_only=True)
+
+    if args.export:
+        fairb_project.status_store.export_table(args.export)
+
+    elif args.import_:
+        fairb_project.status_store.import_table(args.import_)
+
+    elif args.migrate:
+        if args.migrate == fairb_project.status_backend:
+            print(f"Job status already uses the '{args.migrate}' backend.")
+            return None
+
+        new_status_file = str(Path(args.fairb).absolute() / FairB._JOB_STATUS_FILES[args.migrate])
+        assert not Path(new_status_file).exists(), f"{new_status_file} already exists."
+
+        # go through a csv export so that every backend can be migrated to every other one
+        tmp_csv = str(Path(args.fairb).absolute() / 'job_status.migrate.csv')
+        fairb_project.status_store.export_table(tmp_csv)
+        new_store = open_status_store(args.migrate, new_status_file)
+        new_store.create()
+        new_store.import_table(tmp_csv)
+        Path(tmp_csv).unlink()
+
+        fairb_project.status_backend = args.migrate
+        fairb_project.to_json(args.fairb)
+        print(f"Migrated job status to {new_status_file}.")
+
+    else:
+        fairb_project.read_job_status()
+        print(fairb_project.job_status_df['status'].value_counts().to_string())
@@ -11,11 +11,11 @@ from argparse import ArgumentParser
 from pathlib import Path
 import subprocess
 import json
+import re
 import sys
+import time
+from datetime import datetime
 
-import datalad.api as dl
-import pandas as pd
-import numpy as np
 from fairb.core import FairB
 
 
@@ -41,15 +41,74 @@ def write_script(job_name, fairb_path, job_root=None):
         script_file.write(script)
     
     return script_path
+
+
+def write_array_script(fairb_path, job_root=None):
+    """
+    Write a generic bash script for fairb run of one task of an array job.
+    The task manifest is the first argument and SGE_TASK_ID its line number.
+    """
+    if job_root is None:
+        job_root = Path(fairb_path) / 'code'
+        job_root.mkdir(exist_ok=True)
+    
+    script_path = str(Path(job_root) / 'fairb_array.sh')
+    
+    fairb_path = str(Path(fairb_path).absolute())
     
+    script = f"""#!/bin/bash
 
-def sendjob(queue, slots, vmem, h_rt, env_vars, script_path):
-    "Submit job to the queue."
+job_name=$(sed -n "${{SGE_TASK_ID}}p" "$1")
+fairb run --job_name "$job_name" --fairb {fairb_path}
+"""
+    
+    with open(script_path, 'w') as script_file:
+        script_file.write(script)
+    
+    return script_path
+
+
+def write_task_manifest(job_names, fairb_path, manifest_name, job_root=None):
+    """
+    Write the task-index manifest of an array job, one job name per line.
+    Line i holds the job name of SGE_TASK_ID i. An existing manifest is
+    never overwritten, since queued tasks might still read it.
+    """
+    if job_root is None:
+        job_root = Path(fairb_path) / 'code'
+        job_root.mkdir(exist_ok=True)
+    
+    manifest_path = str((Path(job_root) / f'{manifest_name}.tasks').absolute())
+    
+    with open(manifest_path, 'x') as manifest_file:
+        for job_name in job_names:
+            manifest_file.write(f'{job_name}\n')
+    
+    return manifest_path
+    
+
+# "Your job 123 ("name") has been submitted" or "Your job-array 123.1-10:1 ("name") has been submitted"
+JOB_ID_REGEX = re.compile(r'Your job(?:-array)? (\d+)')
+SUBMISSION_COLUMNS = ['submitted', 'job_name', 'ntasks', 'job_id', 'attempts', 'seconds', 'error']
+# statuses that end a job run, or its submission
+FINISHED_STATUS = ['completed', 'error', 'no-space', 'lost']
+# first number of each line of the scheduler's queue listing
+QUEUE_JOB_ID_REGEX = re.compile(r'^\s*(\d+)', re.MULTILINE)
+# job config fields used to submit and place jobs
+JOB_CONFIG_FIELDS = ['job_name', 'queue', 'slots', 'vmem', 'h_rt', 'env_vars', 'req_disk_gb', 'ephemeral_location']
+
+
+def qsub_command(queue, slots, vmem, h_rt, env_vars, script_path, ntasks=None, tc=None, script_args=[], exclude_hosts=None, host=None):
+    """
+    Build the qsub command of a job.
+    If ntasks is given, submit an array job of ntasks tasks with at most tc running at once.
+    The job won't be scheduled on any of the exclude_hosts, and only on host if given.
+    """
     
     # set defaults
     if h_rt is None:
         h_rt = '24:00:00'
-    if slots < 1 or slots is None:
+    if slots is None or slots < 1:
         slots = 1
     
     # basic features of command
@@ -71,15 +130,363 @@ def sendjob(queue, slots, vmem, h_rt, env_vars, script_path):
         for env_var_name, env_var_value in env_vars.items():
             cmd += ['-v', f'{env_var_name}={env_var_value}']
 
-    # add script path as the last argument
-    cmd+= [script_path]
-    
-    # run command
-    subprocess.run(cmd)
+    # keep the job away from busy hosts
+    if exclude_hosts:
+        cmd += ['-l', f"hostname=!({'|'.join(exclude_hosts)})"]
+
+    # pin the job to a host with enough disk space
+    if host is not None:
+        cmd += ['-l', f'hostname={host}']
+
+    # array job
+    if ntasks is not None:
+        cmd += ['-t', f'1-{ntasks}']
+        if tc is not None:
+            cmd += ['-tc', str(tc)]
+
+    # add script path and its arguments as the last arguments
+    cmd+= [script_path] + script_args
     
     return cmd
 
 
+def sendjob(cmd, retries=3, backoff=1.0):
+    """
+    Run a qsub command, retrying failed submissions after backoff, 2*backoff,
+    4*backoff... seconds. Return a dictionary with whether the job was
+    queued, the scheduler job id (None if every attempt failed), the number
+    of attempts, the seconds spent and the last error.
+    A qsub that exits with 0 is never run again: 'queued' is True and, if
+    its job id can't be parsed, the job id is None and its output is kept as
+    the error.
+    """
+    start = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except OSError as os_error:
+            error = str(os_error)
+        else:
+            if result.returncode == 0:
+                # the job is queued, submitting it again would duplicate it
+                job_id = JOB_ID_REGEX.search(result.stdout)
+                return {'queued':True, 'job_id':None if job_id is None else job_id.group(1), 'attempts':attempt, 'seconds':round(time.perf_counter() - start, 3), 'error':None if job_id is not None else f"Submitted, but no job id in qsub's output: {result.stdout.strip()}"}
+            error = (result.stderr or result.stdout).strip() or f'qsub exited with {result.returncode}'
+        
+        if attempt <= retries:
+            time.sleep(backoff * 2 ** (attempt - 1))
+    
+    return {'queued':False, 'job_id':None, 'attempts':attempt, 'seconds':round(time.perf_counter() - start, 3), 'error':error}
+
+
+def sendjobs(submissions, max_concurrent=8, retries=3, backoff=1.0):
+    """
+    Run the qsub commands of (submission_name, job_names, cmd) submissions,
+    at most max_concurrent at once. Return the result of each submission in
+    the order they finish.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    
+    results = []
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        futures = {executor.submit(sendjob, cmd, retries, backoff):(submission_name, job_names, '-t' in cmd) for submission_name, job_names, cmd in submissions}
+        for future in as_completed(futures):
+            submission_name, job_names, is_array = futures[future]
+            result = future.result()
+            if not result['queued']:
+                print(f"Couldn't submit {submission_name}: {result['error']}", file=sys.stderr)
+            elif result['error'] is not None:
+                print(f"{submission_name}: {result['error']}", file=sys.stderr)
+            results.append({'submitted':datetime.today().strftime("%Y/%m/%d %H:%M:%S"), 'job_name':submission_name, 'ntasks':len(job_names), 'job_names':list(job_names), 'is_array':is_array, **result})
+    
+    return results
+
+
+def record_submissions(results, fairb_path, job_root=None):
+    """
+    Append the submission results to the submissions csv of the project.
+    """
+    import csv
+    
+    if job_root is None:
+        job_root = Path(fairb_path) / 'code'
+        job_root.mkdir(exist_ok=True)
+    
+    submissions_path = Path(job_root) / 'submissions.csv'
+    is_new = not submissions_path.exists()
+    
+    with open(submissions_path, 'a', newline='') as submissions_file:
+        writer = csv.DictWriter(submissions_file, fieldnames=SUBMISSION_COLUMNS, extrasaction='ignore')
+        if is_new:
+            writer.writeheader()
+        writer.writerows(results)
+    
+    return str(submissions_path)
+
+
+def set_submitted(status_store, results, status_lockfile, placements={}):
+    """
+    Add a submitted status row with the scheduler job id (job_id.task_id
+    for array tasks) for each job that was submitted, with no job id and
+    qsub's output as traceback if it couldn't be parsed. Jobs pinned to a host
+    record its host, location and req_disk_gb, which stay reserved until
+    the job is dispatched.
+    """
+    from filelock import FileLock
+    
+    rows = []
+    for result in results:
+        if not result['queued']:
+            continue
+        for task_id, job_name in enumerate(result['job_names'], start=1):
+            if result['job_id'] is None:
+                job_id = None
+            else:
+                job_id = f"{result['job_id']}.{task_id}" if result['is_array'] else result['job_id']
+            rows.append({'job_name':job_name, 'job_id':job_id, 'status':'submitted', 'start':result['submitted'], 'traceback':result['error'], **placements.get(job_name, {})})
+    
+    if rows:
+        with FileLock(status_lockfile):
+            status_store.insert_many(rows)
+    
+    return None
+
+
+def reconcile_submissions(status_store, queue_command, status_lockfile):
+    """
+    Mark the submitted jobs that are no longer in the scheduler's queue, and
+    weren't dispatched by 'fairb run', as lost so they can be submitted
+    again. queue_command lists the queued and running jobs, one per line
+    starting with the scheduler job id (as qstat does).
+    Return the names of the lost jobs.
+    """
+    import shlex
+    from filelock import FileLock
+    
+    submitted_df = status_store.find(status='submitted')
+    if submitted_df.empty:
+        return []
+    
+    try:
+        result = subprocess.run(shlex.split(queue_command), capture_output=True, text=True)
+    except OSError as os_error:
+        print(f"Couldn't list the scheduler's queue with '{queue_command}': {os_error}", file=sys.stderr)
+        return []
+    if result.returncode != 0:
+        print(f"Couldn't list the scheduler's queue with '{queue_command}': {result.stderr.strip()}", file=sys.stderr)
+        return []
+    
+    queued_ids = set(QUEUE_JOB_ID_REGEX.findall(result.stdout))
+    # jobs queued without a parsable job id can't be looked up, they stay submitted
+    submitted_df = submitted_df[submitted_df['job_id'].notna()]
+    scheduler_ids = submitted_df['job_id'].astype(str).str.split('.').str[0]
+    lost_jobs = submitted_df.loc[~scheduler_ids.isin(queued_ids), 'job_name'].to_list()
+    
+    update = datetime.today().strftime("%Y/%m/%d %H:%M:%S")
+    with FileLock(status_lockfile):
+        for job_name in lost_jobs:
+            # a job dispatched since the queue was listed is no longer submitted, so it's kept
+            status_store.update({'job_name':job_name, 'status':'submitted'}, status='lost', update=update)
+    
+    if lost_jobs:
+        print(f"{len(lost_jobs)} submitted jobs are no longer queued, marked as lost.")
+    
+    return lost_jobs
+
+
+def print_summary(results, seconds):
+    """
+    Print how many jobs were submitted and how fast.
+    """
+    submitted = [result for result in results if result['queued']]
+    njobs = sum(result['ntasks'] for result in submitted)
+    nfailed = sum(result['ntasks'] for result in results if not result['queued'])
+    retried = sum(result['attempts'] > 1 for result in results)
+    
+    print(f"Submitted {njobs} jobs in {len(submitted)} qsub calls in {seconds:.1f} s ({njobs / seconds if seconds else 0:.1f} jobs/s, {len(submitted) / seconds if seconds else 0:.1f} qsub/s), {retried} retried, {nfailed} jobs failed.")
+    return None
+
+
+def render_jobs(fairb_project, jobs):
+    """
+    Return the rendered job config of the given jobs, with None for missing values.
+    """
+    import numpy as np
+    
+    return (fairb_project
+        .render_job_config(fairb_project.job_config_df.query("job_name.isin(@jobs)"))
+        .replace(np.nan, None)
+        )
+
+
+def job_submissions(job_config_df, fairb_path, exclude_hosts=None, placements={}):
+    """
+    Write the script of each job and return its (job_name, ntasks, qsub command) submission.
+    Jobs in placements are pinned to their host.
+    """
+    submissions = []
+    for _index, job in job_config_df.iterrows():
+        
+        script_path = write_script(job['job_name'], fairb_path)
+        
+        host = placements.get(job['job_name'], {}).get('host')
+        # a placed job is already kept away from the excluded hosts
+        cmd = qsub_command(job['queue'], job['slots'], job['vmem'], job['h_rt'], job['env_vars'], script_path, exclude_hosts=None if host else exclude_hosts, host=host)
+        submissions.append((job['job_name'], [job['job_name']], cmd))
+    
+    return submissions
+
+
+def capacity_model(fairb_project, probe_max_age, probe_local=False):
+    """
+    Return the disk capacity model of the hosts probed within probe_max_age
+    seconds (see fairb probe). With probe_local, this host is probed first.
+    """
+    from fairb.utils.capacity import CapacityModel, read_probes
+    
+    if probe_local:
+        from fairb.scripts.probe import ephemeral_patterns, probe
+        probe(fairb_project, ephemeral_patterns(fairb_project))
+    
+    return CapacityModel(
+        read_probes(fairb_project.probe_dir, probe_max_age),
+        fairb_project.status_store.find(status='ongoing'),
+        fairb_project.status_store.find(status='submitted')
+        )
+
+
+def place_jobs(model, job_config_df, exclude_hosts=()):
+    """
+    Place the jobs that require disk space on the host and ephemeral location
+    with the most room left. Jobs without req_disk_gb can run anywhere.
+    Return the placement of each placed job and the names of the jobs that
+    fit nowhere.
+    """
+    from fairb.utils.capacity import normalize_patterns
+    
+    placements = {}
+    held = []
+    for job_name, ephemeral_location, req_disk_gb in job_config_df[['job_name', 'ephemeral_location', 'req_disk_gb']].itertuples(index=False):
+        if req_disk_gb is None or float(req_disk_gb) <= 0:
+            continue
+        placement = model.place(float(req_disk_gb), normalize_patterns(ephemeral_location), exclude_hosts)
+        if placement is None:
+            held.append(job_name)
+        else:
+            placements[job_name] = {'host':placement[0], 'location':placement[1], 'req_disk_gb':float(req_disk_gb)}
+    
+    return placements, held
+
+
+def place_window(fairb_project, waiting, slots, exclude_hosts, args):
+    """
+    Render and place the waiting jobs in order until slots of them are
+    placed. Held jobs don't take a slot, the next waiting jobs are tried
+    instead. Return the rendered config and placements of the placed jobs,
+    and the names of the held jobs.
+    """
+    import pandas as pd
+    
+    model = capacity_model(fairb_project, args.probe_max_age, args.probe_local)
+    placed_dfs = []
+    placements = {}
+    held = []
+    nplaced = 0
+    position = 0
+    while nplaced < slots and position < len(waiting):
+        batch = waiting[position:position + slots - nplaced]
+        position += len(batch)
+        batch_df = render_jobs(fairb_project, batch)
+        batch_placements, batch_held = place_jobs(model, batch_df, exclude_hosts)
+        placements.update(batch_placements)
+        held += batch_held
+        placed_dfs.append(batch_df.query("not job_name.isin(@batch_held)"))
+        nplaced += len(placed_dfs[-1])
+    
+    return pd.concat(placed_dfs, ignore_index=True), placements, held
+
+
+def busy_hosts(ongoing_df, max_per_host=None, max_per_location=None):
+    """
+    Hosts running max_per_host ongoing jobs, or with an ephemeral location
+    holding max_per_location ongoing jobs.
+    """
+    hosts = set()
+    if max_per_host is not None:
+        jobs_per_host = ongoing_df['host'].value_counts()
+        hosts |= set(jobs_per_host[jobs_per_host >= max_per_host].index)
+    if max_per_location is not None:
+        jobs_per_location = ongoing_df.groupby(['host', 'location']).size()
+        hosts |= {host for (host, _location), njobs in jobs_per_location.items() if njobs >= max_per_location}
+    
+    return sorted(hosts)
+
+
+def follow(fairb_project, jobs, fairb_path, args):
+    """
+    Keep at most max_inflight submitted jobs that haven't finished, topping
+    them up from the given jobs that are available every poll seconds, until
+    every job has been submitted once and finished. New jobs are kept away
+    from busy hosts.
+    """
+    # job name -> submission time of the jobs in flight
+    inflight = {}
+    submitted = set()
+    results = []
+    since = datetime.today().strftime("%Y/%m/%d %H:%M:%S")
+    start = time.perf_counter()
+    
+    while True:
+        if args.queue_command:
+            reconcile_submissions(fairb_project.status_store, args.queue_command, fairb_project.status_lockfile)
+        
+        # a job lands once it has a finished status row since its submission
+        changed_df = fairb_project.status_store.changed_since(since).query("status.isin(@FINISHED_STATUS)")
+        for job_name, started, updated in changed_df[['job_name', 'start', 'update']].fillna('').itertuples(index=False):
+            if job_name in inflight and max(str(started), str(updated)) >= inflight[job_name]:
+                del inflight[job_name]
+        
+        available_jobs = set(fairb_project.get_available_jobs())
+        waiting = [job for job in jobs if job in available_jobs and job not in submitted]
+        slots = max(args.max_inflight - len(inflight), 0)
+        
+        new_jobs = []
+        held = []
+        if slots and waiting:
+            exclude_hosts = busy_hosts(fairb_project.status_store.find(status='ongoing'), args.max_per_host, args.max_per_location)
+            placements = {}
+            if args.place:
+                # held jobs wait for disk space to be freed
+                job_config_df, placements, held = place_window(fairb_project, waiting, slots, exclude_hosts, args)
+            else:
+                job_config_df = render_jobs(fairb_project, waiting[:slots])
+            new_jobs = job_config_df['job_name'].to_list()
+        
+        if new_jobs:
+            submission_results = sendjobs(job_submissions(job_config_df, fairb_path, exclude_hosts, placements), args.max_concurrent, args.retries, args.backoff)
+            set_submitted(fairb_project.status_store, submission_results, fairb_project.status_lockfile, placements)
+            record_submissions(submission_results, fairb_path)
+            
+            for result in submission_results:
+                submitted.add(result['job_name'])
+                if result['queued']:
+                    inflight[result['job_name']] = result['submitted']
+            results += submission_results
+        
+        print(f"{datetime.today():%H:%M:%S} {len(inflight)} jobs in flight, {len(waiting) - len(new_jobs)} waiting ({len(held)} without disk space).")
+        # every job was submitted or is held, with no job in flight to free disk space
+        if not inflight and len(new_jobs) + len(held) == len(waiting):
+            if held:
+                print(f"{len(held)} jobs held back, no probed host has enough disk space and no submitted job will free any.")
+            break
+        time.sleep(args.poll)
+    
+    print_summary(results, time.perf_counter() - start)
+    
+    return None
+
+
 def main(args):
     
     parser = ArgumentParser(
@@ -93,14 +500,51 @@ def main(args):
     njobs.add_argument('-a','--all', action='store_true', help="Submit all available jobs.")
     
     parser.add_argument('-c','--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+    
+    # array jobs
+    parser.add_argument('--array', action='store_true', help="Submit jobs with the same resources as a single array job.")
+    parser.add_argument('--tc', type=int, help="Maximum number of concurrently running tasks of each array job.")
+    
+    # submission
+    parser.add_argument('--max_concurrent', type=int, default=8, help="Maximum number of qsub calls running at once.")
+    parser.add_argument('--retries', type=int, default=3, help="Number of times a failed qsub call is retried.")
+    parser.add_argument('--backoff', type=float, default=1.0, help="Seconds to wait before the first retry, doubled on every retry.")
+    
+    # throttled submission
+    parser.add_argument('--follow', action='store_true', help="Keep submitting the available jobs as the submitted ones finish, with at most --max_inflight jobs submitted but not finished.")
+    parser.add_argument('--max_inflight', type=int, default=100, help="Maximum number of submitted jobs that haven't finished, with --follow.")
+    parser.add_argument('--max_per_host', type=int, help="Don't submit to hosts running this many jobs, with --follow.")
+    parser.add_argument('--max_per_location', type=int, help="Don't submit to hosts with an ephemeral location holding this many jobs, with --follow.")
+    parser.add_argument('--poll', type=float, default=30, help="Seconds between checks of the job status, with --follow.")
+    
+    # disk-aware placement
+    parser.add_argument('--place', action='store_true', help="Pin jobs with req_disk_gb to probed hosts with enough disk space (see fairb probe), and hold back the jobs that don't fit anywhere.")
+    parser.add_argument('--probe_max_age', type=int, default=900, help="Ignore probes older than this many seconds, with --place.")
+    parser.add_argument('--probe_local', action='store_true', help="Probe this host before placing jobs, with --place.")
+    
+    # submitted jobs
+    parser.add_argument('--queue_command', type=str, default='qstat', help="Command listing the scheduler's queued and running jobs, one per line starting with the job id. Submitted jobs that aren't listed become available again. An empty string skips the check.")
     args = parser.parse_args(args)
     
+    assert args.tc is None or args.array, "--tc can only be used with --array."
+    assert not (args.follow and args.array), "--follow submits single jobs, it can't be used with --array."
+    assert args.follow or (args.max_per_host is None and args.max_per_location is None), "--max_per_host and --max_per_location can only be used with --follow."
+    assert not (args.place and args.array), "--place pins single jobs, it can't be used with --array."
+    assert args.place or not args.probe_local, "--probe_local can only be used with --place."
+    
 
     # read fairb project    
     fairb_json = Path(args.fairb) / 'fairb.json'
-    fairb_project = FairB.from_json(fairb_json)
-    fairb_project.read_job_config()
+    fairb_project = FairB.from_json(fairb_json, read_only=True)
+    fairb_project.read_job_config(columns=fairb_project.job_config_columns(JOB_CONFIG_FIELDS))
     fairb_project.read_job_status()
+    
+    # create lockfiles
+    status_lockfile, push_lockfile = fairb_project._create_lockfiles()
+    
+    # submitted jobs that left the queue without running can be submitted again
+    if args.queue_command:
+        reconcile_submissions(fairb_project.status_store, args.queue_command, status_lockfile)
         
     # get jobs
     available_jobs = fairb_project.get_available_jobs()
@@ -114,22 +558,44 @@ def main(args):
             jobs = available_jobs[:args.njobs]
         else:
             jobs = available_jobs
-                   
-    job_config_df = (fairb_project.job_config_df
-        .query("job_name.isin(@jobs)")
-        .replace(np.nan, None)
-        )
     
-    # create lockfiles
-    status_lockfile, push_lockfile = fairb_project._create_lockfiles()
+    if args.follow:
+        return follow(fairb_project, jobs, args.fairb, args)
     
-    # create scripts and submit jobs
-    for _index, job in job_config_df.iterrows():
-        
-        script_path = write_script(job['job_name'], args.fairb)
+    job_config_df = render_jobs(fairb_project, jobs)
+    
+    # create scripts and qsub commands
+    submissions = []
+    if args.array:
+        import pandas as pd
         
+        resources = ['queue', 'slots', 'vmem', 'h_rt', 'env_vars']
+        array_script_path = write_array_script(args.fairb)
+        # submissions started within the same second differ by their pid
+        submission_id = f'{datetime.today():%Y%m%d%H%M%S}-{os.getpid()}'
         
-        sendjob(job['queue'], job['slots'], job['vmem'], job['h_rt'], job['env_vars'], script_path)
+        for index, (group, group_df) in enumerate(job_config_df.groupby(resources, dropna=False, sort=False)):
+            
+            queue, slots, vmem, h_rt, env_vars = [None if pd.isna(value) else value for value in group]
+            manifest_path = write_task_manifest(group_df['job_name'], args.fairb, f'array-{submission_id}-{index}')
+            
+            cmd = qsub_command(queue, slots, vmem, h_rt, env_vars, array_script_path, ntasks=len(group_df), tc=args.tc, script_args=[manifest_path])
+            submissions.append((Path(manifest_path).stem, group_df['job_name'].to_list(), cmd))
+    else:
+        placements = {}
+        if args.place:
+            placements, held = place_jobs(capacity_model(fairb_project, args.probe_max_age, args.probe_local), job_config_df)
+            if held:
+                print(f"{len(held)} jobs held back, no probed host has enough disk space.")
+            job_config_df = job_config_df.query("not job_name.isin(@held)")
+        submissions = job_submissions(job_config_df, args.fairb, placements=placements)
+    
+    # submit jobs
+    start = time.perf_counter()
+    results = sendjobs(submissions, args.max_concurrent, args.retries, args.backoff)
+    set_submitted(fairb_project.status_store, results, status_lockfile, placements={} if args.array else placements)
+    record_submissions(results, args.fairb)
+    print_summary(results, time.perf_counter() - start)
 
 
 
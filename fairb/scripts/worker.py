@@ -0,0 +1,89 @@
+"""
+Pilot job that drains available fairb jobs within a single cluster slot.
+Author: Diego Ramírez González
+
+Submit it like any other job script, e.g. a script with
+`fairb worker --fairb /path/to/.fairb --walltime 24:00:00`, and it will keep
+claiming and running available jobs until there are none left for
+--idle_timeout seconds or the next job might not finish within --walltime.
+"""
+
+import time
+import traceback
+from argparse import ArgumentParser
+from pathlib import Path
+
+
+def h_rt_to_seconds(h_rt):
+    """
+    Convert an SGE h_rt string (HH:MM:SS or seconds) to seconds.
+    """
+    seconds = 0
+    for part in str(h_rt).split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def main(args):
+
+    from fairb.core import FairB
+    from fairb.scripts.run import get_jobs_value, run_job
+
+    parser = ArgumentParser(
+        description="Run available fairb jobs one after another within the same process."
+    )
+    parser.add_argument('-c', '--fairb', type=str, help="Path to the fairb project containing the fairb.json file. Defaults to the current working directory", default='.')
+    parser.add_argument('--walltime', type=str, help="Wall-clock budget of the worker (HH:MM:SS), usually the h_rt of its slot. No new job is started if it might not finish within it.")
+    parser.add_argument('--margin', type=int, help="Seconds kept free at the end of the walltime.", default=600)
+    parser.add_argument('--idle_timeout', type=int, help="Exit after this many seconds without available jobs.", default=300)
+    parser.add_argument('--poll', type=int, help="Seconds between checks for available jobs.", default=30)
+    parser.add_argument('--max_jobs', type=int, help="Maximum number of jobs to run.")
+    parser.add_argument('--get_jobs', type=get_jobs_value, help="Number of parallel transfers when getting the inputs of a job, or 'auto'.", default='auto')
+    args = parser.parse_args(args)
+
+    fairb = FairB.from_json(Path(args.fairb) / 'fairb.json', read_only=True)
+    # jobs are looked up one by one when they run
+    fairb.read_job_config(columns=['job_name'])
+
+    budget = None if args.walltime is None else h_rt_to_seconds(args.walltime) - args.margin
+
+    start = time.monotonic()
+    last_job = start
+    longest_job = 0
+    attempted = set()
+    n_jobs = 0
+
+    while args.max_jobs is None or n_jobs < args.max_jobs:
+
+        # don't start a job that might outlive the slot
+        if budget is not None and time.monotonic() - start + longest_job > budget:
+            print("Wall-clock budget reached.")
+            break
+
+        ran = False
+        for job_name in fairb.get_available_jobs():
+            # failed jobs are left for a later worker
+            if job_name in attempted:
+                continue
+
+            job_start = time.monotonic()
+            try:
+                ran = run_job(fairb, job_name, claim=True, get_jobs=args.get_jobs)
+            except Exception:
+                traceback.print_exc()
+                ran = True
+
+            if ran:
+                attempted.add(job_name)
+                longest_job = max(longest_job, time.monotonic() - job_start)
+                last_job = time.monotonic()
+                n_jobs += 1
+                break
+
+        if not ran:
+            if time.monotonic() - last_job > args.idle_timeout:
+                print("No available jobs left.")
+                break
+            time.sleep(args.poll)
+
+    print(f"Worker ran {n_jobs} jobs in {time.monotonic() - start:.0f} seconds.")
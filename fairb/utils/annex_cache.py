@@ -0,0 +1,200 @@
+from pathlib import Path
+from functools import lru_cache
+import hashlib
+import json
+import os
+import subprocess
+
+# symlinks of locked annexed files point into the annex objects of their repository
+ANNEX_OBJECTS = os.path.join('.git', 'annex', 'objects')
+STATS = ('hits', 'misses', 'bytes_hit', 'bytes_stored', 'evicted')
+# hash of the annex key backends, others (e.g. WORM, URL) only have their size checked
+KEY_HASHES = {'MD5':'md5', 'SHA1':'sha1', 'SHA224':'sha224', 'SHA256':'sha256', 'SHA384':'sha384', 'SHA512':'sha512', 'BLAKE2B256':'blake2b'}
+
+
+def link_or_copy(source, target):
+    "Hardlink source to target, or copy it (as a reflink where supported) across file systems."
+    try:
+        os.link(source, target)
+    except OSError:
+        subprocess.run(['cp', '--reflink=auto', str(source), str(target)], check=True)
+    return None
+
+
+def verify_key(path, key, full=True):
+    """
+    Whether the content of a file matches an annex key: its size and, if
+    full, its hash.
+    """
+    # e.g. SHA256E-s1234--<hash>.sif
+    fields, _sep, key_name = key.partition('--')
+    backend, *fields = fields.split('-')
+    sizes = [field[1:] for field in fields if field.startswith('s') and field[1:].isdigit()]
+    if sizes and os.path.getsize(path) != int(sizes[0]):
+        return False
+
+    algorithm = KEY_HASHES.get(backend.removesuffix('E'))
+    if not full or algorithm is None:
+        return True
+
+    # extension backends append the file extension to the hash
+    expected = key_name.split('.')[0] if backend.endswith('E') else key_name
+    digest = hashlib.new(algorithm, digest_size=32) if algorithm == 'blake2b' else hashlib.new(algorithm)
+    with open(path, 'rb') as content:
+        for block in iter(lambda: content.read(2**24), b''):
+            digest.update(block)
+    return digest.hexdigest() == expected
+
+
+def annexed_object(path):
+    """
+    Key, object path and repository of a locked annexed file, None if the
+    path isn't one.
+    """
+    if not os.path.islink(path):
+        return None
+    target = os.readlink(path)
+    if ANNEX_OBJECTS not in target:
+        return None
+    object_path = os.path.normpath(os.path.join(os.path.dirname(path), target))
+    repository = object_path.split(os.sep + ANNEX_OBJECTS)[0]
+    return os.path.basename(object_path), object_path, repository
+
+
+@lru_cache
+def annex_uuid(repository):
+    "Annex uuid of a repository."
+    return subprocess.run(['git', '-C', repository, 'config', 'annex.uuid'], capture_output=True, text=True).stdout.strip()
+
+
+def link_annexed(path, source):
+    """
+    Link source as the object of a locked annexed file that isn't present in
+    its repository, and mark it present there.
+    """
+    key, object_path, repository = annexed_object(path)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    link_or_copy(source, object_path)
+    subprocess.run(['git', '-C', repository, 'annex', 'setpresentkey', key, annex_uuid(repository), '1'], check=True)
+    return None
+
+
+def annexed_files(ds_path, paths):
+    "Unique locked annexed files among paths of a dataset, or within its directories."
+    files = []
+    for path in paths:
+        path = os.path.join(ds_path, path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, dir_files in os.walk(path):
+                dirs[:] = [directory for directory in dirs if directory != '.git']
+                files += [os.path.join(root, file) for file in dir_files]
+        else:
+            files.append(path)
+    return [file for file in dict.fromkeys(files) if annexed_object(file) is not None]
+
+
+class AnnexCache:
+    """
+    Node-local, content-addressed cache of git-annex objects shared by the
+    job clones of a host. Objects are stored by annex key, linked into clones
+    instead of downloaded, and the least recently used ones are evicted once
+    the cache holds more than max_gb.
+    """
+    def __init__(self, root, max_gb):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.max_bytes = max_gb * 2**30
+        self.lockfile = str(self.root / 'cache.lock')
+        self.stats_file = self.root / 'stats.json'
+        self.objects.mkdir(parents=True, exist_ok=True)
+
+    def _update_stats(self, **counts):
+        "Add to the counters of the cache, the caller holds its lock."
+        stats = json.loads(self.stats_file.read_text()) if self.stats_file.exists() else {}
+        stats = {stat:stats.get(stat, 0) + counts.get(stat, 0) for stat in STATS}
+        tmp_file = self.stats_file.with_suffix(f'.tmp{os.getpid()}')
+        tmp_file.write_text(json.dumps(stats))
+        os.replace(tmp_file, self.stats_file)
+        return stats
+
+    def stats(self):
+        "Counters of the cache across every job of the host."
+        return json.loads(self.stats_file.read_text()) if self.stats_file.exists() else {stat:0 for stat in STATS}
+
+    def populate(self, files):
+        """
+        Link the cached objects of annexed files into their clone and mark
+        them present there. Return the number of hits and misses and the
+        bytes linked.
+        """
+        from filelock import FileLock
+
+        hits, misses, bytes_hit = 0, 0, 0
+        for path in files:
+            key, object_path, _repository = annexed_object(path)
+            if os.path.exists(object_path):
+                continue
+            cached = self.objects / key
+            # a truncated object would be marked present in the clone
+            try:
+                is_cached = verify_key(cached, key, full=False)
+            except OSError:
+                is_cached = False
+            if not is_cached:
+                misses += 1
+                continue
+            try:
+                link_annexed(path, cached)
+            except (OSError, subprocess.CalledProcessError):
+                # evicted meanwhile
+                misses += 1
+                continue
+            # the last use decides the eviction order
+            try:
+                os.utime(cached)
+            except OSError:
+                pass
+            hits += 1
+            bytes_hit += os.path.getsize(object_path)
+
+        with FileLock(self.lockfile):
+            self._update_stats(hits=hits, misses=misses, bytes_hit=bytes_hit)
+        return hits, misses, bytes_hit
+
+    def store(self, files):
+        """
+        Add the objects of annexed files that aren't cached yet, or whose
+        cached copy doesn't have the size of their key, then evict
+        the least recently used objects beyond the size cap.
+        Return the bytes stored.
+        """
+        from filelock import FileLock
+
+        bytes_stored = 0
+        with FileLock(self.lockfile):
+            for path in files:
+                key, object_path, _repository = annexed_object(path)
+                cached = self.objects / key
+                if not os.path.exists(object_path) or (cached.exists() and verify_key(cached, key, full=False)):
+                    continue
+                # readers never see a partially copied object
+                tmp_file = self.objects / f'.{key}.tmp{os.getpid()}'
+                link_or_copy(object_path, tmp_file)
+                os.replace(tmp_file, cached)
+                bytes_stored += cached.stat().st_size
+            evicted = self._evict()
+            self._update_stats(bytes_stored=bytes_stored, evicted=evicted)
+        return bytes_stored
+
+    def _evict(self):
+        "Remove the least recently used objects beyond the size cap, the caller holds the lock."
+        objects = [(stat.st_mtime, stat.st_size, path) for path in self.objects.iterdir() if not path.name.startswith('.') for stat in [path.stat()]]
+        total = sum(size for _mtime, size, _path in objects)
+        evicted = 0
+        for _mtime, size, path in sorted(objects):
+            if total <= self.max_bytes:
+                break
+            path.unlink()
+            total -= size
+            evicted += 1
+        return evicted
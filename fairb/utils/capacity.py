@@ -0,0 +1,124 @@
+from pathlib import Path
+from datetime import datetime
+import json
+import os
+
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+TMP_LOCATION = '/tmp'
+
+
+def normalize_patterns(ephemeral_location):
+    "Ephemeral location patterns of a job config value, /tmp if there are none."
+    if not isinstance(ephemeral_location, str) or not ephemeral_location.split():
+        return [TMP_LOCATION]
+    return [TMP_LOCATION if pattern == '/tmp/' else pattern for pattern in ephemeral_location.split()]
+
+
+def write_probe(probe_dir, host, locations, probed=None):
+    """
+    Write the probe of a host, a list of {'pattern', 'location', 'free_gb'}
+    dictionaries, as probe_dir/<host>.json.
+    """
+    if probed is None:
+        probed = datetime.today().strftime(TIME_FORMAT)
+    probe_file = Path(probe_dir) / f'{host}.json'
+    probe_file.parent.mkdir(parents=True, exist_ok=True)
+    # readers never see a partially written probe
+    tmp_file = probe_file.with_suffix(f'.tmp{os.getpid()}')
+    tmp_file.write_text(json.dumps({'host':host, 'probed':probed, 'locations':locations}))
+    os.replace(tmp_file, probe_file)
+    return str(probe_file)
+
+
+def read_probes(probe_dir, max_age=None, now=None):
+    "Probes of probe_dir written at most max_age seconds ago."
+    if now is None:
+        now = datetime.today()
+    probes = []
+    for probe_file in sorted(Path(probe_dir).glob('*.json')):
+        try:
+            probe = json.loads(probe_file.read_text())
+            probed = datetime.strptime(probe['probed'], TIME_FORMAT)
+        except (OSError, ValueError, KeyError):
+            continue
+        if max_age is None or (now - probed).total_seconds() <= max_age:
+            probes.append(probe)
+    return probes
+
+
+class CapacityModel:
+    """
+    Disk space available for new jobs on each host and ephemeral location:
+    the free space of its latest probe minus what ongoing jobs reserved and
+    haven't used yet, and what jobs submitted to it reserved.
+
+    Placement follows fairb run: /tmp if the job fits there, otherwise the
+    location of its patterns with the most available space. Among the hosts
+    where the job fits, the one with the most space left is chosen.
+    """
+    def __init__(self, probes, ongoing_df=None, submitted_df=None):
+        # (host, location) -> available gb
+        self.available = {}
+        # host -> pattern -> locations
+        self.locations = {}
+        for probe in probes:
+            for entry in probe['locations']:
+                pattern = TMP_LOCATION if entry['pattern'] == '/tmp/' else entry['pattern']
+                self.available[(probe['host'], entry['location'])] = float(entry['free_gb'])
+                self.locations.setdefault(probe['host'], {}).setdefault(pattern, []).append(entry['location'])
+
+        # ongoing jobs will still use what they reserved and haven't used yet
+        if ongoing_df is not None:
+            for host, location, req_disk_gb, total_disk_gb in ongoing_df[['host', 'location', 'req_disk_gb', 'total_disk_gb']].itertuples(index=False):
+                self._reserve(host, location, _gb(req_disk_gb) - _gb(total_disk_gb))
+        # jobs placed by an earlier submit will use all they reserved
+        if submitted_df is not None:
+            for host, location, req_disk_gb in submitted_df[['host', 'location', 'req_disk_gb']].itertuples(index=False):
+                self._reserve(host, location, _gb(req_disk_gb))
+
+    def _reserve(self, host, location, disk_gb):
+        if (host, location) in self.available and disk_gb > 0:
+            self.available[(host, location)] -= disk_gb
+        return None
+
+    @property
+    def hosts(self):
+        return sorted(self.locations)
+
+    def _host_location(self, host, req_disk_gb, patterns):
+        "Location fairb run would pick on a host, None if the job doesn't fit."
+        host_locations = self.locations.get(host, {})
+        if TMP_LOCATION in patterns and req_disk_gb < self.available.get((host, TMP_LOCATION), float('-inf')):
+            return TMP_LOCATION
+        candidates = [location for pattern in patterns if pattern != TMP_LOCATION for location in host_locations.get(pattern, [])]
+        if not candidates:
+            return None
+        location = max(candidates, key=lambda location_: self.available[(host, location_)])
+        return location if req_disk_gb < self.available[(host, location)] else None
+
+    def place(self, req_disk_gb, patterns, exclude_hosts=()):
+        """
+        Reserve req_disk_gb for a job on the host and location with the most
+        space left. Return the (host, location), None if it fits nowhere.
+        """
+        placements = []
+        for host in self.hosts:
+            if host in exclude_hosts:
+                continue
+            location = self._host_location(host, req_disk_gb, patterns)
+            if location is not None:
+                placements.append((self.available[(host, location)], host, location))
+        if not placements:
+            return None
+        _available, host, location = max(placements)
+        self.available[(host, location)] -= req_disk_gb
+        return host, location
+
+
+def _gb(value):
+    "Disk space of a status value, 0 if missing."
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if value != value else value
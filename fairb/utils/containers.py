@@ -0,0 +1,108 @@
+from pathlib import Path
+from datetime import datetime
+import csv
+import os
+import subprocess
+import time
+
+from fairb.utils.annex_cache import annexed_object, link_annexed, link_or_copy, verify_key
+
+METRICS_COLUMNS = ['time', 'host', 'container', 'key', 'event', 'wait_s', 'stage_s', 'bytes']
+
+
+class ContainerImageError(Exception):
+    """An exception for a container image whose content doesn't match its annex key."""
+    pass
+
+
+def container_image(ds_path, container_name):
+    """
+    Path of a container's image relative to a dataset, from the datalad
+    config of the dataset or, for 'subdataset/name', of that subdataset.
+    None if the container isn't configured.
+    """
+    candidates = [('', container_name)]
+    if '/' in container_name:
+        candidates.append(tuple(container_name.rsplit('/', 1)))
+
+    for subdataset, name in candidates:
+        config = Path(ds_path) / subdataset / '.datalad' / 'config'
+        if not config.exists():
+            continue
+        result = subprocess.run(['git', 'config', '-f', str(config), f'datalad.containers.{name}.image'], capture_output=True, text=True)
+        if result.returncode == 0 and result.stdout.strip():
+            return os.path.join(subdataset, result.stdout.strip())
+    return None
+
+
+def record_metrics(stage_root, row):
+    "Append a staging event to the staging.csv of the stage directory."
+    metrics_file = Path(stage_root) / 'staging.csv'
+    is_new = not metrics_file.exists()
+    with open(metrics_file, 'a', newline='') as metrics:
+        writer = csv.DictWriter(metrics, fieldnames=METRICS_COLUMNS)
+        if is_new:
+            writer.writeheader()
+        writer.writerow(row)
+    return None
+
+
+def stage_container(ds_path, container_name, stage_root):
+    """
+    Make the image of a container present in a dataset from a node-local
+    staged copy. The first job of a node gets the image, verifies it against
+    its annex key and stages it under a lock, while the others wait for it
+    and then link the staged copy into their clone, so that containers_run
+    finds the image already there.
+    Return the staging event, None if the image isn't annexed.
+    """
+    import datalad.api as dl
+    from filelock import FileLock
+
+    start = time.perf_counter()
+    image = container_image(ds_path, container_name)
+    if image is None and '/' in container_name:
+        # the subdataset holding the container might not be installed yet
+        dl.get(str(Path(ds_path) / container_name.rsplit('/', 1)[0]), dataset=ds_path, get_data=False, result_renderer='disabled')
+        image = container_image(ds_path, container_name)
+    if image is None:
+        print(f"No image configured for container {container_name}, not staged.")
+        return None
+
+    image_path = str(Path(ds_path) / image)
+    if not os.path.lexists(image_path):
+        # install the subdataset holding the image (e.g. inputs/containers) without getting it
+        dl.get(image_path, dataset=ds_path, get_data=False, result_renderer='disabled')
+    annexed = annexed_object(image_path)
+    if annexed is None:
+        print(f"Container image {image} isn't a locked annexed file, not staged.")
+        return None
+    key, object_path, _repository = annexed
+
+    stage_root = Path(stage_root)
+    stage_root.mkdir(parents=True, exist_ok=True)
+    staged = stage_root / key
+
+    with FileLock(f'{staged}.lock'):
+        wait_s = time.perf_counter() - start
+        if staged.exists() and verify_key(staged, key, full=False):
+            event = 'hit'
+        else:
+            event = 'miss'
+            dl.get(image_path, dataset=ds_path, result_renderer='disabled')
+            if not verify_key(object_path, key):
+                raise ContainerImageError(f"The content of {image} doesn't match its key {key}.")
+            tmp_file = stage_root / f'.{key}.tmp{os.getpid()}'
+            link_or_copy(object_path, tmp_file)
+            os.replace(tmp_file, staged)
+
+        if not os.path.exists(object_path):
+            link_annexed(image_path, staged)
+
+        stage_s = time.perf_counter() - start - wait_s
+        row = {'time':datetime.today().strftime("%Y/%m/%d %H:%M:%S"), 'host':os.uname().nodename, 'container':container_name, 'key':key, 'event':event, 'wait_s':round(wait_s, 3), 'stage_s':round(stage_s, 3), 'bytes':staged.stat().st_size}
+        record_metrics(stage_root, row)
+
+    print(f"Container image {image}: staged copy {event}, waited {wait_s:.1f} s for the lock, staged in {stage_s:.1f} s ({row['bytes'] / 2**30:.2f} gb).")
+
+    return row
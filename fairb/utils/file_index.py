@@ -0,0 +1,143 @@
+from pathlib import Path
+import os
+import re
+import subprocess
+import threading
+
+
+def _head_sha(repo_path):
+    "Commit checked out in a git repository, None if it isn't one."
+    result = subprocess.run(['git', '-C', str(repo_path), 'rev-parse', '--verify', '-q', 'HEAD'], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+
+def _list_tree(repo_path, sha, cache_dir):
+    """
+    Files and subdataset paths of a commit, relative to its repository.
+    The listing of each commit is cached in cache_dir, so only repositories
+    that moved are listed again.
+    """
+    cache_file = Path(cache_dir) / f'{sha}.tree'
+    if cache_file.exists():
+        entries = cache_file.read_bytes().decode().split('\0')[:-1]
+    else:
+        result = subprocess.run(['git', '-C', str(repo_path), 'ls-tree', '-r', '-z', '--full-tree', sha], capture_output=True, check=True)
+        # "<mode> <type> <object>\t<path>" -> "<type>\t<path>"
+        entries = [entry.split(' ', 2)[1] + '\t' + entry.split('\t', 1)[1] for entry in result.stdout.decode().split('\0') if entry]
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f'.tmp{os.getpid()}')
+        tmp_file.write_bytes(''.join(f'{entry}\0' for entry in entries).encode())
+        os.replace(tmp_file, cache_file)
+
+    files, subdatasets = [], []
+    for entry in entries:
+        object_type, path = entry.split('\t', 1)
+        (subdatasets if object_type == 'commit' else files).append(path)
+    return files, subdatasets
+
+
+def _component_regex(component):
+    "Regular expression of a glob pattern component."
+    regex = ''
+    i = 0
+    while i < len(component):
+        char = component[i]
+        end = component.find(']', i + 2)
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[' and end != -1:
+            char_class = component[i + 1:end]
+            if char_class.startswith('!'):
+                char_class = '^' + char_class[1:]
+            regex += '[' + char_class.replace('\\', '\\\\') + ']'
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+def glob_to_regex(pattern):
+    """
+    Translate a pathlib glob pattern into a regular expression over relative
+    paths. '*', '?' and '[...]' match within a path component and '**'
+    matches any number of directories.
+    """
+    components = [component for component in pattern.strip('/').split('/') if component not in ('', '.')]
+    regex = ''
+    for i, component in enumerate(components):
+        is_last = i == len(components) - 1
+        if component != '**':
+            regex += _component_regex(component) + ('' if is_last else '/')
+        elif not is_last:
+            regex += '(?:[^/]+/)*'
+        elif regex:
+            # a trailing '**' matches the directory and all its subdirectories
+            regex = regex[:-1] + '(?:/[^/]+)*'
+        else:
+            regex = '[^/]+(?:/[^/]+)*'
+    return re.compile(regex + r'\Z')
+
+
+class FileIndex:
+    """
+    Paths of a super dataset and its installed subdatasets, read from git
+    instead of the file system. Files tracked in git count as present even
+    when their annexed content isn't, and uninstalled subdatasets only count
+    as an empty directory.
+    """
+    def __init__(self, super_dataset_path, cache_dir):
+        self.super_dataset_path = Path(super_dataset_path)
+        self.cache_dir = Path(cache_dir)
+        self._files = None
+        self._directories = None
+        self._lock = threading.Lock()
+
+    def _build(self, repo_path=None, prefix=''):
+        "Add the paths of a repository and its installed subdatasets to the index."
+        repo_path = self.super_dataset_path if repo_path is None else repo_path
+        sha = _head_sha(repo_path)
+        if sha is None:
+            return None
+
+        files, subdatasets = _list_tree(repo_path, sha, self.cache_dir)
+        self._files.update(prefix + path for path in files)
+        for subdataset in subdatasets:
+            self._directories.add(prefix + subdataset)
+            subdataset_path = repo_path / subdataset
+            if (subdataset_path / '.git').exists():
+                self._build(subdataset_path, f'{prefix}{subdataset}/')
+        return None
+
+    def _load(self):
+        "Build the index on first use."
+        with self._lock:
+            if self._files is None:
+                self._files, self._directories = set(), set()
+                if _head_sha(self.super_dataset_path) is None:
+                    raise ValueError(f"{self.super_dataset_path} is not a git repository, can't index its files.")
+                self._build()
+                for path in list(self._files) + list(self._directories):
+                    parent = os.path.dirname(path)
+                    while parent and parent not in self._directories:
+                        self._directories.add(parent)
+                        parent = os.path.dirname(parent)
+        return None
+
+    def glob(self, pattern):
+        "Sorted paths matching a glob pattern, relative to the super dataset."
+        self._load()
+        regex = glob_to_regex(pattern)
+        # like pathlib, patterns ending in '**' or '/' only match directories
+        paths = self._directories if pattern.rstrip('/').endswith('**') or pattern.endswith('/') else self._files | self._directories
+        return sorted(path for path in paths if regex.match(path))
+
+    def exists(self, path):
+        "Whether a path relative to the super dataset is a file or directory of the index."
+        self._load()
+        path = os.path.normpath(str(path))
+        return path in self._files or path in self._directories
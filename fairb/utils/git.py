@@ -1,5 +1,6 @@
 from pathlib import Path
 import subprocess
+import time
 
 # Functions for cloning and checking out
 def do_dead_annex(dpath='cwd'):
@@ -28,11 +29,14 @@ def do_checkout(branch_name, dpath='cwd', create_branch=True):
     subprocess.run(cmd)
     
     
-def get_private_subdataset(clone_target, sd_path, sd_id):
+def get_private_subdataset(clone_target, sd_path, sd_id, reference=None):
     # Assume clone_target is a RIA store
     clone_path = str(Path(clone_target) / Path(sd_id[:3]) / Path(sd_id[3:]))
     
-    git_clone_command = ['git', 'clone', clone_path, sd_path]
+    git_clone_command = ['git', 'clone']
+    if reference is not None:
+        git_clone_command += [f'--reference-if-able={reference}']
+    git_clone_command += [clone_path, sd_path]
     subprocess.run(git_clone_command)
     
     git_config_annex_private = ['git', '-C', sd_path, 'config', 'annex.private', 'true']
@@ -42,6 +46,54 @@ def get_private_subdataset(clone_target, sd_path, sd_id):
     subprocess.run(git_annex_init)
 
 
+def update_mirror(source_path, mirror_path, max_age=60):
+    """
+    Create or refresh a bare mirror of a git repository.
+    The mirror is fetched under a lock, at most once every max_age seconds.
+    Return None if the mirror couldn't be created, a stale mirror if it
+    couldn't be fetched.
+    """
+    from filelock import FileLock
+    import shutil
+    
+    mirror_path = Path(mirror_path)
+    mirror_path.parent.mkdir(parents=True, exist_ok=True)
+    fetched_file = mirror_path / 'fairb_fetched'
+    
+    with FileLock(f'{mirror_path}.lock'):
+        if not mirror_path.exists():
+            result = subprocess.run(['git', 'clone', '--mirror', '--quiet', str(source_path), str(mirror_path)], capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"Warning: couldn't create the mirror of {source_path}, cloning without it: {result.stderr.strip()}")
+                # a partial mirror would be fetched instead of cloned next time
+                shutil.rmtree(mirror_path, ignore_errors=True)
+                return None
+            # ephemeral clones borrow objects from the mirror, never prune them
+            subprocess.run(['git', '-C', str(mirror_path), 'config', 'gc.auto', '0'])
+            fetched_file.touch()
+        elif not fetched_file.exists() or time.time() - fetched_file.stat().st_mtime > max_age:
+            result = subprocess.run(['git', '-C', str(mirror_path), 'fetch', '--quiet', 'origin'], capture_output=True, text=True)
+            if result.returncode != 0:
+                # the mirror is fetched again next time
+                print(f"Warning: couldn't fetch the mirror {mirror_path}, using it as it is: {result.stderr.strip()}")
+            else:
+                fetched_file.touch()
+    
+    return str(mirror_path)
+
+
+def get_mirror(clone_target, ds_id, mirror_root, max_age=60):
+    """
+    Return the path of the node-local mirror of a dataset within a RIA store,
+    creating or refreshing it if necessary, or None if it can't be created.
+    """
+    # Assume clone_target is a RIA store
+    source_path = str(Path(clone_target) / Path(ds_id[:3]) / Path(ds_id[3:]))
+    mirror_path = Path(mirror_root) / f'{ds_id}.git'
+    
+    return update_mirror(source_path, mirror_path, max_age)
+
+
 def git_add_remote(push_path, dpath='cwd', repository='outputstore'):
     if dpath == 'cwd':
         cmd = ['git', 'remote', 'add', repository, push_path]
@@ -89,6 +141,17 @@ def git_commit(dpath='cwd', message='update submodules'):
     
     subprocess.run(cmd)
     
+def git_remote_branches(dpath='cwd'):
+    """
+    Names of the remote-tracking branches, e.g. origin/job-1.
+    """
+    cmd = ['git']
+    if dpath != 'cwd':
+        cmd += ['-C', dpath]
+    cmd += ['branch', '--remotes', '--format=%(refname:short)']
+
+    return set(subprocess.run(cmd, capture_output=True, text=True).stdout.split())
+    
 def git_merge(branches:list, message:str, dpath='cwd'):
     branches_str = ''
     for branch in branches:
@@ -0,0 +1,127 @@
+from pathlib import Path
+import csv
+import os
+import sqlite3
+
+
+class StaleJobIndexError(Exception):
+    """An exception for a job index that doesn't match its job config file."""
+    pass
+
+
+def _file_signature(path):
+    "Size and modification time of a file."
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _csv_records(csv_file):
+    """
+    Yield the offset and bytes of each record of a csv file, including
+    quoted fields spanning multiple lines.
+    """
+    offset = csv_file.tell()
+    record = b''
+    for line in csv_file:
+        record += line
+        # a record ends once all its quotes are closed
+        if record.count(b'"') % 2 == 0:
+            yield offset, record
+            offset += len(record)
+            record = b''
+    if record:
+        yield offset, record
+
+
+def _job_rows(config, job_name_index):
+    "Yield the job name, offset and length of each record from the current position of a csv file."
+    for offset, record in _csv_records(config):
+        # fast path for the usual unquoted job name in the first column
+        if job_name_index == 0 and not record.startswith(b'"'):
+            job_name = record.split(b',', 1)[0].decode().strip()
+        else:
+            job_name = next(csv.reader([record.decode()]))[job_name_index]
+        yield job_name, offset, len(record)
+
+
+def build_job_index(config_file, index_file):
+    """
+    Write an index of job names to the byte offset and length of their row
+    within a csv job config file.
+    """
+    tmp_index_file = f'{index_file}.{os.getpid()}.tmp'
+    if Path(tmp_index_file).exists():
+        Path(tmp_index_file).unlink()
+
+    signature = _file_signature(config_file)
+
+    with open(config_file, 'rb') as config:
+        header = config.readline()
+        columns = next(csv.reader([header.decode()]))
+        job_name_index = columns.index('job_name')
+
+        connection = sqlite3.connect(tmp_index_file)
+        with connection:
+            connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value)')
+            connection.execute('CREATE TABLE job_index (job_name TEXT PRIMARY KEY, offset INTEGER, length INTEGER) WITHOUT ROWID')
+            connection.executemany('INSERT OR REPLACE INTO job_index VALUES (?, ?, ?)', _job_rows(config, job_name_index))
+            connection.executemany('INSERT INTO meta VALUES (?, ?)', [('signature', signature), ('header', header)])
+        connection.close()
+
+    os.replace(tmp_index_file, index_file)
+    return None
+
+
+def extend_job_index(config_file, index_file, offset):
+    """
+    Add the rows appended to a csv job config file from a byte offset to its
+    index. Raise StaleJobIndexError if the index doesn't cover the file up to
+    that offset.
+    """
+    if not Path(index_file).exists():
+        raise StaleJobIndexError()
+
+    connection = sqlite3.connect(index_file)
+    try:
+        meta = dict(connection.execute('SELECT key, value FROM meta').fetchall())
+        if meta.get('signature', '').split(':')[0] != str(offset):
+            raise StaleJobIndexError()
+
+        with open(config_file, 'rb') as config:
+            columns = next(csv.reader([meta['header'].decode()]))
+            config.seek(offset)
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO job_index VALUES (?, ?, ?)', _job_rows(config, columns.index('job_name')))
+                connection.execute('UPDATE meta SET value = ? WHERE key = ?', (_file_signature(config_file), 'signature'))
+    finally:
+        connection.close()
+
+    return None
+
+
+def read_job_record(config_file, index_file, job_name):
+    """
+    Return the header and the csv row of a job, or None if the job isn't indexed.
+    Raise StaleJobIndexError if the index is missing or older than the config file.
+    """
+    if not Path(index_file).exists():
+        raise StaleJobIndexError()
+
+    connection = sqlite3.connect(f'file:{index_file}?mode=ro', uri=True)
+    try:
+        meta = dict(connection.execute('SELECT key, value FROM meta').fetchall())
+        if meta.get('signature') != _file_signature(config_file):
+            raise StaleJobIndexError()
+        position = connection.execute('SELECT offset, length FROM job_index WHERE job_name = ?', (job_name,)).fetchone()
+    finally:
+        connection.close()
+
+    if position is None:
+        return None
+
+    offset, length = position
+    with open(config_file, 'rb') as config:
+        config.seek(offset)
+        record = config.read(length)
+
+    return meta['header'] + record
@@ -0,0 +1,101 @@
+from pathlib import Path
+import threading
+import time
+
+MOUNTS_FILE = '/proc/self/mounts'
+
+
+def _unescape(field):
+    "Undo the octal escapes (e.g. '\\040' for a space) of a mounts file field."
+    if '\\' not in field:
+        return field
+    return field.encode().decode('unicode_escape').encode('latin-1').decode()
+
+
+def read_mounts(mounts_file=MOUNTS_FILE):
+    "Mount points of a mounts file (fstab format) with their device and file system type."
+    mounts = {}
+    with open(mounts_file, 'r') as mounts_lines:
+        for line in mounts_lines:
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            mounts[_unescape(fields[1])] = (_unescape(fields[0]), fields[2])
+    return mounts
+
+
+class MountTable:
+    """
+    Mount points of a node, read once from its mounts file. Ephemeral
+    locations with a {HOST} part are resolved against it: the path up to the
+    part holding the host name must be a mount point, and the rest of the
+    pattern is globbed within it.
+    """
+    def __init__(self, mounts_file=MOUNTS_FILE):
+        self.mounts_file = mounts_file
+        self.mounts = read_mounts(mounts_file)
+
+    def is_mount(self, path):
+        "Whether a path is a mount point."
+        return str(Path(path)) in self.mounts
+
+    def resolve(self, pattern, host, user):
+        """
+        Locations matching an ephemeral location pattern on a host, sorted.
+        Patterns without {HOST} are only formatted.
+        """
+        location = pattern.format(HOST=host, USER=user, host=host, user=user)
+        if '{HOST}' not in pattern and '{host}' not in pattern:
+            return [location]
+
+        parts = Path(location).parts
+        index = next((index for index, part in enumerate(parts) if host in part), None)
+        if index is None:
+            return []
+        # node location and location inside node
+        mount_point = str(Path(*parts[:index+1]))
+        after_pattern = str(Path(*parts[index+1:])) if parts[index+1:] else None
+        if mount_point not in self.mounts:
+            return []
+        if after_pattern is None:
+            return [mount_point]
+        return sorted(str(path) for path in Path(mount_point).glob(after_pattern))
+
+
+_TABLES = {}
+_LOCATIONS = {}
+_LOCK = threading.Lock()
+
+
+def resolve_locations(patterns, host, user, ttl=300, mounts_file=MOUNTS_FILE):
+    """
+    Resolve ephemeral location patterns on a host (see MountTable.resolve),
+    keeping the mount table and the resolved locations of each host for ttl
+    seconds, so jobs of the same process (e.g. a pilot worker) don't read
+    the mounts file and glob again. Return the locations in pattern order.
+    """
+    now = time.monotonic()
+    key = (tuple(patterns), host, user, mounts_file)
+    with _LOCK:
+        resolved_at, locations = _LOCATIONS.get(key, (None, None))
+        if resolved_at is not None and now - resolved_at < ttl:
+            return list(locations)
+
+        read_at, table = _TABLES.get(mounts_file, (None, None))
+        if read_at is None or now - read_at >= ttl:
+            table = MountTable(mounts_file)
+            _TABLES[mounts_file] = (now, table)
+
+        locations = []
+        for pattern in patterns:
+            locations += [location for location in table.resolve(pattern, host, user) if location not in locations]
+        _LOCATIONS[key] = (now, locations)
+    return list(locations)
+
+
+def clear_cache():
+    "Forget the cached mount tables and resolved locations."
+    with _LOCK:
+        _TABLES.clear()
+        _LOCATIONS.clear()
+    return None
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+# statuses of a job's latest row that make it a candidate for a retry
+FAILED_STATUS = ['error', 'no-space', 'lost']
+# failures that usually go away on their own
+TRANSIENT_FAILURES = ['no-space', 'lost']
+DEFAULT_POLICY = {'max_attempts':1, 'retry_on':TRANSIENT_FAILURES, 'backoff':300, 'backoff_factor':2}
+
+
+def retry_policy(max_attempts=None, retry_on=None, backoff=None, backoff_factor=None):
+    """
+    Return a retry policy, with the defaults of DEFAULT_POLICY for the values
+    that aren't given, or None if max_attempts isn't given.
+
+    max_attempts counts every run of a job, retry_on holds the failure classes
+    that are retried (see failure_class) and the n-th retry waits
+    backoff * backoff_factor**(n-1) seconds after the failure.
+    """
+    if max_attempts is None:
+        return None
+    values = {'max_attempts':max_attempts, 'retry_on':retry_on, 'backoff':backoff, 'backoff_factor':backoff_factor}
+    return {key:(DEFAULT_POLICY[key] if value is None else value) for key, value in values.items()}
+
+
+def failure_class(status, error_type=None):
+    """
+    Failure class of a status row: 'no-space' or 'lost' for those statuses,
+    the exception type name of an error, or 'error' if it wasn't recorded.
+    None if the row isn't a failure.
+    """
+    if status not in FAILED_STATUS:
+        return None
+    if status == 'error' and isinstance(error_type, str) and error_type:
+        return error_type
+    return status
+
+
+def matches(policy, failure):
+    "Whether a policy retries a failure class, 'error' matches any exception type."
+    retry_on = policy['retry_on']
+    return failure in retry_on or ('error' in retry_on and failure not in ('no-space', 'lost'))
+
+
+def retry_at(policy, attempts, failed_at):
+    "Time at which a job that failed at failed_at after some attempts can be retried."
+    delay = policy['backoff'] * policy['backoff_factor'] ** max(attempts - 1, 0)
+    return datetime.fromtimestamp(datetime.strptime(failed_at, TIME_FORMAT).timestamp() + delay)
+
+
+def should_retry(policy, failure, attempts, failed_at, now=None):
+    """
+    Whether a job whose latest run failed with a failure class, after some
+    attempts, is due for a retry under a policy.
+    """
+    if policy is None or failure is None or not matches(policy, failure):
+        return False
+    if attempts >= policy['max_attempts']:
+        return False
+    if now is None:
+        now = datetime.today()
+    return not isinstance(failed_at, str) or now >= retry_at(policy, attempts, failed_at)
@@ -0,0 +1,347 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+import sqlite3
+from contextlib import contextmanager
+
+from fairb.utils.tables import read_table, write_table
+
+STATUS_COLUMNS = ('job_name', 'job_id', 'req_disk_gb', 'host', 'location', 'job_dir', 'status', 'start', 'update', 'total_disk_gb', 'traceback', 'heartbeat', 'attempt', 'error_type')
+STATUS_BACKENDS = ('csv', 'sqlite')
+# a job's rows up to its latest 'outdated' row belong to an older version of the job
+OUTDATED_STATUS = 'outdated'
+
+
+class JobStatusStore(ABC):
+    """
+    Base class for job status backends.
+
+    Every backend stores one row per job attempt with the STATUS_COLUMNS and
+    supports single-row inserts, filtered updates and filtered reads.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def exists(self):
+        "Does the backing file exist."
+        return Path(self.path).exists()
+
+    @abstractmethod
+    def create(self):
+        "Create an empty status table if it doesn't exist."
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self):
+        "Return the whole status table as a dataframe."
+        raise NotImplementedError
+
+    @abstractmethod
+    def find(self, **where):
+        "Return the status rows whose columns equal the given values."
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, **row):
+        "Add a new status row."
+        raise NotImplementedError
+
+    def insert_many(self, rows):
+        "Add several status rows at once."
+        for row in rows:
+            self.insert(**row)
+        return None
+
+    @abstractmethod
+    def update(self, where, **values):
+        "Set the given values on the status rows matching 'where'."
+        raise NotImplementedError
+
+    def changed_since(self, timestamp):
+        "Return the status rows started or updated at or after a timestamp (as '%Y/%m/%d %H:%M:%S')."
+        status_df = self.read()
+        return status_df[(status_df['start'].fillna('').astype(str) >= timestamp) | (status_df['update'].fillna('').astype(str) >= timestamp)]
+
+    @abstractmethod
+    def job_names(self, statuses):
+        """
+        Return the unique job names with any of the given statuses, ignoring
+        the rows of a job up to its latest 'outdated' row.
+        """
+        raise NotImplementedError
+
+    def reserved_disk_gb(self, host, location):
+        """
+        Return the disk space (in gb) reserved but not used yet by the ongoing
+        jobs of a host's location, the sum of their req_disk_gb minus the
+        total_disk_gb measured on their job_dir, never below 0 per job.
+        """
+        ongoing_df = self.find(host=host, location=location, status='ongoing')
+        unused_gb = ongoing_df['req_disk_gb'].astype(float).fillna(0) - ongoing_df['total_disk_gb'].astype(float).fillna(0)
+        return float(unused_gb.clip(lower=0).sum())
+
+    def import_table(self, table_path):
+        "Append the rows of a job status table (csv, feather or parquet)."
+        status_df = read_table(table_path)
+        for row in status_df.astype(object).where(status_df.notna(), None).to_dict(orient='records'):
+            self.insert(**row)
+        return None
+
+    def export_table(self, table_path):
+        "Write the status table as a csv, feather or parquet file."
+        write_table(self.read(), table_path)
+        return None
+
+
+class CSVStatusStore(JobStatusStore):
+    """
+    Job status stored in a csv file.
+
+    Inserts append a line, but updates rewrite the whole file, so callers
+    must hold the project's status lockfile.
+    """
+
+    # text columns are read as is, so job ids like '6297.10' or '1266' aren't parsed as numbers
+    _DTYPES = {column:str for column in STATUS_COLUMNS if column not in ('req_disk_gb', 'total_disk_gb', 'attempt')}
+
+    def create(self):
+        import pandas as pd
+        if not self.exists():
+            pd.DataFrame({column:[] for column in STATUS_COLUMNS}).to_csv(self.path, index=False)
+        return None
+
+    def read(self):
+        import pandas as pd
+        # files written before a column was added get it empty
+        return pd.read_csv(self.path, dtype=self._DTYPES).reindex(columns=list(STATUS_COLUMNS))
+
+    def find(self, **where):
+        status_df = self.read()
+        return status_df[_match(status_df, where)]
+
+    def _header(self, columns):
+        "Columns of the file, which gets the missing status columns first if any of the given columns is one."
+        import pandas as pd
+        header = pd.read_csv(self.path, nrows=0).columns
+        if any(column in STATUS_COLUMNS and column not in header for column in columns):
+            self.read().to_csv(self.path, index=False)
+            header = pd.Index(STATUS_COLUMNS)
+        return header
+
+    def insert(self, **row):
+        import pandas as pd
+        header = self._header(row)
+        pd.DataFrame({column:[row.get(column)] for column in header}).to_csv(self.path, mode='a', header=False, index=False)
+        return None
+
+    def insert_many(self, rows):
+        import pandas as pd
+        header = self._header({column for row in rows for column in row})
+        pd.DataFrame({column:[row.get(column) for row in rows] for column in header}).to_csv(self.path, mode='a', header=False, index=False)
+        return None
+
+    def update(self, where, **values):
+        status_df = self.read()
+        is_job = _match(status_df, where)
+        for column, value in values.items():
+            if column not in status_df.columns:
+                status_df[column] = None
+            status_df[column] = status_df[column].astype(object).mask(is_job, value)
+        status_df.to_csv(self.path, index=False)
+        return None
+
+    def job_names(self, statuses):
+        import pandas as pd
+        status_df = current_rows(pd.read_csv(self.path, usecols=['job_name', 'status'], dtype=self._DTYPES))
+        return status_df.query("status.isin(@statuses)")['job_name'].drop_duplicates().to_list()
+
+
+class SQLiteStatusStore(JobStatusStore):
+    """
+    Job status stored in an SQLite database.
+
+    Inserts and updates are single-row transactions on indexed columns, so
+    they don't depend on the total number of jobs. Like the csv backend,
+    writers hold the project's status lockfile. The database uses a rollback
+    journal (journal_mode='delete') by default, since WAL mode needs shared
+    memory between the processes, which project directories on NFS can't
+    provide.
+    """
+
+    _TABLE = 'job_status'
+    _COLUMN_TYPES = {'req_disk_gb':'REAL', 'total_disk_gb':'REAL', 'attempt':'INTEGER'}
+
+    def __init__(self, path, journal_mode='delete', timeout=600):
+        super().__init__(path)
+        self.journal_mode = journal_mode
+        self.timeout = timeout
+        self._connection = None
+
+    def _connect(self):
+        "Return a cached connection, creating the schema on first use."
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._connection.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            if self.journal_mode.lower() == 'wal':
+                self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._create_schema(self._connection)
+        return self._connection
+
+    def _create_schema(self, connection):
+        columns = ', '.join(f'"{column}" {self._COLUMN_TYPES.get(column, "")}'.strip() for column in STATUS_COLUMNS)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {self._TABLE} (row_id INTEGER PRIMARY KEY, {columns})')
+        # add the columns of newer versions to older databases
+        existing_columns = [row[1] for row in connection.execute(f'PRAGMA table_info({self._TABLE})')]
+        for column in STATUS_COLUMNS:
+            if column not in existing_columns:
+                connection.execute(f'ALTER TABLE {self._TABLE} ADD COLUMN "{column}" {self._COLUMN_TYPES.get(column, "")}'.strip())
+        connection.execute(f'CREATE INDEX IF NOT EXISTS idx_job_name ON {self._TABLE} (job_name)')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS idx_status ON {self._TABLE} (status)')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS idx_host_location_status ON {self._TABLE} (host, location, status)')
+        return None
+
+    @contextmanager
+    def transaction(self):
+        "Run statements within a single write transaction."
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        return None
+
+    def create(self):
+        self._connect()
+        return None
+
+    def _select(self, where):
+        import pandas as pd
+        columns = ', '.join(f'"{column}"' for column in STATUS_COLUMNS)
+        clause, params = _where_clause(where)
+        cursor = self._connect().execute(f'SELECT {columns} FROM {self._TABLE}{clause} ORDER BY row_id', params)
+        return pd.DataFrame(cursor.fetchall(), columns=list(STATUS_COLUMNS))
+
+    def read(self):
+        return self._select({})
+
+    def find(self, **where):
+        return self._select(where)
+
+    def changed_since(self, timestamp):
+        import pandas as pd
+        columns = ', '.join(f'"{column}"' for column in STATUS_COLUMNS)
+        cursor = self._connect().execute(f'SELECT {columns} FROM {self._TABLE} WHERE "start" >= ? OR "update" >= ? ORDER BY row_id', (timestamp, timestamp))
+        return pd.DataFrame(cursor.fetchall(), columns=list(STATUS_COLUMNS))
+
+    def insert(self, **row):
+        columns = [column for column in STATUS_COLUMNS if column in row]
+        column_names = ', '.join(f'"{column}"' for column in columns)
+        placeholders = ', '.join('?' for _column in columns)
+        with self.transaction() as connection:
+            connection.execute(f'INSERT INTO {self._TABLE} ({column_names}) VALUES ({placeholders})', [row[column] for column in columns])
+        return None
+
+    def update(self, where, **values):
+        assignments = ', '.join(f'"{column}" = ?' for column in values)
+        clause, params = _where_clause(where)
+        with self.transaction() as connection:
+            connection.execute(f'UPDATE {self._TABLE} SET {assignments}{clause}', list(values.values()) + params)
+        return None
+
+    def job_names(self, statuses):
+        placeholders = ', '.join('?' for _status in statuses)
+        cursor = self._connect().execute(
+            f'SELECT DISTINCT job_name FROM {self._TABLE} AS current WHERE status IN ({placeholders}) '
+            f'AND row_id > (SELECT COALESCE(MAX(row_id), 0) FROM {self._TABLE} WHERE job_name = current.job_name AND status = ?)',
+            list(statuses) + [OUTDATED_STATUS]
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+    def reserved_disk_gb(self, host, location):
+        # an aggregate over the few ongoing rows of idx_host_location_status
+        cursor = self._connect().execute(
+            f'SELECT COALESCE(SUM(MAX(COALESCE(req_disk_gb, 0) - COALESCE(total_disk_gb, 0), 0)), 0) FROM {self._TABLE} '
+            'WHERE host = ? AND location = ? AND status = ?',
+            (host, location, 'ongoing')
+            )
+        return float(cursor.fetchone()[0])
+
+    def insert_many(self, rows):
+        for columns, group in _group_by_columns(rows):
+            column_names = ', '.join(f'"{column}"' for column in columns)
+            placeholders = ', '.join('?' for _column in columns)
+            with self.transaction() as connection:
+                connection.executemany(f'INSERT INTO {self._TABLE} ({column_names}) VALUES ({placeholders})', [[row[column] for column in columns] for row in group])
+        return None
+
+    def import_table(self, table_path):
+        status_df = read_table(table_path)
+        columns = [column for column in STATUS_COLUMNS if column in status_df.columns]
+        rows = status_df[columns].astype(object).where(status_df[columns].notna(), None).itertuples(index=False, name=None)
+        column_names = ', '.join(f'"{column}"' for column in columns)
+        placeholders = ', '.join('?' for _column in columns)
+        with self.transaction() as connection:
+            connection.executemany(f'INSERT INTO {self._TABLE} ({column_names}) VALUES ({placeholders})', rows)
+        return None
+
+
+def current_rows(status_df):
+    "Rows of a status table after the latest 'outdated' row of their job, in file order."
+    position = status_df.reset_index(drop=True).index.to_series()
+    latest_outdated = position.where(status_df['status'].reset_index(drop=True) == OUTDATED_STATUS).groupby(status_df['job_name'].reset_index(drop=True)).transform('max')
+    return status_df[(latest_outdated.isna() | (position > latest_outdated)).to_numpy()]
+
+
+def _group_by_columns(rows):
+    "Group rows (dictionaries) by the status columns they set."
+    groups = {}
+    for row in rows:
+        columns = tuple(column for column in STATUS_COLUMNS if column in row)
+        groups.setdefault(columns, []).append(row)
+    return groups.items()
+
+
+def _match(status_df, where):
+    "Boolean mask of the rows matching every column-value pair in 'where'."
+    import pandas as pd
+    is_match = pd.Series(True, index=status_df.index)
+    for column, value in where.items():
+        if value is None:
+            is_match &= status_df[column].isna()
+        else:
+            is_match &= status_df[column] == value
+    return is_match
+
+
+def _where_clause(where):
+    "SQL WHERE clause and parameters for column-value pairs, None matches NULL."
+    conditions, params = [], []
+    for column, value in where.items():
+        if value is None:
+            conditions.append(f'"{column}" IS NULL')
+        else:
+            conditions.append(f'"{column}" = ?')
+            params.append(value)
+    if not conditions:
+        return '', params
+    return ' WHERE ' + ' AND '.join(conditions), params
+
+
+def open_status_store(backend, path):
+    "Return the status store for a backend name."
+    match backend:
+        case 'csv':
+            return CSVStatusStore(path)
+        case 'sqlite':
+            return SQLiteStatusStore(path)
+        case _:
+            raise ValueError(f"Unknown status backend '{backend}', use one of {STATUS_BACKENDS}.")
@@ -0,0 +1,251 @@
+from pathlib import Path
+import os
+
+TABLE_FORMATS = ('csv', 'feather', 'parquet')
+# formats that can be read, but not used for the job config
+SOURCE_TABLE_FORMATS = TABLE_FORMATS + ('tsv',)
+# comparison operators of row filters, as in pyarrow filters
+FILTER_OPERATORS = ('==', '!=', '>=', '<=', '>', '<')
+_PANDAS_OPERATORS = dict(zip(FILTER_OPERATORS, ('eq', 'ne', 'ge', 'le', 'gt', 'lt')))
+_ARROW_OPERATORS = dict(zip(FILTER_OPERATORS, ('equal', 'not_equal', 'greater_equal', 'less_equal', 'greater', 'less')))
+# low-cardinality columns stored as categoricals in columnar formats
+CATEGORICAL_COLUMNS = ('design', 'batch', 'queue', 'h_rt', 'status', 'host', 'location')
+
+
+class MissingTableDependencyError(ImportError):
+    """An exception for a columnar table format used without pyarrow installed."""
+    pass
+
+
+def table_format(path, formats=TABLE_FORMATS):
+    "Storage format of a table file from its suffix."
+    suffix = Path(path).suffix.lstrip('.')
+    if suffix not in formats:
+        raise ValueError(f"Unknown table format '{suffix}', use one of {formats}.")
+    return suffix
+
+
+def _import_pyarrow():
+    "Import pyarrow, which is only needed by the columnar formats."
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise MissingTableDependencyError("Feather and parquet tables require pyarrow (pip install fairb[arrow]).")
+    return pyarrow
+
+
+def read_table_columns(path):
+    "Column names of a table without reading its rows."
+    import pandas as pd
+
+    match table_format(path):
+        case 'csv':
+            return pd.read_csv(path, nrows=0).columns.to_list()
+        case 'feather':
+            pa = _import_pyarrow()
+            with pa.memory_map(str(path)) as source:
+                return pa.ipc.open_file(source).schema.names
+        case 'parquet':
+            pa = _import_pyarrow()
+            return pa.parquet.read_schema(path).names
+
+
+def read_table(path, columns=None, dtype=None, equals=None, filters=None):
+    """
+    Read a table as a dataframe.
+    Only the given columns are read, and only the rows whose columns equal
+    the values in 'equals' and pass the (column, operator, value) filters
+    are kept. dtype is only used for csv and tsv tables, columnar tables keep
+    the types they were written with.
+    """
+    import pandas as pd
+
+    filters = [(column, '==', value) for column, value in (equals or {}).items()] + list(filters or [])
+
+    match table_format(path, SOURCE_TABLE_FORMATS):
+        case 'csv' | 'tsv' as text_format:
+            # filtered columns are read even if they aren't returned
+            usecols = None if columns is None else list(dict.fromkeys(list(columns) + [column for column, _operator, _value in filters]))
+            table_df = pd.read_csv(path, usecols=usecols, dtype=dtype, sep='\t' if text_format == 'tsv' else ',')
+            if filters:
+                is_match = pd.Series(True, index=table_df.index)
+                for column, operator, value in filters:
+                    is_match &= _compare(table_df[column], operator, value)
+                table_df = table_df[is_match]
+            return table_df if columns is None else table_df[list(columns)]
+
+        case 'feather':
+            pa = _import_pyarrow()
+            import pyarrow.compute as pc
+            # memory mapped, so unused columns and rows are never read
+            table = pa.feather.read_table(path, columns=None if columns is None else list(dict.fromkeys(list(columns) + [column for column, _operator, _value in filters])), memory_map=True)
+            for column, operator, value in filters:
+                table = table.filter(_compare_arrow(pc, table[column], operator, _typed_value(pa, table.schema.field(column).type, value)))
+            if columns is not None:
+                table = table.select(list(columns))
+            return _categoricals_to_object(table.to_pandas())
+
+        case 'parquet':
+            pa = _import_pyarrow()
+            schema = pa.parquet.read_schema(path)
+            filters = [(column, operator, _typed_value(pa, schema.field(column).type, value)) for column, operator, value in filters] or None
+            table = pa.parquet.read_table(path, columns=columns, filters=filters, memory_map=True)
+            return _categoricals_to_object(table.to_pandas())
+
+
+def _compare(values, operator, value):
+    """
+    Compare a pandas column with a value. Numeric values given as strings
+    are compared as numbers with numeric columns, and with any column for
+    '>=', '<=', '>' and '<'.
+    """
+    import pandas as pd
+    if operator not in FILTER_OPERATORS:
+        raise ValueError(f"Unknown filter operator '{operator}', use one of {FILTER_OPERATORS}.")
+    if isinstance(value, str) and (pd.api.types.is_numeric_dtype(values) or operator not in ('==', '!=')):
+        try:
+            value = float(value)
+            values = pd.to_numeric(values, errors='coerce')
+        except ValueError:
+            pass
+    return getattr(values, _PANDAS_OPERATORS[operator])(value)
+
+
+def _compare_arrow(pc, values, operator, value):
+    "Compare a pyarrow column with a value, null values don't pass."
+    if operator not in FILTER_OPERATORS:
+        raise ValueError(f"Unknown filter operator '{operator}', use one of {FILTER_OPERATORS}.")
+    return pc.fill_null(getattr(pc, _ARROW_OPERATORS[operator])(values, value), False)
+
+
+def _typed_value(pa, value_type, value):
+    "Convert a filter value given as a string to the type of a columnar column."
+    if not isinstance(value, str):
+        return value
+    if pa.types.is_dictionary(value_type):
+        value_type = value_type.value_type
+    if pa.types.is_integer(value_type):
+        return int(value)
+    if pa.types.is_floating(value_type):
+        return float(value)
+    if pa.types.is_boolean(value_type):
+        return value.lower() == 'true'
+    return value
+
+
+def write_table(table_df, path):
+    """
+    Write a dataframe as a table in the format given by the path's suffix.
+    The table is written next to the path and moved over it, so memory
+    mapped reads of the old file stay valid.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    match table_format(path):
+        case 'csv':
+            table_df.to_csv(tmp_path, index=False)
+        case 'feather':
+            pa = _import_pyarrow()
+            pa.feather.write_feather(_to_categoricals(table_df), tmp_path, compression='uncompressed')
+        case 'parquet':
+            _import_pyarrow()
+            _to_categoricals(table_df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return None
+
+
+class TableWriter():
+    """
+    Write a table in chunks of rows with the same columns, in the format
+    given by the path's suffix. Columnar tables keep one dictionary per
+    categorical column, extended by every chunk. The table is moved over the
+    path once the writer is closed.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.format = table_format(path)
+        self._tmp_path = f'{path}.{os.getpid()}.tmp'
+        self._writer = None
+        self._schema = None
+        self._categories = {}
+        self._started = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            if self._writer is not None:
+                self._writer.close()
+            Path(self._tmp_path).unlink(missing_ok=True)
+        return False
+
+    def write(self, table_df):
+        "Append the rows of a dataframe to the table."
+        if self.format == 'csv':
+            table_df.to_csv(self._tmp_path, mode='a' if self._started else 'w', header=not self._started, index=False)
+            self._started = True
+            return None
+
+        pa = _import_pyarrow()
+        table = pa.Table.from_pandas(self._extend_categoricals(table_df), preserve_index=False)
+        if self._writer is None:
+            self._schema = pa.schema([_chunk_field(pa, field) for field in table.schema], metadata=table.schema.metadata)
+            if self.format == 'feather':
+                self._writer = pa.ipc.new_file(self._tmp_path, self._schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            else:
+                self._writer = pa.parquet.ParquetWriter(self._tmp_path, self._schema)
+        self._writer.write_table(table.select(self._schema.names).cast(self._schema))
+        self._started = True
+        return None
+
+    def close(self):
+        "Finish the table and move it over the path."
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._started:
+            os.replace(self._tmp_path, self.path)
+        return None
+
+    def _extend_categoricals(self, table_df):
+        "Dictionary encode the low-cardinality columns with the categories of every chunk so far."
+        import pandas as pd
+        table_df = table_df.copy()
+        for column in CATEGORICAL_COLUMNS:
+            if column in table_df.columns:
+                categories = self._categories.setdefault(column, {})
+                for value in pd.unique(table_df[column].dropna()):
+                    categories.setdefault(value, len(categories))
+                table_df[column] = pd.Categorical(table_df[column], categories=list(categories))
+        return table_df
+
+
+def _chunk_field(pa, field):
+    "Field of a chunked table that fits the values of every chunk."
+    if pa.types.is_dictionary(field.type):
+        return field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+    if pa.types.is_null(field.type):
+        return field.with_type(pa.large_string())
+    return field
+
+
+def _to_categoricals(table_df):
+    "Dictionary encode the low-cardinality columns."
+    table_df = table_df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in table_df.columns:
+            table_df[column] = table_df[column].astype('category')
+    return table_df
+
+
+def _categoricals_to_object(table_df):
+    "Return categorical columns as plain values, as if read from a csv."
+    for column in table_df.columns:
+        if table_df[column].dtype == 'category':
+            table_df[column] = table_df[column].astype(object)
+    return table_df
@@ -0,0 +1,32 @@
+import string
+
+
+def template_fields(template):
+    "Names of the fields of a str.format template."
+    return [field_name for _literal, field_name, _format_spec, _conversion in string.Formatter().parse(template) if field_name is not None]
+
+
+def render_template(template, variables):
+    """
+    Render a str.format template for every row of a dataframe (or a dict of
+    aligned series) at once, by concatenating its literal text and its
+    variable columns. Return a series of strings.
+    """
+    import pandas as pd
+
+    variable_df = pd.DataFrame(variables)
+    pieces = list(string.Formatter().parse(template))
+
+    # format specs, conversions and attribute or index access fall back to str.format
+    if any(format_spec or conversion or (field_name is not None and not field_name.isidentifier())
+           for _literal, field_name, format_spec, conversion in pieces):
+        return pd.Series([template.format(**row) for row in variable_df.to_dict(orient='records')], index=variable_df.index, dtype=object)
+
+    rendered = pd.Series('', index=variable_df.index, dtype=object)
+    for literal, field_name, _format_spec, _conversion in pieces:
+        if literal:
+            rendered = rendered + literal
+        if field_name is not None:
+            rendered = rendered + variable_df[field_name].astype(str)
+
+    return rendered
@@ -18,6 +18,9 @@ setup(
         "datalad-container>=1.2.5",
         "filelock>=3.12"
     ],
+    extras_require={
+        "arrow": ["pyarrow>=14"],  # feather y parquet para las tablas de jobs
+    },
     python_requires=">=3.11",  # Versión mínima de Python
     # classifiers=[  # Clasificación para PyPI
     #     "Programming Language :: Python :: 3",
@@ -0,0 +1,47 @@
+import os
+
+from fairb.utils.annex_cache import AnnexCache, annexed_files, annexed_object
+
+KEY = 'MD5E-s5--5d41402abc4b2a76b9719d911017c592.txt'
+
+
+def annexed_file(dataset, path, content=None):
+    "A locked annexed file of a dataset, with its object present if content is given."
+    object_path = dataset / '.git' / 'annex' / 'objects' / 'Xx' / 'Yy' / KEY / KEY
+    object_path.parent.mkdir(parents=True, exist_ok=True)
+    if content is not None:
+        object_path.write_text(content)
+    file_path = dataset / path
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.symlink_to(os.path.relpath(object_path, file_path.parent))
+    return str(file_path)
+
+
+def test_annexed_object(tmp_path):
+    path = annexed_file(tmp_path / 'dataset', 'inputs/hello.txt')
+    key, object_path, repository = annexed_object(path)
+    assert key == KEY
+    assert object_path.endswith(os.path.join('objects', 'Xx', 'Yy', KEY, KEY))
+    assert repository == str(tmp_path / 'dataset')
+    (tmp_path / 'plain.txt').write_text('')
+    assert annexed_object(str(tmp_path / 'plain.txt')) is None
+
+
+def test_annexed_files(tmp_path):
+    dataset = tmp_path / 'dataset'
+    path = annexed_file(dataset, 'inputs/hello.txt')
+    (dataset / 'inputs' / 'plain.txt').write_text('')
+    assert annexed_files(str(dataset), ['inputs', 'inputs/hello.txt']) == [path]
+
+
+def test_store_and_populate_skip_truncated_objects(tmp_path):
+    cache = AnnexCache(tmp_path / 'cache', max_gb=1)
+    source = annexed_file(tmp_path / 'source', 'hello.txt', 'hello')
+    clone = annexed_file(tmp_path / 'clone', 'hello.txt')
+
+    # a truncated cached object is a miss, and it's replaced when stored again
+    (cache.objects / KEY).write_text('hel')
+    assert cache.populate([clone]) == (0, 1, 0)
+    assert cache.store([source]) == 5
+    assert (cache.objects / KEY).read_text() == 'hello'
+    assert cache.stats()['misses'] == 1
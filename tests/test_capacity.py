@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pandas as pd
+
+from fairb.utils.capacity import CapacityModel, normalize_patterns, read_probes, write_probe
+
+SCRATCH = '/scratch/{HOST}'
+
+
+def probe(host, tmp_gb, scratch_gb=None):
+    locations = [{'pattern':'/tmp', 'location':'/tmp', 'free_gb':tmp_gb}]
+    if scratch_gb is not None:
+        locations.append({'pattern':SCRATCH, 'location':f'/scratch/{host}', 'free_gb':scratch_gb})
+    return {'host':host, 'probed':'2026/01/01 00:00:00', 'locations':locations}
+
+
+def test_normalize_patterns():
+    assert normalize_patterns(None) == ['/tmp']
+    assert normalize_patterns('  ') == ['/tmp']
+    assert normalize_patterns('/tmp/ /scratch/{HOST}') == ['/tmp', '/scratch/{HOST}']
+
+
+def test_probes_round_trip(tmp_path):
+    write_probe(tmp_path, 'node1', probe('node1', 10)['locations'], probed='2026/01/01 00:00:00')
+    write_probe(tmp_path, 'node2', probe('node2', 10)['locations'], probed='2026/01/01 00:10:00')
+    now = datetime(2026, 1, 1, 0, 15)
+    assert [entry['host'] for entry in read_probes(tmp_path, now=now)] == ['node1', 'node2']
+    assert [entry['host'] for entry in read_probes(tmp_path, max_age=600, now=now)] == ['node2']
+
+
+def test_place_follows_fairb_run_then_most_space():
+    model = CapacityModel([probe('node1', 10, 100), probe('node2', 50, 20)])
+    # node1 would run it in scratch, node2 in /tmp, and node1's scratch has the most space left
+    assert model.place(20, ['/tmp', SCRATCH]) == ('node1', '/scratch/node1')
+    assert model.available[('node1', '/scratch/node1')] == 80
+    # node2 runs it in /tmp even if it doesn't have the most space left
+    assert model.place(20, ['/tmp', SCRATCH], exclude_hosts=['node1']) == ('node2', '/tmp')
+    # only scratch has room for it, but the job can only use /tmp
+    assert model.place(60, ['/tmp']) is None
+
+
+def test_place_reserves_and_excludes():
+    model = CapacityModel([probe('node1', 10), probe('node2', 30)])
+    assert model.place(20, ['/tmp'], exclude_hosts=['node2']) is None
+    assert model.place(20, ['/tmp']) == ('node2', '/tmp')
+    # the first job's space is taken
+    assert model.place(20, ['/tmp']) is None
+
+
+def test_place_accounts_for_running_and_submitted_jobs():
+    ongoing_df = pd.DataFrame({'host':['node1'], 'location':['/tmp'], 'req_disk_gb':[40], 'total_disk_gb':[10]})
+    submitted_df = pd.DataFrame({'host':['node2', None], 'location':['/tmp', None], 'req_disk_gb':[25, 100]})
+    model = CapacityModel([probe('node1', 50), probe('node2', 50)], ongoing_df, submitted_df)
+    assert model.available == {('node1', '/tmp'):20, ('node2', '/tmp'):25}
+    assert model.place(22, ['/tmp']) == ('node2', '/tmp')
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import sys
+from types import ModuleType
+
+import pytest
+
+from fairb.utils.annex_cache import verify_key
+from fairb.utils.containers import container_image, stage_container
+
+CONTENT = b'container image'
+
+
+@pytest.fixture
+def image(tmp_path):
+    image = tmp_path / 'image.sif'
+    image.write_bytes(CONTENT)
+    return image
+
+
+@pytest.mark.parametrize('backend, algorithm', [('MD5E', 'md5'), ('SHA256E', 'sha256'), ('SHA1', 'sha1')])
+def test_verify_key(image, backend, algorithm):
+    digest = hashlib.new(algorithm, CONTENT).hexdigest()
+    suffix = '.sif' if backend.endswith('E') else ''
+    assert verify_key(image, f'{backend}-s{len(CONTENT)}--{digest}{suffix}')
+    assert not verify_key(image, f'{backend}-s{len(CONTENT)}--{"0" * len(digest)}{suffix}')
+
+
+def test_verify_key_blake2b(image):
+    digest = hashlib.blake2b(CONTENT, digest_size=32).hexdigest()
+    assert verify_key(image, f'BLAKE2B256E-s{len(CONTENT)}--{digest}.sif')
+
+
+def test_verify_key_size_only(image):
+    wrong_hash = f'SHA256E-s{len(CONTENT)}--{"0" * 64}.sif'
+    assert verify_key(image, wrong_hash, full=False)
+    assert not verify_key(image, f'SHA256E-s{len(CONTENT) + 1}--{"0" * 64}.sif', full=False)
+    # backends without a hash, e.g. WORM, only have their size checked
+    assert verify_key(image, f'WORM-s{len(CONTENT)}-m1700000000--image.sif')
+    assert not verify_key(image, f'WORM-s1-m1700000000--image.sif')
+
+
+def test_container_image(tmp_path):
+    (tmp_path / '.datalad').mkdir()
+    (tmp_path / '.datalad' / 'config').write_text('[datalad "containers.fmriprep"]\n\timage = .datalad/environments/fmriprep/image\n')
+    (tmp_path / 'code' / 'containers' / '.datalad').mkdir(parents=True)
+    (tmp_path / 'code' / 'containers' / '.datalad' / 'config').write_text('[datalad "containers.qsiprep"]\n\timage = images/qsiprep.sif\n')
+
+    assert container_image(tmp_path, 'fmriprep') == '.datalad/environments/fmriprep/image'
+    assert container_image(tmp_path, 'code/containers/qsiprep') == 'code/containers/images/qsiprep.sif'
+    assert container_image(tmp_path, 'missing') is None
+
+
+def test_stage_container_installs_image_subdataset(tmp_path, monkeypatch):
+    # the default layout: the image lives in the inputs/containers subdataset
+    ds_path = tmp_path / 'clone'
+    (ds_path / '.datalad').mkdir(parents=True)
+    (ds_path / '.datalad' / 'config').write_text('[datalad "containers.fmriprep"]\n\timage = inputs/containers/.datalad/environments/fmriprep/image\n')
+    image_path = ds_path / 'inputs' / 'containers' / '.datalad' / 'environments' / 'fmriprep' / 'image'
+    key = f'MD5E-s{len(CONTENT)}--{hashlib.md5(CONTENT).hexdigest()}'
+    object_path = ds_path / 'inputs' / 'containers' / '.git' / 'annex' / 'objects' / 'Xx' / 'Yy' / key / key
+
+    gets = []
+
+    def get(path, dataset=None, get_data=True, result_renderer=None):
+        gets.append((path, get_data))
+        if not get_data:
+            image_path.parent.mkdir(parents=True)
+            image_path.symlink_to(os.path.relpath(object_path, image_path.parent))
+        else:
+            object_path.parent.mkdir(parents=True)
+            object_path.write_bytes(CONTENT)
+
+    datalad = ModuleType('datalad')
+    datalad.api = ModuleType('datalad.api')
+    datalad.api.get = get
+    monkeypatch.setitem(sys.modules, 'datalad', datalad)
+    monkeypatch.setitem(sys.modules, 'datalad.api', datalad.api)
+
+    stage_root = tmp_path / 'stage'
+    assert stage_container(ds_path, 'fmriprep', stage_root)['event'] == 'miss'
+    assert gets == [(str(image_path), False), (str(image_path), True)]
+    assert (stage_root / key).read_bytes() == CONTENT
+
+    assert stage_container(ds_path, 'fmriprep', stage_root)['event'] == 'hit'
+    assert len(gets) == 2
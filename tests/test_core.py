@@ -0,0 +1,73 @@
+import pandas as pd
+
+from fairb.core import FairB
+from fairb.utils.tables import write_table
+
+
+def project(tmp_path, output_datasets=[]):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], output_datasets, 'container', 'clone', 'push', designs=[], read_only=True)
+    fairb.add_design("subject == <!write>(sub-01 sub-02)", 'bet {subject}', 'inputs/{subject}', 'outputs/{subject}', False, None, 'message', '/tmp', 1, 'all.q', 1, None, None, None, job_name='bet-{subject}', variables=['subject'])
+    # a design without inputs nor outputs
+    fairb.add_design("subject == <!write>(sub-01) ; run == <!write>(1)", 'qc {subject} {run}', None, None, True, 'code', None, '/tmp', 2, 'all.q', 1, None, None, None, job_name='qc-{subject}-{run}', variables=['subject', 'run'])
+    return fairb
+
+
+JOBS = pd.DataFrame([
+    {'job_name':'bet-sub-01', 'design':'0', 'batch':'0001', 'subject':'sub-01', 'run':None},
+    {'job_name':'qc-sub-01-1', 'design':'1', 'batch':'0001', 'subject':'sub-01', 'run':'1'},
+    {'job_name':'bet-sub-02', 'design':'0', 'batch':'0001', 'subject':'sub-02', 'run':None},
+])
+
+
+def test_render_job_config_of_several_designs(tmp_path):
+    fairb = project(tmp_path, output_datasets=['outputs/bet', 'outputs/qc'])
+    config_df = fairb.render_job_config(JOBS)
+    assert list(config_df.columns) == list(FairB._JOB_CONFIG_DICT)
+    # rows keep their order across designs
+    assert config_df['job_name'].to_list() == ['bet-sub-01', 'qc-sub-01-1', 'bet-sub-02']
+    assert config_df['dl_cmd'].to_list() == ['bet sub-01', 'qc sub-01 1', 'bet sub-02']
+    assert config_df['inputs'].to_list() == ['inputs/sub-01', None, 'inputs/sub-02']
+    assert config_df['req_disk_gb'].to_list() == [1, 2, 1]
+    assert set(config_df['output_datasets']) == {'outputs/bet outputs/qc'}
+
+    assert fairb.render_job_config(JOBS.iloc[:0]).empty
+    assert project(tmp_path).render_job_config(JOBS)['output_datasets'].isna().all()
+
+
+def test_read_job_of_normalized_config(tmp_path):
+    fairb = project(tmp_path)
+    write_table(JOBS, fairb.job_config_file)
+    fairb.index_job_config()
+
+    job = fairb.read_job('qc-sub-01-1')
+    assert job['dl_cmd'] == 'qc sub-01 1'
+    assert job['inputs'] is None and job['outputs'] is None
+    assert job['prereq_get'] == 'code' and job['is_explicit']
+    assert fairb.read_job('bet-sub-02')['outputs'] == 'outputs/sub-02'
+
+
+def test_read_job_of_legacy_config(tmp_path):
+    fairb = project(tmp_path)
+    legacy_df = pd.DataFrame([{**{column:None for column in FairB._JOB_CONFIG_DICT}, 'job_name':'job-1', 'dl_cmd':'echo 1', 'batch':'0001'}])
+    legacy_df.to_csv(fairb.job_config_file, index=False)
+    fairb.index_job_config()
+
+    # rows of a config with a dl_cmd column are already rendered
+    job = fairb.read_job('job-1')
+    assert job['dl_cmd'] == 'echo 1' and job['batch'] == '0001'
+    assert job['inputs'] is None
+
+
+def test_job_config_columns(tmp_path):
+    fairb = project(tmp_path)
+    write_table(JOBS.assign(job_hash='hash'), fairb.job_config_file)
+    # the queue comes from the design, the command from the design variables
+    assert fairb.job_config_columns(['job_name', 'queue']) == ['job_name', 'design', 'batch']
+    assert fairb.job_config_columns(['job_name', 'dl_cmd']) == ['job_name', 'design', 'batch', 'subject', 'run']
+
+    legacy_df = pd.DataFrame([{**{column:None for column in FairB._JOB_CONFIG_DICT}, 'job_name':'job-1', 'dl_cmd':'echo 1', 'batch':'0001'}])
+    legacy_df.to_csv(fairb.job_config_file, index=False)
+    assert fairb.job_config_columns(['job_name', 'queue']) == ['job_name', 'queue', 'batch']
+
+    fairb.read_job_config(columns=fairb.job_config_columns(['job_name', 'queue']))
+    assert list(fairb.job_config_df.columns) == ['job_name', 'queue', 'batch']
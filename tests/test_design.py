@@ -0,0 +1,204 @@
+import json
+
+import pandas as pd
+import pytest
+
+from fairb.core import FairB
+from fairb.scripts.design import (
+    PLAN_FORMAT, _table_arguments, call_exists, call_grep, call_is_in, call_multiply, call_not_in, call_repeat, call_replace, call_table, call_unique,
+    evaluate_plan, iter_job_chunks, load_plan, update_job_config
+    )
+from fairb.utils.tables import TableWriter
+
+
+def test_paste_without_variables_is_a_literal(tmp_path):
+    plan = load_plan("pipeline == <!paste>(fmriprep)", tmp_path)
+    assert evaluate_plan(plan, str(tmp_path))['pipeline'].to_list() == ['fmriprep']
+
+
+def test_paste_renders_variables(tmp_path):
+    plan = load_plan("subject == <!write>(sub-01 sub-02) ; t1w == <!paste>({subject}/anat/{subject}_T1w.nii.gz)")
+    assert evaluate_plan(plan, str(tmp_path))['t1w'].to_list() == ['sub-01/anat/sub-01_T1w.nii.gz', 'sub-02/anat/sub-02_T1w.nii.gz']
+
+
+def series(*values):
+    return pd.Series(values, dtype=object)
+
+
+def test_grep():
+    assert call_grep(r'sub-\d+', series('sub-01_T1w.nii', 'sub-02_T1w.nii', 'README')).to_list() == ['sub-01', 'sub-02', None]
+
+
+def test_replace():
+    assert call_replace('T1w T2w', series('sub-01_T1w.nii', 'sub-02_T1w.nii'), {}).to_list() == ['sub-01_T2w.nii', 'sub-02_T2w.nii']
+    # variables within the replacement are filled in value by value, whatever their name
+    variables = {'acq':series('lowres', 'highres')}
+    assert call_replace('T1w {{acq}}', series('sub-01_T1w.nii', 'sub-02_T1w.nii'), variables).to_list() == ['sub-01_lowres.nii', 'sub-02_highres.nii']
+
+
+def test_is_in_and_not_in():
+    values = series('sub-01', 'sub-02', 'sub-03')
+    variables = {'done':series('sub-02')}
+    assert call_is_in('done', values, variables).to_list() == ['sub-02']
+    assert call_not_in('done', values, variables).to_list() == ['sub-01', 'sub-03']
+
+
+def test_multiply_and_repeat():
+    values = series('a', 'b')
+    variables = {'runs':series('1', '2', '3')}
+    assert call_multiply('2', values, variables).to_list() == ['a', 'b', 'a', 'b']
+    assert call_repeat('2', values, variables).to_list() == ['a', 'a', 'b', 'b']
+    assert call_repeat('runs', values, variables).to_list() == ['a', 'a', 'a', 'b', 'b', 'b']
+
+
+def test_unique():
+    assert call_unique(series('b', 'a', 'b', 'c', 'a')).to_list() == ['b', 'a', 'c']
+
+
+def test_exists(tmp_path):
+    (tmp_path / 'inputs').mkdir()
+    (tmp_path / 'inputs' / 'present.nii').write_text('')
+    # annexed files without content are broken symlinks
+    (tmp_path / 'inputs' / 'annexed.nii').symlink_to('missing-object')
+    values = pd.Series(['inputs/present.nii', 'inputs/annexed.nii', 'inputs/missing.nii'], dtype=str)
+    assert call_exists(values, str(tmp_path)).to_list() == ['inputs/present.nii', 'inputs/annexed.nii', None]
+
+
+PARTICIPANTS = [
+    ('participant_id', 'age', 'group'),
+    ('sub-01', '34', 'patient'),
+    ('sub-02', '8', 'control'),
+    ('sub-03', '51', 'patient'),
+]
+
+
+@pytest.fixture(params=['csv', 'tsv'])
+def participants(request, tmp_path):
+    separator = ',' if request.param == 'csv' else '\t'
+    table_path = tmp_path / f'participants.{request.param}'
+    table_path.write_text(''.join(separator.join(row) + '\n' for row in PARTICIPANTS))
+    return table_path.name
+
+
+def test_table_arguments():
+    assert _table_arguments('participants.tsv age group==patient age>=18 by=participant_id:subject') == (
+        'participants.tsv', 'age', [('group', '==', 'patient'), ('age', '>=', '18')], ('participant_id', 'subject'))
+    with pytest.raises(Exception, match='not a valid filter or key'):
+        _table_arguments('participants.tsv age group~patient')
+
+
+@pytest.mark.parametrize('condition, subjects', [
+    ('group==patient', ['sub-01', 'sub-03']),
+    ('group!=patient', ['sub-02']),
+    # numbers compare as numbers, not as text ('8' > '34')
+    ('age>34', ['sub-03']),
+    ('age>=34', ['sub-01', 'sub-03']),
+    ('age<34', ['sub-02']),
+    ('age<=8', ['sub-02']),
+])
+def test_table_filters(participants, tmp_path, condition, subjects):
+    assert call_table(f'{participants} participant_id {condition}', str(tmp_path), {}).to_list() == subjects
+
+
+def test_table_join_drops_missing_keys(participants, tmp_path):
+    variables = {'subject':series('sub-03', 'sub-04', 'sub-01')}
+    ages = call_table(f'{participants} age by=participant_id:subject', str(tmp_path), variables)
+    assert ages.to_list() == ['51', None, '34']
+
+    # jobs of subjects without a row are left out of the design
+    plan = load_plan(f"subject == <!write>(sub-03 sub-04 sub-01) ; age == <!table>({participants} age by=participant_id:subject)")
+    job_df = pd.concat(iter_job_chunks(FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', read_only=True), evaluate_plan(plan, str(tmp_path)), 3, 0, 'job-{subject}'))
+    assert job_df['job_name'].to_list() == ['job-sub-03', 'job-sub-01']
+
+
+def test_table_join_rejects_duplicated_keys(tmp_path):
+    (tmp_path / 'sessions.csv').write_text('participant_id,session\nsub-01,ses-1\nsub-01,ses-2\n')
+    with pytest.raises(AssertionError, match='duplicated values'):
+        call_table('sessions.csv session by=participant_id:subject', str(tmp_path), {'subject':series('sub-01')})
+
+
+def test_dsl_commands_get_their_arguments(tmp_path):
+    (tmp_path / 'sub-03').mkdir()
+    (tmp_path / 'sub-03' / 'T1w.nii').write_text('')
+    plan = load_plan("subject == <!write>(sub-01 sub-02 sub-03) ; done == <!write>(sub-02) ; todo == <!variable>(subject)<!not_in>(done)<!multiply>(done) ; t1w == <!paste>({todo}/T1w.nii)<!exists>")
+    variables = evaluate_plan(plan, str(tmp_path))
+    assert variables['todo'].to_list() == ['sub-01', 'sub-03']
+    assert variables['t1w'].to_list() == [None, 'sub-03/T1w.nii']
+
+
+def test_plan_cache_ignores_other_formats(tmp_path):
+    definition = "subject == <!write>(sub-01 sub-02)"
+    plan = load_plan(definition, tmp_path)
+    (cache_file,) = tmp_path.iterdir()
+    assert json.loads(cache_file.read_text())['format'] == PLAN_FORMAT
+
+    # a cached plan of another format is compiled again
+    cache_file.write_text(json.dumps({'format':PLAN_FORMAT + 1, 'definition':definition, 'variables':[], 'outputs':[]}))
+    assert load_plan(definition, tmp_path) == plan
+
+
+def test_job_hashes_only_when_asked(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', read_only=True)
+    design_index = fairb.add_design("subject == <!write>(sub-01 sub-02)", 'run {subject}', 'inputs/{subject}', 'outputs/{subject}', False, None, 'message', '/tmp', 1, None, None, None, None, None, job_name='job-{subject}', variables=['subject'])
+    variables = evaluate_plan(load_plan(fairb.designs[design_index]['variable_definition']), str(tmp_path))
+
+    (job_df,) = iter_job_chunks(fairb, variables, 2, design_index, 'job-{subject}')
+    assert job_df['job_name'].to_list() == ['job-sub-01', 'job-sub-02']
+    assert FairB._JOB_HASH_COLUMN not in job_df.columns
+
+    (job_df,) = iter_job_chunks(fairb, variables, 2, design_index, 'job-{subject}', job_hashes=True)
+    assert job_df[FairB._JOB_HASH_COLUMN].nunique() == 2
+
+
+def design(fairb, subjects, dl_cmd, incremental=False):
+    "Design a job per subject as fairb design does, adding them to the job config if incremental."
+    definition = f"subject == <!write>({' '.join(subjects)})"
+    variables = evaluate_plan(load_plan(definition), fairb.absolute_path)
+    if not incremental:
+        fairb.designs = []
+    design_index = fairb.add_design(definition, dl_cmd, 'inputs/{subject}', 'outputs/{subject}', False, None, 'message', '/tmp', 1, None, None, None, None, None, job_name='job-{subject}', variables=['subject'], reuse=incremental)
+    job_chunks = iter_job_chunks(fairb, variables, len(subjects), design_index, 'job-{subject}', job_hashes=incremental)
+    if incremental:
+        return update_job_config(fairb, pd.concat(job_chunks, ignore_index=True))
+    with TableWriter(fairb.job_config_file) as writer:
+        for job_df in job_chunks:
+            writer.write(job_df)
+    fairb.index_job_config()
+
+
+def test_update_job_config_appends_new_jobs(tmp_path, monkeypatch):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', designs=[])
+    design(fairb, ['sub-01', 'sub-02'], 'run {subject}')
+    # the first incremental design adds the job hashes to the job config
+    design(fairb, ['sub-01', 'sub-02', 'sub-03'], 'run {subject}', incremental=True)
+    config = open(fairb.job_config_file, 'rb').read()
+
+    # then new jobs are appended to the csv and its index is extended, not rebuilt
+    monkeypatch.setattr(fairb, 'index_job_config', lambda: pytest.fail("The job index was rebuilt."))
+    design(fairb, ['sub-01', 'sub-02', 'sub-03', 'sub-04'], 'run {subject}', incremental=True)
+    assert open(fairb.job_config_file, 'rb').read().startswith(config)
+    assert fairb.read_job('job-sub-04')['dl_cmd'] == 'run sub-04'
+    assert fairb.read_job('job-sub-01')['dl_cmd'] == 'run sub-01'
+    assert fairb.status_store.read().empty
+
+
+def test_update_job_config_replaces_changed_jobs(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', designs=[])
+    design(fairb, ['sub-01', 'sub-02'], 'run {subject}')
+    fairb.status_store.insert_many([{'job_name':'job-sub-01', 'status':'completed'}, {'job_name':'job-sub-02', 'status':'completed'}])
+
+    design(fairb, ['sub-02'], 'run --fixed {subject}', incremental=True)
+    assert fairb.read_job('job-sub-01')['dl_cmd'] == 'run sub-01'
+    assert fairb.read_job('job-sub-02')['dl_cmd'] == 'run --fixed sub-02'
+    # the changed job is outdated, its earlier rows are kept and it's available again
+    assert fairb.status_store.read()['status'].to_list() == ['completed', 'completed', 'outdated']
+    fairb.job_config_df = None
+    assert fairb.get_available_jobs() == ['job-sub-02']
+
+
+def test_empty_variable_gives_no_jobs(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', read_only=True)
+    variables = {'subject':series('sub-01', 'sub-02'), 'session':series()}
+    job_df = pd.concat(iter_job_chunks(fairb, variables, 2, 0, 'job-{subject}-{session}'))
+    assert job_df.empty
+    assert list(job_df.columns) == FairB._JOB_TABLE_COLUMNS + ['subject', 'session']
@@ -0,0 +1,57 @@
+import subprocess
+
+import pytest
+
+from fairb.utils.file_index import FileIndex, glob_to_regex
+
+
+def git(repo, *args):
+    subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    repo = tmp_path / 'dataset'
+    for path in ['sub-01/anat/sub-01_T1w.nii.gz', 'sub-01/func/sub-01_bold.nii.gz', 'sub-02/anat/sub-02_T1w.nii.gz', 'README']:
+        (repo / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo / path).write_text(path)
+    git(repo, 'init', '-q')
+    git(repo, 'add', '.')
+    git(repo, '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'files')
+    # untracked files aren't part of the index
+    (repo / 'sub-03').mkdir()
+    (repo / 'sub-03' / 'untracked.txt').write_text('')
+    return repo
+
+
+def test_glob_to_regex():
+    assert glob_to_regex('sub-*/anat/*_T1w.nii.gz').match('sub-01/anat/sub-01_T1w.nii.gz')
+    assert not glob_to_regex('sub-*/*.nii.gz').match('sub-01/anat/sub-01_T1w.nii.gz')
+    assert glob_to_regex('**/*.nii.gz').match('sub-01/anat/sub-01_T1w.nii.gz')
+    assert glob_to_regex('sub-0[!1]').match('sub-02')
+    assert not glob_to_regex('sub-0[!1]').match('sub-01')
+
+
+def test_glob(dataset, tmp_path):
+    file_index = FileIndex(dataset, tmp_path / 'file_index')
+    assert file_index.glob('sub-*/anat/*_T1w.nii.gz') == ['sub-01/anat/sub-01_T1w.nii.gz', 'sub-02/anat/sub-02_T1w.nii.gz']
+    assert file_index.glob('sub-*') == ['sub-01', 'sub-02']
+    assert file_index.glob('sub-01/**') == ['sub-01', 'sub-01/anat', 'sub-01/func']
+
+
+def test_exists(dataset, tmp_path):
+    file_index = FileIndex(dataset, tmp_path / 'file_index')
+    assert file_index.exists('README')
+    assert file_index.exists('sub-01/anat/')
+    assert not file_index.exists('sub-03/untracked.txt')
+
+
+def test_tree_listing_is_cached(dataset, tmp_path):
+    FileIndex(dataset, tmp_path / 'file_index').glob('*')
+    assert len(list((tmp_path / 'file_index').glob('*.tree'))) == 1
+    assert FileIndex(dataset, tmp_path / 'file_index').exists('README')
+
+
+def test_not_a_repository(tmp_path):
+    with pytest.raises(ValueError):
+        FileIndex(tmp_path, tmp_path / 'file_index').exists('README')
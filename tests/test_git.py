@@ -0,0 +1,66 @@
+import shutil
+import subprocess
+
+import pytest
+
+from fairb.utils.git import get_mirror, update_mirror
+
+
+def git(repo, *args):
+    return subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, message):
+    (repo / 'README').write_text(message)
+    git(repo, 'add', 'README')
+    git(repo, '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', message)
+    return git(repo, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def source(tmp_path):
+    "A bare repository within a RIA-like store, and a work tree pushing to it."
+    bare = tmp_path / 'store' / 'abc' / 'def-123'
+    bare.mkdir(parents=True)
+    git(bare, 'init', '-q', '--bare')
+    work = tmp_path / 'work'
+    work.mkdir()
+    git(work, 'init', '-q')
+    git(work, 'remote', 'add', 'origin', str(bare))
+    return bare, work
+
+
+def test_mirror_is_created_and_fetched(source, tmp_path):
+    bare, work = source
+    first = commit(work, 'first')
+    git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/main')
+
+    mirror = get_mirror(tmp_path / 'store', 'abcdef-123', tmp_path / 'mirrors')
+    assert mirror == str(tmp_path / 'mirrors' / 'abcdef-123.git')
+    assert git(mirror, 'rev-parse', 'main') == first
+    assert git(mirror, 'config', 'gc.auto') == '0'
+
+    second = commit(work, 'second')
+    git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/main')
+    # fetched at most once every max_age seconds
+    update_mirror(bare, mirror)
+    assert git(mirror, 'rev-parse', 'main') == first
+    update_mirror(bare, mirror, max_age=0)
+    assert git(mirror, 'rev-parse', 'main') == second
+
+
+def test_mirror_failures_warn(source, tmp_path, capsys):
+    bare, work = source
+    first = commit(work, 'first')
+    git(work, 'push', '-q', 'origin', 'HEAD:refs/heads/main')
+
+    assert update_mirror(tmp_path / 'missing', tmp_path / 'mirrors' / 'missing.git') is None
+    assert "couldn't create the mirror" in capsys.readouterr().out
+    assert not (tmp_path / 'mirrors' / 'missing.git').exists()
+
+    mirror = update_mirror(bare, tmp_path / 'mirrors' / 'source.git')
+    shutil.rmtree(bare)
+    # a mirror that can't be fetched is still used as it is
+    assert update_mirror(bare, mirror, max_age=0) == mirror
+    assert "couldn't fetch the mirror" in capsys.readouterr().out
+    assert git(mirror, 'rev-parse', 'main') == first
@@ -0,0 +1,48 @@
+import pytest
+
+from fairb.utils.job_index import StaleJobIndexError, build_job_index, extend_job_index, read_job_record
+
+
+@pytest.fixture
+def job_config(tmp_path):
+    config_file = tmp_path / 'job_config.csv'
+    config_file.write_bytes(b'job_name,design,message\njob-1,0,plain\n"job-2",0,"two\nlines"\njob-3,0,"a ""quoted"" value"\n')
+    return config_file
+
+
+def test_read_job_record(job_config, tmp_path):
+    index_file = tmp_path / 'job_config.idx'
+    build_job_index(job_config, index_file)
+    header = b'job_name,design,message\n'
+    assert read_job_record(job_config, index_file, 'job-1') == header + b'job-1,0,plain\n'
+    assert read_job_record(job_config, index_file, 'job-2') == header + b'"job-2",0,"two\nlines"\n'
+    assert read_job_record(job_config, index_file, 'job-3') == header + b'job-3,0,"a ""quoted"" value"\n'
+    assert read_job_record(job_config, index_file, 'job-4') is None
+
+
+def test_missing_or_stale_index(job_config, tmp_path):
+    index_file = tmp_path / 'job_config.idx'
+    with pytest.raises(StaleJobIndexError):
+        read_job_record(job_config, index_file, 'job-1')
+
+    build_job_index(job_config, index_file)
+    with open(job_config, 'ab') as config:
+        config.write(b'job-4,0,new\n')
+    with pytest.raises(StaleJobIndexError):
+        read_job_record(job_config, index_file, 'job-1')
+
+
+def test_extend_job_index(job_config, tmp_path):
+    index_file = tmp_path / 'job_config.idx'
+    build_job_index(job_config, index_file)
+    offset = job_config.stat().st_size
+    with open(job_config, 'ab') as config:
+        config.write(b'job-4,1,new\n')
+
+    extend_job_index(job_config, index_file, offset)
+    assert read_job_record(job_config, index_file, 'job-4').endswith(b'\njob-4,1,new\n')
+    assert read_job_record(job_config, index_file, 'job-1').endswith(b'\njob-1,0,plain\n')
+
+    # an offset the index doesn't end at means rows it hasn't seen
+    with pytest.raises(StaleJobIndexError):
+        extend_job_index(job_config, index_file, offset)
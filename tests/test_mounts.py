@@ -0,0 +1,50 @@
+import pytest
+
+from fairb.utils import mounts
+from fairb.utils.mounts import MountTable, read_mounts, resolve_locations
+
+
+@pytest.fixture
+def mounts_file(tmp_path):
+    node = tmp_path / 'nodes' / 'node1'
+    (node / 'scratch-alice').mkdir(parents=True)
+    (node / 'scratch-bob').mkdir()
+    (tmp_path / 'nodes' / 'node2').mkdir()
+    mounts_file = tmp_path / 'mounts'
+    mounts_file.write_text(
+        'proc /proc proc rw 0 0\n'
+        f'node1:/export {node} nfs rw 0 0\n'
+        f'/dev/sdb1 {tmp_path}/with\\040space ext4 rw 0 0\n'
+    )
+    mounts.clear_cache()
+    yield mounts_file
+    mounts.clear_cache()
+
+
+def test_read_mounts(mounts_file, tmp_path):
+    table = read_mounts(mounts_file)
+    assert table['/proc'] == ('proc', 'proc')
+    assert table[f'{tmp_path}/with space'] == ('/dev/sdb1', 'ext4')
+
+
+def test_resolve(mounts_file, tmp_path):
+    table = MountTable(mounts_file)
+    nodes = tmp_path / 'nodes'
+    assert table.is_mount(nodes / 'node1')
+    # patterns without {HOST} are only formatted
+    assert table.resolve('/tmp/{USER}', 'node1', 'alice') == ['/tmp/alice']
+    assert table.resolve(f'{nodes}/{{HOST}}', 'node1', 'alice') == [str(nodes / 'node1')]
+    assert table.resolve(f'{nodes}/{{HOST}}/scratch-*', 'node1', 'alice') == [str(nodes / 'node1' / 'scratch-alice'), str(nodes / 'node1' / 'scratch-bob')]
+    assert table.resolve(f'{nodes}/{{HOST}}/scratch-{{USER}}', 'node1', 'alice') == [str(nodes / 'node1' / 'scratch-alice')]
+    # node2 exists but isn't mounted
+    assert table.resolve(f'{nodes}/{{HOST}}/scratch-*', 'node2', 'alice') == []
+
+
+def test_resolve_locations_cache(mounts_file, tmp_path):
+    pattern = f'{tmp_path}/nodes/{{HOST}}'
+    assert resolve_locations([pattern, pattern], 'node1', 'alice', mounts_file=str(mounts_file)) == [str(tmp_path / 'nodes' / 'node1')]
+
+    # within the ttl the mount table isn't read again
+    mounts_file.write_text('')
+    assert resolve_locations([pattern], 'node1', 'alice', mounts_file=str(mounts_file)) == [str(tmp_path / 'nodes' / 'node1')]
+    assert resolve_locations([pattern], 'node1', 'alice', ttl=0, mounts_file=str(mounts_file)) == []
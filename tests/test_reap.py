@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from fairb.core import FairB
+from fairb.scripts import reap
+from fairb.utils.status import SQLiteStatusStore
+
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+def ago(seconds):
+    return (datetime.today() - timedelta(seconds=seconds)).strftime(TIME_FORMAT)
+
+
+@pytest.fixture
+def fairb(tmp_path):
+    return SimpleNamespace(status_store=SQLiteStatusStore(tmp_path / 'job_status.sqlite'), status_lockfile=str(tmp_path / 'status.lock'))
+
+
+def test_stale_jobs_fall_back_to_start(fairb):
+    fairb.status_store.insert_many([
+        {'job_name':'beat-stopped', 'status':'ongoing', 'start':ago(3600), 'heartbeat':ago(1200)},
+        {'job_name':'never-beat', 'status':'ongoing', 'start':ago(1200)},
+        {'job_name':'beating', 'status':'ongoing', 'start':ago(3600), 'heartbeat':ago(60)},
+        {'job_name':'just-started', 'status':'ongoing', 'start':ago(60)},
+        {'job_name':'finished', 'status':'completed', 'start':ago(3600)},
+    ])
+    assert reap.stale_jobs(fairb.status_store, 600)['job_name'].to_list() == ['beat-stopped', 'never-beat']
+
+
+def test_reap_updates_only_the_stale_run(fairb, tmp_path):
+    host = os.uname().nodename
+    local_dir = tmp_path / 'local' / 'a_user'
+    other_dir = tmp_path / 'other' / 'b_user'
+    local_dir.mkdir(parents=True)
+    other_dir.mkdir(parents=True)
+    fairb.status_store.insert_many([
+        {'job_name':'a', 'job_id':'101', 'host':host, 'location':str(tmp_path / 'local'), 'job_dir':str(local_dir), 'status':'ongoing', 'start':ago(3600)},
+        # another run of the same job that's still alive
+        {'job_name':'a', 'job_id':'102', 'host':'other-node', 'location':str(tmp_path / 'other'), 'job_dir':str(tmp_path / 'other' / 'a_user'), 'status':'ongoing', 'start':ago(3600), 'heartbeat':ago(10)},
+        {'job_name':'b', 'job_id':'103', 'host':'other-node', 'location':str(tmp_path / 'other'), 'job_dir':str(other_dir), 'status':'ongoing', 'start':ago(3600)},
+    ])
+
+    assert reap.reap(fairb, 600)['job_id'].to_list() == ['101', '103']
+    status_df = fairb.status_store.read().set_index('job_id')
+    assert status_df['status'].to_dict() == {'101':'lost', '102':'ongoing', '103':'lost'}
+    assert status_df.loc['101', 'traceback'].startswith('No heartbeat since ')
+    # job directories are only removed on their own host
+    assert not local_dir.exists()
+    assert other_dir.exists()
+
+
+def test_reap_refuses_csv_projects(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', status_backend='csv', read_only=True)
+    (tmp_path / 'fairb.json').write_text(json.dumps(fairb._dict()))
+    with pytest.raises(AssertionError, match='sqlite'):
+        reap.main(['-c', str(tmp_path)])
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from fairb.utils.retry import failure_class, retry_at, retry_policy, should_retry
+
+FAILED_AT = '2026/01/01 00:00:00'
+
+
+def test_retry_policy_defaults():
+    assert retry_policy() is None
+    assert retry_policy(3) == {'max_attempts':3, 'retry_on':['no-space', 'lost'], 'backoff':300, 'backoff_factor':2}
+    assert retry_policy(2, ['error'], 10, 1)['retry_on'] == ['error']
+
+
+def test_failure_class():
+    assert failure_class('completed') is None
+    assert failure_class('lost') == 'lost'
+    assert failure_class('error', 'MemoryError') == 'MemoryError'
+    # errors recorded before their type was
+    assert failure_class('error', float('nan')) == 'error'
+
+
+def test_should_retry_matches_failures():
+    now = datetime(2026, 1, 2)
+    policy = retry_policy(3, ['no-space', 'MemoryError'])
+    assert should_retry(policy, 'no-space', 1, FAILED_AT, now)
+    assert should_retry(policy, 'MemoryError', 1, FAILED_AT, now)
+    assert not should_retry(policy, 'lost', 1, FAILED_AT, now)
+    assert not should_retry(policy, 'ValueError', 1, FAILED_AT, now)
+    assert not should_retry(None, 'no-space', 1, FAILED_AT, now)
+    assert not should_retry(policy, None, 1, FAILED_AT, now)
+
+    # 'error' retries any exception, but not no-space or lost jobs
+    policy = retry_policy(3, ['error'])
+    assert should_retry(policy, 'ValueError', 1, FAILED_AT, now)
+    assert not should_retry(policy, 'lost', 1, FAILED_AT, now)
+
+
+def test_should_retry_counts_attempts():
+    now = datetime(2026, 1, 2)
+    policy = retry_policy(3, ['lost'])
+    assert should_retry(policy, 'lost', 2, FAILED_AT, now)
+    assert not should_retry(policy, 'lost', 3, FAILED_AT, now)
+
+
+def test_should_retry_waits_for_backoff():
+    policy = retry_policy(5, ['lost'], backoff=60, backoff_factor=2)
+    assert retry_at(policy, 1, FAILED_AT) == datetime(2026, 1, 1, 0, 1)
+    assert retry_at(policy, 3, FAILED_AT) == datetime(2026, 1, 1, 0, 4)
+    assert not should_retry(policy, 'lost', 3, FAILED_AT, datetime(2026, 1, 1, 0, 3, 59))
+    assert should_retry(policy, 'lost', 3, FAILED_AT, datetime(2026, 1, 1, 0, 4))
+    # rows without a time are retried right away
+    assert should_retry(policy, 'lost', 3, None, datetime(2026, 1, 1))
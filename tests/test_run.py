@@ -0,0 +1,142 @@
+import os
+import sys
+from types import ModuleType, SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from fairb.scripts.run import NoDiskSpaceError, cleanup, expand_inputs, get_job_disk_usage, run_id, run_job, stage_inputs
+from fairb.utils.status import SQLiteStatusStore
+
+
+def write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def test_job_disk_usage_of_missing_dir(tmp_path):
+    assert get_job_disk_usage(None) == 0.0
+    assert get_job_disk_usage(tmp_path / 'missing') == 0.0
+
+
+def test_job_disk_usage_leaves_out_shared_annex_objects(tmp_path):
+    job_dir = tmp_path / 'job'
+    write(job_dir / 'outputs' / 'result.nii.gz', 2**20)
+    baseline = get_job_disk_usage(job_dir)
+    assert baseline >= 2**20 / 2**30
+
+    # an object linked from the node's annex cache isn't the job's
+    cached = write(tmp_path / 'cache' / 'objects' / 'KEY', 4 * 2**20)
+    object_path = job_dir / '.git' / 'annex' / 'objects' / 'xx' / 'yy' / 'KEY' / 'KEY'
+    object_path.parent.mkdir(parents=True)
+    os.link(cached, object_path)
+    assert get_job_disk_usage(job_dir) < baseline + 2**20 / 2**30
+
+    # hardlinks within the job dir count once
+    os.link(job_dir / 'outputs' / 'result.nii.gz', job_dir / 'outputs' / 'copy.nii.gz')
+    assert get_job_disk_usage(job_dir) < baseline + 2**20 / 2**30
+
+    # an object only the job holds is the job's
+    write(object_path.parent.parent / 'OWN' / 'OWN', 4 * 2**20)
+    assert get_job_disk_usage(job_dir) >= baseline + 4 * 2**20 / 2**30
+
+
+def test_cleanup_keeps_linked_objects_read_only(tmp_path):
+    cached = write(tmp_path / 'cache' / 'objects' / 'KEY', 16)
+    cached.chmod(0o444)
+    object_dir = tmp_path / 'job' / '.git' / 'annex' / 'objects' / 'xx' / 'yy' / 'KEY'
+    object_dir.mkdir(parents=True)
+    os.link(cached, object_dir / 'KEY')
+    object_dir.chmod(0o555)
+
+    cleanup(str(tmp_path / 'job'))
+    assert not (tmp_path / 'job').exists()
+    assert cached.stat().st_mode & 0o777 == 0o444
+
+
+def test_run_id(monkeypatch):
+    monkeypatch.setenv('JOB_ID', '1234')
+    monkeypatch.setenv('SGE_TASK_ID', 'undefined')
+    assert run_id().startswith('1234-')
+    monkeypatch.setenv('SGE_TASK_ID', '7')
+    assert run_id().startswith('1234.7-')
+    # jobs run by the same worker get different ids
+    assert run_id() != run_id()
+
+    monkeypatch.delenv('JOB_ID')
+    monkeypatch.delenv('SGE_TASK_ID')
+    assert run_id().startswith(f'{os.getpid()}-')
+
+
+class IncompleteResultsError(Exception):
+    def __init__(self, results=None, failed=None, msg=None):
+        super().__init__(msg)
+        self.failed = failed
+
+
+def fake_datalad(monkeypatch, get):
+    "Make 'import datalad.api' find a module whose get is the given function."
+    modules = {name:ModuleType(name) for name in ['datalad', 'datalad.api', 'datalad.support', 'datalad.support.exceptions']}
+    modules['datalad.api'].get = get
+    modules['datalad.support.exceptions'].IncompleteResultsError = IncompleteResultsError
+    modules['datalad'].api = modules['datalad.api']
+    modules['datalad'].support = modules['datalad.support']
+    modules['datalad.support'].exceptions = modules['datalad.support.exceptions']
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+
+
+def test_expand_inputs(tmp_path):
+    for path in ['inputs/sub-01/anat.nii', 'inputs/sub-02/anat.nii', 'inputs/sub-02/func.nii']:
+        write(tmp_path / path, 1)
+    assert expand_inputs(tmp_path, ['inputs/*/anat.nii', 'inputs/sub-01/anat.nii', 'missing/*.nii', 'code/run.sh']) == [
+        os.path.join('inputs', 'sub-01', 'anat.nii'), os.path.join('inputs', 'sub-02', 'anat.nii'), 'code/run.sh']
+
+
+def test_stage_inputs_skips_missing_inputs(tmp_path, monkeypatch):
+    write(tmp_path / 'inputs' / 'a.nii', 16)
+    calls = []
+
+    def get(paths, **kwargs):
+        calls.append(paths)
+        for path in paths:
+            if os.path.exists(path):
+                yield {'action':'get', 'type':'file', 'status':'ok', 'path':path}
+            else:
+                yield {'action':'get', 'type':'file', 'status':'impossible', 'path':path, 'message':'path does not exist'}
+
+    fake_datalad(monkeypatch, get)
+    staged = stage_inputs(str(tmp_path), ['inputs/a.nii', 'inputs/missing.nii', 'inputs/a.nii'])
+    assert [(path, size) for path, size, _seconds in staged] == [(os.path.join('inputs', 'a.nii'), 16)]
+    # a single get of every path
+    assert calls == [[str(tmp_path / 'inputs' / 'a.nii'), str(tmp_path / 'inputs' / 'missing.nii')]]
+
+    # a missing prereq_get fails the job
+    with pytest.raises(IncompleteResultsError) as error:
+        stage_inputs(str(tmp_path), ['inputs/a.nii', 'inputs/missing.nii'], required=['inputs/missing.nii'])
+    assert [result['path'] for result in error.value.failed] == [str(tmp_path / 'inputs' / 'missing.nii')]
+
+
+def test_run_job_dispatches_submitted_row(tmp_path, monkeypatch):
+    fake_datalad(monkeypatch, get=None)
+    status_store = SQLiteStatusStore(tmp_path / 'job_status.sqlite')
+    status_store.insert(job_name='job', job_id='101', status='submitted')
+    job_config = pd.Series({
+        'inputs':None, 'outputs':None, 'output_datasets':None, 'prereq_get':None, 'is_explicit':False,
+        'dl_cmd':'echo', 'commit':None, 'container':None, 'message':None,
+        'ephemeral_location':'/tmp', 'req_disk_gb':2.0**40,
+        })
+    fairb = SimpleNamespace(
+        job_config_df=None, read_job=lambda job_name: job_config, status_store=status_store,
+        status_lockfile=str(tmp_path / 'status.lock'), push_lockfile=str(tmp_path / 'push.lock'),
+        super_id='super', clone_target='clone', push_target='push',
+        mirror_location=None, annex_cache_gb=None, container_location=None,
+        )
+
+    # /tmp never has an exabyte free, so the job stops right after taking its status rows
+    with pytest.raises(NoDiskSpaceError):
+        run_job(fairb, 'job')
+    status_df = status_store.read()
+    assert status_df['status'].to_list() == ['dispatched', 'no-space']
+    assert status_df['job_id'].iat[0] == '101' and status_df['attempt'].iat[1] == 1
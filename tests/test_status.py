@@ -0,0 +1,114 @@
+import json
+
+import pandas as pd
+import pytest
+
+from fairb.core import FairB, InvalidFairBError
+from fairb.utils.status import JobStatusStore, current_rows, open_status_store
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def status_store(request, tmp_path):
+    status_store = open_status_store(request.param, tmp_path / f'job_status.{request.param}')
+    status_store.create()
+    yield status_store
+    if request.param == 'sqlite':
+        status_store.close()
+
+
+ROWS = [
+    {'job_name':'a', 'status':'completed'},
+    {'job_name':'a', 'status':'outdated'},
+    {'job_name':'b', 'status':'error'},
+    {'job_name':'c', 'status':'completed'},
+    {'job_name':'c', 'status':'outdated'},
+    {'job_name':'c', 'status':'submitted'},
+    {'job_name':'b', 'status':'ongoing'},
+]
+
+
+def test_job_status_store_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        JobStatusStore(tmp_path / 'job_status')
+
+
+def test_job_names(status_store):
+    for job_name, status in [('a', 'completed'), ('b', 'error'), ('c', 'submitted'), ('b', 'ongoing')]:
+        status_store.insert(job_name=job_name, status=status)
+    assert status_store.job_names(['running']) == []
+    assert sorted(status_store.job_names(['error', 'ongoing'])) == ['b']
+    assert sorted(status_store.job_names(['submitted', 'error'])) == ['b', 'c']
+
+
+def test_current_rows_drop_outdated_attempts():
+    status_df = pd.DataFrame(ROWS)
+    assert current_rows(status_df).to_dict(orient='records') == [
+        {'job_name':'b', 'status':'error'},
+        {'job_name':'c', 'status':'submitted'},
+        {'job_name':'b', 'status':'ongoing'},
+    ]
+
+
+def test_current_rows_keep_index():
+    status_df = pd.DataFrame(ROWS, index=range(10, 17))
+    assert current_rows(status_df).index.to_list() == [12, 15, 16]
+
+
+def test_job_names_ignore_outdated_rows(status_store):
+    status_store.insert_many(ROWS)
+    assert status_store.job_names(['completed']) == []
+    assert sorted(status_store.job_names(['submitted', 'error'])) == ['b', 'c']
+
+
+def test_find_and_update(status_store):
+    status_store.insert(job_name='a', status='submitted', job_id='1')
+    status_store.insert(job_name='b', status='submitted')
+    status_store.update({'job_name':'a', 'status':'submitted'}, status='ongoing', host='node1')
+    assert status_store.find(status='ongoing')['job_name'].to_list() == ['a']
+    assert status_store.find(job_id=None)['job_name'].to_list() == ['b']
+
+
+def test_sqlite_uses_rollback_journal(tmp_path):
+    status_store = open_status_store('sqlite', tmp_path / 'job_status.sqlite')
+    status_store.insert(job_name='a', status='ongoing')
+    assert status_store._connect().execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    status_store.close()
+    assert not (tmp_path / 'job_status.sqlite-wal').exists()
+
+
+def test_text_columns_round_trip(status_store):
+    status_store.insert(job_name='1266', job_id='6297.10', host='node01', location='/tmp', job_dir='/tmp/1266', status='ongoing', req_disk_gb=1.5, attempt=1)
+    status_store.insert(job_name='7', job_id='1266', status='submitted')
+    status_store.update({'job_id':'1266'}, status='lost')
+    status_df = status_store.read()
+    assert status_df['job_name'].to_list() == ['1266', '7']
+    assert status_df['job_id'].to_list() == ['6297.10', '1266']
+    assert status_df.loc[0, 'job_dir'] == '/tmp/1266'
+    assert status_df.loc[0, 'req_disk_gb'] == 1.5
+    assert status_store.find(job_id='6297.10')['job_name'].to_list() == ['1266']
+    assert status_store.job_names(['lost']) == ['7']
+
+
+def test_completed_job_branches_of_latest_run(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', status_backend='sqlite', read_only=True)
+    fairb.job_config_df = pd.DataFrame({'job_name':['a', 'b', 'c'], 'batch':['0001'] * 3})
+    for job_name, job_id, status in [('a', '101-aaaa', 'completed'), ('a', None, 'outdated'), ('b', '102-bbbb', 'completed'), ('c', '103-cccc', 'error'), ('a', '104-dddd', 'completed')]:
+        fairb.status_store.insert(job_name=job_name, job_id=job_id, status=status)
+    assert fairb.get_completed_job_branches() == {'a':'a-104-dddd', 'b':'b-102-bbbb'}
+
+
+def test_submitted_job_is_available_to_its_run(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', status_backend='sqlite', read_only=True)
+    for job_name, status in [('a', 'submitted'), ('b', 'submitted'), ('b', 'ongoing'), ('c', 'lost')]:
+        fairb.status_store.insert(job_name=job_name, status=status)
+    assert [fairb.is_job_available(job_name) for job_name in 'abcd'] == [False, False, True, True]
+    # a worker already runs b
+    assert [fairb.is_job_available(job_name, submitted=True) for job_name in 'abcd'] == [True, False, True, True]
+
+
+def test_from_json_rejects_unknown_backend(tmp_path):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push')
+    fairb_json = tmp_path / 'fairb.json'
+    fairb_json.write_text(json.dumps({**fairb._dict(), 'status_backend':'redis'}))
+    with pytest.raises(InvalidFairBError):
+        FairB.from_json(fairb_json)
@@ -0,0 +1,223 @@
+import itertools
+import subprocess
+from datetime import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from fairb.scripts import submit
+from fairb.utils.capacity import CapacityModel
+from fairb.utils.status import SQLiteStatusStore
+
+
+def fake_qsub(monkeypatch, outcomes):
+    "Make subprocess.run return (or raise) the outcomes in order, counting the calls."
+    calls = []
+
+    def run(cmd, **kwargs):
+        outcome = outcomes[len(calls)]
+        calls.append(cmd)
+        if isinstance(outcome, Exception):
+            raise outcome
+        returncode, stdout, stderr = outcome
+        return SimpleNamespace(returncode=returncode, stdout=stdout, stderr=stderr)
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    monkeypatch.setattr(submit.time, 'sleep', lambda seconds: None)
+    return calls
+
+
+def test_qsub_command_defaults():
+    cmd = submit.qsub_command('all.q', None, None, None, None, 'job.sh')
+    assert cmd[:6] == ['qsub', '-q', 'all.q', '-pe', 'smp', '1']
+    assert 'h_rt=24:00:00' in cmd and cmd[-1] == 'job.sh'
+    assert submit.qsub_command('all.q', 0, None, None, None, 'job.sh')[5] == '1'
+
+
+def test_sendjob_parses_job_id(monkeypatch):
+    calls = fake_qsub(monkeypatch, [(0, 'Your job 1234 ("job") has been submitted\n', '')])
+    result = submit.sendjob(['qsub', 'job.sh'])
+    assert result['queued'] and result['job_id'] == '1234'
+    assert result['attempts'] == 1 and result['error'] is None
+    assert len(calls) == 1
+
+
+def test_sendjob_parses_array_job_id(monkeypatch):
+    fake_qsub(monkeypatch, [(0, 'Your job-array 99.1-3:1 ("job") has been submitted\n', '')])
+    assert submit.sendjob(['qsub', '-t', '1-3', 'job.sh'])['job_id'] == '99'
+
+
+def test_sendjob_retries_failures(monkeypatch):
+    calls = fake_qsub(monkeypatch, [(1, '', 'too many jobs'), OSError('no qsub'), (0, 'Your job 7 ("job") has been submitted', '')])
+    result = submit.sendjob(['qsub', 'job.sh'], retries=3)
+    assert result['queued'] and result['job_id'] == '7'
+    assert result['attempts'] == 3 and len(calls) == 3
+
+
+def test_sendjob_gives_up_after_retries(monkeypatch):
+    calls = fake_qsub(monkeypatch, [(1, '', 'too many jobs')] * 3)
+    result = submit.sendjob(['qsub', 'job.sh'], retries=2)
+    assert not result['queued'] and result['job_id'] is None
+    assert result['error'] == 'too many jobs'
+    assert len(calls) == 3
+
+
+def test_sendjob_never_resubmits_queued_job(monkeypatch):
+    calls = fake_qsub(monkeypatch, [(0, 'queued somewhere', ''), (0, 'Your job 8 ("job") has been submitted', '')])
+    result = submit.sendjob(['qsub', 'job.sh'], retries=3)
+    assert result['queued'] and result['job_id'] is None
+    assert 'queued somewhere' in result['error']
+    assert len(calls) == 1
+
+
+def test_set_submitted_keeps_jobs_without_job_id(tmp_path):
+    rows = []
+
+    class Store:
+        def insert_many(self, new_rows):
+            rows.extend(new_rows)
+
+    results = [
+        {'queued':True, 'job_id':None, 'error':'no id', 'job_names':['a'], 'is_array':False, 'submitted':'2026/01/01 00:00:00'},
+        {'queued':False, 'job_id':None, 'error':'failed', 'job_names':['b'], 'is_array':False, 'submitted':'2026/01/01 00:00:00'},
+    ]
+    submit.set_submitted(Store(), results, str(tmp_path / 'status.lock'))
+    assert [(row['job_name'], row['job_id']) for row in rows] == [('a', None)]
+
+
+def submitted_store(tmp_path, job_ids):
+    "A status store with a submitted row per job id, named after it ('job-<id>')."
+    status_store = SQLiteStatusStore(tmp_path / 'job_status.sqlite')
+    status_store.insert_many([{'job_name':f'job-{job_id}', 'job_id':job_id, 'status':'submitted'} for job_id in job_ids])
+    return status_store
+
+
+def test_reconcile_submissions_marks_unqueued_jobs_lost(tmp_path):
+    status_store = submitted_store(tmp_path, ['101', '102.3', '103', None])
+    queue_command = "printf ' 101 0.5 job user r\n 102 0.5 job user qw\n'"
+    assert submit.reconcile_submissions(status_store, queue_command, str(tmp_path / 'status.lock')) == ['job-103']
+    # array tasks are looked up by their job id, and jobs without a job id are skipped
+    assert status_store.find(status='submitted')['job_name'].to_list() == ['job-101', 'job-102.3', 'job-None']
+    assert status_store.find(status='lost')['job_name'].to_list() == ['job-103']
+
+
+def test_reconcile_submissions_keeps_jobs_dispatched_meanwhile(tmp_path, monkeypatch):
+    status_store = submitted_store(tmp_path, ['101', '102'])
+
+    def run(cmd, **kwargs):
+        # job-102 starts running after the queue was listed
+        status_store.update({'job_name':'job-102', 'status':'submitted'}, status='dispatched')
+        return SimpleNamespace(returncode=0, stdout='101 0.5 job user r\n', stderr='')
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    submit.reconcile_submissions(status_store, 'qstat', str(tmp_path / 'status.lock'))
+    assert status_store.find(job_name='job-102')['status'].to_list() == ['dispatched']
+    assert status_store.find(status='lost').empty
+
+
+def test_reconcile_submissions_keeps_jobs_if_queue_unknown(tmp_path):
+    status_store = submitted_store(tmp_path, ['101'])
+    assert submit.reconcile_submissions(status_store, 'false', str(tmp_path / 'status.lock')) == []
+    assert submit.reconcile_submissions(status_store, 'no-such-queue-command', str(tmp_path / 'status.lock')) == []
+    assert status_store.find(status='submitted')['job_name'].to_list() == ['job-101']
+
+
+def test_write_task_manifest_never_overwrites(tmp_path):
+    manifest_path = submit.write_task_manifest(['a', 'b'], tmp_path, 'array-1-0', job_root=tmp_path)
+    assert open(manifest_path).read() == 'a\nb\n'
+    with pytest.raises(FileExistsError):
+        submit.write_task_manifest(['c'], tmp_path, 'array-1-0', job_root=tmp_path)
+    assert open(manifest_path).read() == 'a\nb\n'
+
+
+def follow_project(monkeypatch, tmp_path, req_disk_gb, probes=(), landings={}):
+    """
+    A project of jobs with the given req_disk_gb, available until they have a
+    status row, and a scheduler that runs the submitted jobs on every poll,
+    landing them with their status in landings (completed by default).
+    Return the project and the qsub calls.
+    """
+    status_store = SQLiteStatusStore(tmp_path / 'job_status.sqlite')
+    config_df = pd.DataFrame([
+        {'job_name':job_name, 'queue':'all.q', 'slots':1, 'vmem':None, 'h_rt':None, 'env_vars':None, 'req_disk_gb':disk_gb, 'ephemeral_location':None}
+        for job_name, disk_gb in req_disk_gb.items()
+        ])
+    project = SimpleNamespace(
+        status_store=status_store,
+        status_lockfile=str(tmp_path / 'status.lock'),
+        get_available_jobs=lambda: [job for job in config_df['job_name'] if job not in set(status_store.read()['job_name'])],
+        )
+    monkeypatch.setattr(submit, 'render_jobs', lambda fairb_project, jobs: config_df.query("job_name.isin(@jobs)"))
+    monkeypatch.setattr(submit, 'capacity_model', lambda fairb_project, max_age, probe_local=False: CapacityModel(probes, status_store.find(status='ongoing'), status_store.find(status='submitted')))
+
+    calls = []
+    job_ids = itertools.count(1)
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        return SimpleNamespace(returncode=0, stdout=f'Your job {next(job_ids)} ("job") has been submitted', stderr='')
+
+    polls = itertools.count()
+
+    def sleep(seconds):
+        assert next(polls) < 10, "follow didn't stop"
+        now = datetime.today().strftime("%Y/%m/%d %H:%M:%S")
+        for job_name in status_store.find(status='submitted')['job_name']:
+            status_store.update({'job_name':job_name, 'status':'submitted'}, status='dispatched')
+            status_store.insert(job_name=job_name, status=landings.get(job_name, 'completed'), start=now, update=now)
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    monkeypatch.setattr(submit.time, 'sleep', sleep)
+    return project, calls
+
+
+def follow_args(**args):
+    defaults = {'queue_command':'', 'max_inflight':1, 'max_per_host':None, 'max_per_location':None, 'poll':0,
+                'place':False, 'probe_max_age':None, 'probe_local':False, 'max_concurrent':1, 'retries':0, 'backoff':0}
+    return SimpleNamespace(**{**defaults, **args})
+
+
+def probe(host, tmp_gb):
+    return {'host':host, 'probed':'2026/01/01 00:00:00', 'locations':[{'pattern':'/tmp', 'location':'/tmp', 'free_gb':tmp_gb}]}
+
+
+def test_follow_skips_held_jobs(monkeypatch, tmp_path):
+    project, calls = follow_project(monkeypatch, tmp_path, {'a':100, 'b':1, 'c':1}, probes=[probe('node1', 10)])
+    submit.follow(project, ['a', 'b', 'c'], tmp_path, follow_args(place=True))
+    # a fits nowhere, so b and c take its place in the window, then follow stops
+    assert [cmd[-1].split('/')[-1] for cmd in calls] == ['b.sh', 'c.sh']
+    assert all('hostname=node1' in cmd for cmd in calls)
+    assert list(project.status_store.find(status='completed')['job_name']) == ['b', 'c']
+
+
+def test_busy_hosts():
+    ongoing_df = pd.DataFrame({'host':['node1', 'node1', 'node2', 'node3'], 'location':['/tmp', '/scratch', '/tmp', '/tmp']})
+    assert submit.busy_hosts(ongoing_df) == []
+    assert submit.busy_hosts(ongoing_df, max_per_host=2) == ['node1']
+    assert submit.busy_hosts(ongoing_df, max_per_location=1) == ['node1', 'node2', 'node3']
+    assert submit.busy_hosts(ongoing_df, max_per_location=2) == []
+    assert submit.busy_hosts(ongoing_df.iloc[:0], max_per_host=1, max_per_location=1) == []
+
+
+def test_follow_frees_slots_of_failed_jobs(monkeypatch, tmp_path):
+    project, calls = follow_project(monkeypatch, tmp_path, {'a':1, 'b':1, 'c':1}, landings={'a':'error', 'b':'no-space'})
+    submit.follow(project, ['a', 'b', 'c'], tmp_path, follow_args(max_inflight=1))
+    # one job in flight at a time, the next one sent once the last one landed
+    assert [cmd[-1].split('/')[-1] for cmd in calls] == ['a.sh', 'b.sh', 'c.sh']
+    status_df = project.status_store.read().query("status != 'submitted' and status != 'dispatched'")
+    assert dict(zip(status_df['job_name'], status_df['status'])) == {'a':'error', 'b':'no-space', 'c':'completed'}
+
+
+def test_follow_avoids_busy_hosts(monkeypatch, tmp_path):
+    project, calls = follow_project(monkeypatch, tmp_path, {'a':1, 'b':1})
+    for job_name, host in [('old-1', 'node1'), ('old-2', 'node1'), ('old-3', 'node2')]:
+        project.status_store.insert(job_name=job_name, status='ongoing', host=host, location='/tmp')
+    submit.follow(project, ['a', 'b'], tmp_path, follow_args(max_inflight=2, max_per_host=2))
+    assert len(calls) == 2 and all('hostname=!(node1)' in cmd for cmd in calls)
+
+    (tmp_path / 'location').mkdir()
+    project, calls = follow_project(monkeypatch, tmp_path / 'location', {'c':1})
+    project.status_store.insert(job_name='old-1', status='ongoing', host='node2', location='/tmp')
+    submit.follow(project, ['c'], tmp_path, follow_args(max_per_location=1))
+    assert 'hostname=!(node2)' in calls[0]
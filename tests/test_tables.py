@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+from fairb.core import FairB
+from fairb.scripts import convert
+from fairb.utils.tables import TableWriter, read_table, read_table_columns, write_table
+
+JOBS = pd.DataFrame({
+    'job_name':['job-1', 'job-2', 'job-3'],
+    'design':['0', '0', '1'],
+    'batch':['0001', '0001', '0002'],
+    'age':['8', '34', None],
+})
+
+
+@pytest.fixture(params=['csv', 'feather', 'parquet'])
+def table_path(request, tmp_path):
+    if request.param != 'csv':
+        pytest.importorskip('pyarrow')
+    return tmp_path / f'job_config.{request.param}'
+
+
+def test_round_trip(table_path):
+    write_table(JOBS, table_path)
+    assert read_table_columns(table_path) == list(JOBS.columns)
+    table_df = read_table(table_path, dtype=str)
+    assert table_df.astype(object).where(table_df.notna(), None).to_dict(orient='list') == JOBS.astype(object).where(JOBS.notna(), None).to_dict(orient='list')
+
+
+def test_read_columns_and_filters(table_path):
+    write_table(JOBS, table_path)
+    assert read_table(table_path, columns=['job_name'], dtype=str, equals={'batch':'0001'})['job_name'].to_list() == ['job-1', 'job-2']
+    assert read_table(table_path, columns=['job_name'], dtype=str, filters=[('design', '!=', '0')])['job_name'].to_list() == ['job-3']
+
+
+def test_text_filters_compare_numbers(tmp_path):
+    write_table(JOBS, tmp_path / 'jobs.csv')
+    # '8' < '34' as text, but not as numbers
+    assert read_table(tmp_path / 'jobs.csv', columns=['job_name'], dtype=str, filters=[('age', '>', '10')])['job_name'].to_list() == ['job-2']
+    with pytest.raises(ValueError):
+        read_table(tmp_path / 'jobs.csv', filters=[('age', '~', '10')])
+
+
+def test_table_writer_chunks(table_path):
+    with TableWriter(table_path) as writer:
+        writer.write(JOBS.iloc[:2])
+        writer.write(JOBS.iloc[2:])
+    assert read_table(table_path, dtype=str)['batch'].to_list() == ['0001', '0001', '0002']
+
+
+def test_table_writer_keeps_old_table_on_error(tmp_path):
+    write_table(JOBS, tmp_path / 'jobs.csv')
+    with pytest.raises(RuntimeError):
+        with TableWriter(tmp_path / 'jobs.csv') as writer:
+            writer.write(JOBS.iloc[:1])
+            raise RuntimeError()
+    assert len(read_table(tmp_path / 'jobs.csv')) == 3
+    assert [path.name for path in tmp_path.iterdir()] == ['jobs.csv']
+
+
+def test_convert_job_config(tmp_path):
+    pytest.importorskip('pyarrow')
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', designs=[])
+    write_table(JOBS, fairb.job_config_file)
+    fairb.index_job_config()
+    fairb.to_json()
+
+    convert.main(['-c', str(tmp_path), '--to', 'parquet'])
+    fairb = FairB.from_json(tmp_path / 'fairb.json')
+    assert fairb.table_format == 'parquet' and not (tmp_path / 'job_config.csv').exists()
+    assert not (tmp_path / 'job_config.idx').exists()
+    assert fairb.read_job('job-2')['job_name'] == 'job-2'
+
+    convert.main(['-c', str(tmp_path), '--to', 'csv'])
+    fairb = FairB.from_json(tmp_path / 'fairb.json')
+    fairb.read_job_config()
+    assert fairb.job_config_df['job_name'].to_list() == ['job-1', 'job-2', 'job-3']
+    assert (tmp_path / 'job_config.idx').exists()
+
+
+def test_convert_to_same_format(tmp_path, capsys):
+    fairb = FairB('project', 'super_id', str(tmp_path), [], [], 'container', 'clone', 'push', designs=[])
+    write_table(JOBS, fairb.job_config_file)
+    fairb.to_json()
+
+    convert.main(['-c', str(tmp_path), '--to', 'csv'])
+    assert 'already stored as csv' in capsys.readouterr().out
+    assert read_table(tmp_path / 'job_config.csv', dtype=str).shape == JOBS.shape